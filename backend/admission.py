@@ -0,0 +1,334 @@
+"""
+Admission control: per-client token-bucket rate limits, early rejection of
+oversized request bodies and a weighted fair queue for the render workers
+"""
+import asyncio
+import json
+import math
+import re
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Pattern, Sequence, Tuple
+
+from fastapi import HTTPException
+
+# Set per request by AdmissionMiddleware; the render pool schedules by it
+client_identity: ContextVar[str] = ContextVar("client_identity", default="anonymous")
+
+
+class RateLimitConfigError(ValueError):
+    """Raised for a malformed RATE_LIMITS or FAIR_QUEUE_WEIGHTS value"""
+
+
+def _template_pattern(template: str) -> Pattern:
+    # "/api/export/{fmt}" -> ^/api/export/[^/]+$
+    parts = re.split(r'(\{[^}]+\})', template)
+    return re.compile('^' + ''.join('[^/]+' if part.startswith('{') else re.escape(part) for part in parts) + '$')
+
+
+@dataclass
+class RateRule:
+    method: str
+    template: str
+    rate: float
+    burst: float
+    pattern: Pattern = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.pattern = _template_pattern(self.template)
+
+    def matches(self, method: str, path: str) -> bool:
+        return method == self.method and self.pattern.match(path) is not None
+
+
+def parse_rate_limits(value: str) -> List[RateRule]:
+    """
+    Parse ``"POST /api/generate-docx=2:10; POST /api/export/{fmt}=2:10"``:
+    requests per second and burst size per route template
+    """
+    rules = []
+    for entry in value.split(';'):
+        entry = entry.strip()
+        if not entry:
+            continue
+        route, _, limit = entry.rpartition('=')
+        method, _, template = route.strip().partition(' ')
+        rate, _, burst = limit.partition(':')
+        try:
+            rule = RateRule(method.upper(), template.strip(), float(rate), float(burst or rate))
+        except ValueError:
+            raise RateLimitConfigError(f"Invalid rate limit entry: {entry!r}")
+        if not rule.template.startswith('/') or rule.rate <= 0 or rule.burst < 1:
+            raise RateLimitConfigError(f"Invalid rate limit entry: {entry!r}")
+        rules.append(rule)
+    return rules
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    weights = {}
+    for entry in value.split(','):
+        if entry.strip():
+            client, _, weight = entry.partition('=')
+            try:
+                weights[client.strip()] = float(weight)
+            except ValueError:
+                raise RateLimitConfigError(f"Invalid fair queue weight: {entry!r}")
+    return weights
+
+
+class RateLimiter:
+    """
+    Token buckets per (rule, client). Buckets are kept in LRU order and
+    capped at ``max_clients`` so a flood of identities cannot grow memory;
+    an evicted bucket simply starts full again.
+    """
+
+    def __init__(self, rules: List[RateRule], max_clients: int = 10000):
+        self.rules = rules
+        self.max_clients = max_clients
+        # (rule index, client) -> [tokens, last refill time]
+        self._buckets: "OrderedDict[Tuple[int, str], list]" = OrderedDict()
+        self.limited: Dict[str, int] = {}
+
+    def rule_for(self, method: str, path: str) -> Optional[Tuple[int, RateRule]]:
+        for index, rule in enumerate(self.rules):
+            if rule.matches(method, path):
+                return index, rule
+        return None
+
+    def acquire(self, index: int, rule: RateRule, client: str, now: Optional[float] = None) -> float:
+        """
+        Take one token; return 0 on success, else the seconds until one is available
+        """
+        now = time.monotonic() if now is None else now
+        key = (index, client)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [rule.burst, now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(rule.burst, bucket[0] + (now - bucket[1]) * rule.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        route = f"{rule.method} {rule.template}"
+        self.limited[route] = self.limited.get(route, 0) + 1
+        return (1 - bucket[0]) / rule.rate
+
+    def stats(self) -> dict:
+        return {
+            "rules": [{"route": f"{rule.method} {rule.template}", "rate": rule.rate, "burst": rule.burst}
+                      for rule in self.rules],
+            "clients": len(self._buckets),
+            "limited": dict(self.limited),
+        }
+
+
+class FairQueue:
+    """
+    Weighted fair scheduling of ``slots`` concurrent render jobs.
+
+    Each client accumulates virtual runtime, the render time it actually
+    used divided by its weight; a free slot goes to the waiting client with
+    the least. A client returning from idle starts at the current minimum,
+    so it gets no banked credit and the others are not starved. Because
+    jobs are charged what they really cost, one client sending huge texts
+    gets the same share of worker time as one sending many small ones.
+    """
+
+    def __init__(self, slots: int, weights: Optional[Dict[str, float]] = None):
+        self.slots = slots
+        self.weights = weights or {}
+        self._running: Dict[str, int] = {}
+        self._waiting: Dict[str, deque] = {}
+        self._vruntime: Dict[str, float] = {}
+        self._min_vruntime = 0.0
+        self._active = 0
+
+    def _weight(self, client: str) -> float:
+        return self.weights.get(client, 1.0)
+
+    def _grant(self, client: str):
+        self._active += 1
+        self._running[client] = self._running.get(client, 0) + 1
+        self._vruntime[client] = max(self._vruntime.get(client, self._min_vruntime), self._min_vruntime)
+
+    async def acquire(self, client: str):
+        if self._active < self.slots and not self._waiting:
+            self._grant(client)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(client, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as the waiter gave up: hand the slot on
+                self.release(client, 0.0)
+            else:
+                waiters = self._waiting.get(client)
+                if waiters is not None and future in waiters:
+                    waiters.remove(future)
+                    if not waiters:
+                        del self._waiting[client]
+            raise
+
+    def release(self, client: str, elapsed: float):
+        self._active -= 1
+        self._vruntime[client] = self._vruntime.get(client, self._min_vruntime) + elapsed / self._weight(client)
+        self._running[client] -= 1
+        if not self._running[client]:
+            del self._running[client]
+        if not self._waiting:
+            self._forget_idle()
+            return
+        # The waiting client that has used the least weighted time goes next
+        chosen = min(self._waiting, key=lambda name: self._vruntime.get(name, self._min_vruntime))
+        self._min_vruntime = max(self._min_vruntime, self._vruntime.get(chosen, self._min_vruntime))
+        waiters = self._waiting[chosen]
+        future = waiters.popleft()
+        if not waiters:
+            del self._waiting[chosen]
+        self._grant(chosen)
+        future.set_result(None)
+
+    def _forget_idle(self):
+        # Idle clients would be clamped to the minimum anyway, so drop them
+        for client in [name for name in self._vruntime if name not in self._running]:
+            del self._vruntime[client]
+
+    def slot(self, client: str) -> "_FairSlot":
+        return _FairSlot(self, client)
+
+    def stats(self) -> dict:
+        return {
+            "slots": self.slots,
+            "running": self._active,
+            "waiting": sum(len(waiters) for waiters in self._waiting.values()),
+            "waiting_clients": len(self._waiting),
+        }
+
+
+class _FairSlot:
+    def __init__(self, queue: FairQueue, client: str):
+        self.queue = queue
+        self.client = client
+        self.started = 0.0
+
+    async def __aenter__(self):
+        await self.queue.acquire(self.client)
+        self.started = time.perf_counter()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.queue.release(self.client, time.perf_counter() - self.started)
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def _reject(send, status: int, detail: str, headers: Optional[Dict[str, str]] = None):
+    body = json.dumps({"detail": detail}).encode('utf-8')
+    raw_headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode('ascii'))]
+    raw_headers += [(key.lower().encode('latin-1'), value.encode('latin-1')) for key, value in (headers or {}).items()]
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that identifies the client, applies the route's rate
+    limit and caps JSON request bodies, all before the app reads or parses
+    anything. A declared Content-Length over the cap is refused outright; a
+    chunked body is cut off with a 413 as soon as it crosses the cap.
+
+    A body counts as JSON whenever FastAPI would parse it as JSON: no
+    Content-Type, ``application/json`` or any ``+json`` type. Routes in
+    ``raw_body_routes`` ("METHOD /path/{param}") read their body as a stream
+    and are never capped.
+
+    The client is ``client_header`` when set and present (an API key or
+    device id set by a trusted gateway), then the first X-Forwarded-For hop
+    if ``trust_forwarded``, then the peer address.
+    """
+
+    def __init__(self, app, limiter: RateLimiter, max_json_bytes: int = 0,
+                 client_header: str = "", trust_forwarded: bool = False,
+                 raw_body_routes: Sequence[str] = ()):
+        self.app = app
+        self.limiter = limiter
+        self.max_json_bytes = max_json_bytes
+        self.raw_body_routes = [
+            (method.upper(), _template_pattern(template))
+            for method, _, template in (route.strip().partition(' ') for route in raw_body_routes)
+        ]
+        self.client_header = client_header.lower().encode('latin-1')
+        self.trust_forwarded = trust_forwarded
+
+    def identify(self, scope) -> str:
+        if self.client_header:
+            value = _header(scope, self.client_header)
+            if value:
+                return value.strip()
+        if self.trust_forwarded:
+            forwarded = _header(scope, b"x-forwarded-for")
+            if forwarded:
+                return forwarded.split(',')[0].strip()
+        peer = scope.get("client")
+        return peer[0] if peer else "anonymous"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        client = self.identify(scope)
+        client_identity.set(client)
+
+        matched = self.limiter.rule_for(scope["method"], scope["path"])
+        if matched is not None:
+            retry_after = self.limiter.acquire(*matched, client)
+            if retry_after:
+                await _reject(send, 429, "Too many requests", {"Retry-After": str(math.ceil(retry_after))})
+                return
+
+        if self.max_json_bytes and self._parsed_as_json(scope):
+            declared = _header(scope, b"content-length")
+            if declared is not None and declared.isdigit() and int(declared) > self.max_json_bytes:
+                await _reject(send, 413, f"Request body exceeds {self.max_json_bytes} bytes")
+                return
+            receive = self._capped(receive)
+
+        await self.app(scope, receive, send)
+
+    def _parsed_as_json(self, scope) -> bool:
+        content_type = (_header(scope, b"content-type") or "").split(';')[0].strip().lower()
+        if content_type and content_type != "application/json" and not content_type.endswith("+json"):
+            return False
+        return not any(
+            method == scope["method"] and pattern.match(scope["path"])
+            for method, pattern in self.raw_body_routes
+        )
+
+    def _capped(self, receive):
+        received = 0
+
+        async def capped_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_json_bytes:
+                    # Raised inside the app's body read, so it becomes an ordinary 413 response
+                    raise HTTPException(status_code=413, detail=f"Request body exceeds {self.max_json_bytes} bytes")
+            return message
+
+        return capped_receive
@@ -0,0 +1,148 @@
+"""
+Short-lived on-disk store for rendered documents served by GET URL
+"""
+import json
+import os
+import tempfile
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+
+@dataclass
+class Artifact:
+    id: str
+    filename: str
+    media_type: str
+    size: int
+    expires_at: float
+    path: str
+
+
+class ArtifactStore:
+    """
+    Each artifact is a blob plus a JSON sidecar in ``directory``, so every
+    worker process on the host can serve any artifact until it expires.
+    """
+
+    def __init__(self, directory: Optional[str] = None, ttl_seconds: int = 600):
+        self.directory = Path(directory or os.path.join(tempfile.gettempdir(), 'ocr-artifacts'))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+
+    @classmethod
+    def from_env(cls) -> "ArtifactStore":
+        return cls(
+            directory=os.environ.get('ARTIFACT_DIR') or None,
+            ttl_seconds=int(os.environ.get('ARTIFACT_TTL_SECONDS', '600')),
+        )
+
+    def _blob_path(self, artifact_id: str) -> Path:
+        return self.directory / f"{artifact_id}.bin"
+
+    def _meta_path(self, artifact_id: str) -> Path:
+        return self.directory / f"{artifact_id}.json"
+
+    def new_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def save(self, data: bytes, filename: str, media_type: str, artifact_id: Optional[str] = None) -> Artifact:
+        return self.save_chunks([data], filename, media_type, artifact_id)
+
+    def save_chunks(self, chunks: Iterable[bytes], filename: str, media_type: str,
+                    artifact_id: Optional[str] = None) -> Artifact:
+        """
+        Write chunks to a new artifact without holding the whole file in memory
+        """
+        writer = self.open_writer(filename, media_type, artifact_id)
+        try:
+            for chunk in chunks:
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def open_writer(self, filename: str, media_type: str, artifact_id: Optional[str] = None) -> "ArtifactWriter":
+        """
+        Start an artifact whose chunks arrive over time; it is published only by ``commit``
+        """
+        return ArtifactWriter(self, artifact_id or self.new_id(), filename, media_type)
+
+    def get(self, artifact_id: str) -> Optional[Artifact]:
+        # Ids are generated hex strings; anything else cannot name an artifact
+        if not artifact_id.isalnum():
+            return None
+        try:
+            artifact = Artifact(**json.loads(self._meta_path(artifact_id).read_text()))
+        except FileNotFoundError:
+            return None
+        if artifact.expires_at < time.time() or not os.path.exists(artifact.path):
+            self.delete(artifact_id)
+            return None
+        return artifact
+
+    def delete(self, artifact_id: str):
+        self._meta_path(artifact_id).unlink(missing_ok=True)
+        self._blob_path(artifact_id).unlink(missing_ok=True)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        purged = 0
+        for meta_path in self.directory.glob('*.json'):
+            try:
+                expires_at = json.loads(meta_path.read_text())['expires_at']
+            except (FileNotFoundError, ValueError, KeyError):
+                continue
+            if expires_at < now:
+                self.delete(meta_path.stem)
+                purged += 1
+        return purged
+
+
+class ArtifactWriter:
+    """
+    An artifact being written to a temp file, so a half-written blob is never
+    served under its id
+    """
+
+    def __init__(self, store: ArtifactStore, artifact_id: str, filename: str, media_type: str):
+        self.store = store
+        self.artifact_id = artifact_id
+        self.filename = filename
+        self.media_type = media_type
+        self.size = 0
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.directory, suffix='.tmp')
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self) -> Artifact:
+        blob_path = self.store._blob_path(self.artifact_id)
+        try:
+            self._file.close()
+            os.replace(self._tmp_path, blob_path)
+        except BaseException:
+            self.abort()
+            raise
+        artifact = Artifact(
+            id=self.artifact_id,
+            filename=os.path.basename(self.filename) or self.artifact_id,
+            media_type=self.media_type,
+            size=self.size,
+            expires_at=time.time() + self.store.ttl_seconds,
+            path=str(blob_path),
+        )
+        self.store._meta_path(self.artifact_id).write_text(json.dumps(asdict(artifact)))
+        return artifact
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.unlink(self._tmp_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,55 @@
+"""
+Compare the DOCX rendering paths on a synthetic OCR transcript.
+
+Run from the backend directory:
+
+    python -m benchmarks.docx_render --lines 10000
+"""
+import argparse
+import statistics
+import time
+
+from rendering import build_docx, get_template, render_docx, stream_docx
+
+
+def make_transcript(lines: int) -> str:
+    return '\n'.join(
+        f"Line {i}: the quick brown fox jumps over the lazy dog & other <OCR> noise"
+        for i in range(lines)
+    )
+
+
+def measure(fn, text: str, repeat: int) -> float:
+    fn(text)  # warm up
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(text)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    text = make_transcript(args.lines)
+    get_template()
+
+    paths = {
+        'python-docx': build_docx,
+        'template': render_docx,
+        'template-stream': lambda t: b''.join(stream_docx(t)),
+    }
+    results = {name: measure(fn, text, args.repeat) for name, fn in paths.items()}
+
+    baseline = results['python-docx']
+    print(f"{args.lines} lines, median of {args.repeat} runs")
+    for name, ms in results.items():
+        print(f"  {name:<16} {ms:10.1f} ms  {baseline / ms:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,402 @@
+"""
+In-memory stand-in for the parts of motor the benchmarked routes use.
+
+Only what those routes need is implemented: equality and range filters,
+``$or``/``$and``/``$in``, projections, sorts, limits, ``$inc``/``$set``
+updates, upserting bulk writes, and the aggregation stages behind the
+status stats and extraction search (``$group`` with ``$sum`` and
+``$dateTrunc``, ``$text`` matches scored by term counts, ``$lookup`` and
+``$unwind``). Everything stays in plain lists, so benchmark numbers
+measure the app rather than a database.
+"""
+import copy
+import heapq
+import re
+from datetime import datetime
+from operator import itemgetter
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+
+_MISSING = object()
+# Where a $text match keeps its score on a document while a pipeline runs
+_TEXT_SCORE = '$textScore'
+_WORD = re.compile(r"\w+")
+
+
+def _get(doc: dict, path: str):
+    value = doc
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _compare(value, condition) -> bool:
+    if not isinstance(condition, dict) or not any(key.startswith('$') for key in condition):
+        return value is not _MISSING and value == condition
+    for operator, operand in condition.items():
+        if operator == '$in':
+            ok = value in operand
+        elif operator == '$nin':
+            ok = value not in operand
+        elif operator == '$ne':
+            ok = value != operand
+        elif operator == '$exists':
+            ok = (value is not _MISSING) == bool(operand)
+        elif value is _MISSING:
+            ok = False
+        elif operator == '$gt':
+            ok = value > operand
+        elif operator == '$gte':
+            ok = value >= operand
+        elif operator == '$lt':
+            ok = value < operand
+        elif operator == '$lte':
+            ok = value <= operand
+        else:
+            raise NotImplementedError(f"fake_mongo does not support {operator}")
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == '$or':
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$and':
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key.startswith('$'):
+            raise NotImplementedError(f"fake_mongo does not support {key}")
+        elif not _compare(_get(doc, key), condition):
+            return False
+    return True
+
+
+def _sort_value(doc: dict, path: str):
+    value = doc.get(path, _MISSING) if '.' not in path else _get(doc, path)
+    return (1, None) if value is _MISSING else (0, value)
+
+
+def project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {key for key, flag in projection.items() if flag and key != '_id'}
+    if include:
+        result = {key: copy.deepcopy(doc[key]) for key in include if key in doc}
+        if projection.get('_id', 1) and '_id' in doc:
+            result['_id'] = doc['_id']
+        return result
+    return {key: copy.deepcopy(value) for key, value in doc.items() if projection.get(key, 1)}
+
+
+def _apply_update(doc: dict, update: dict):
+    for operator, fields in update.items():
+        for key, value in fields.items():
+            if operator == '$set':
+                doc[key] = value
+            elif operator == '$inc':
+                doc[key] = doc.get(key, 0) + value
+            elif operator == '$setOnInsert':
+                continue
+            else:
+                raise NotImplementedError(f"fake_mongo does not support {operator}")
+
+
+def _evaluate(doc: dict, expression):
+    if isinstance(expression, str) and expression.startswith('$'):
+        value = _get(doc, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, dict):
+        if '$dateTrunc' in expression:
+            return _date_trunc(_evaluate(doc, expression['$dateTrunc']['date']), expression['$dateTrunc']['unit'])
+        if '$meta' in expression:
+            if expression['$meta'] != 'textScore':
+                raise NotImplementedError(f"fake_mongo does not support $meta {expression['$meta']}")
+            return doc.get(_TEXT_SCORE, 0.0)
+        operators = [key for key in expression if key.startswith('$')]
+        if operators:
+            raise NotImplementedError(f"fake_mongo does not support {operators[0]}")
+        return {key: _evaluate(doc, value) for key, value in expression.items()}
+    return expression
+
+
+def _date_trunc(value: datetime, unit: str) -> datetime:
+    if unit == 'minute':
+        return value.replace(second=0, microsecond=0)
+    if unit == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    if unit == 'day':
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise NotImplementedError(f"fake_mongo does not support $dateTrunc unit {unit}")
+
+
+def _text_score(doc: dict, fields: List[str], search: str) -> float:
+    """
+    Occurrences of the search words in the indexed fields, or 0 for no
+    match; a stand-in for Mongo's stemmed, weighted textScore
+    """
+    terms = {word.lower() for word in _WORD.findall(search)}
+    score = 0.0
+    for field in fields:
+        text = _get(doc, field)
+        if isinstance(text, str):
+            score += sum(1 for word in _WORD.findall(text.lower()) if word in terms)
+    return score
+
+
+def _group(docs: List[dict], spec: dict) -> List[dict]:
+    groups: Dict[Any, dict] = {}
+    for doc in docs:
+        key = _evaluate(doc, spec['_id'])
+        hashable = repr(key)
+        if hashable not in groups:
+            groups[hashable] = {'_id': key, **{field: 0 for field in spec if field != '_id'}}
+        group = groups[hashable]
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            if set(accumulator) != {'$sum'}:
+                raise NotImplementedError(f"fake_mongo does not support {', '.join(accumulator)}")
+            group[field] += _evaluate(doc, accumulator['$sum']) or 0
+    return list(groups.values())
+
+
+def _project_stage(doc: dict, spec: dict) -> dict:
+    computed = {key: value for key, value in spec.items() if not isinstance(value, (bool, int))}
+    flags = {key: value for key, value in spec.items() if key not in computed}
+    result = project(doc, flags) if flags else {}
+    result.pop(_TEXT_SCORE, None)
+    for key, expression in computed.items():
+        result[key] = _evaluate(doc, expression)
+    return result
+
+
+class _Result:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeCursor:
+    def __init__(self, docs: List[dict], projection: Optional[dict]):
+        self._docs = docs
+        self._projection = projection
+        self._sort = []
+        self._limit = 0
+
+    def sort(self, key_or_list, direction: int = 1) -> "FakeCursor":
+        self._sort = [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+        return self
+
+    def limit(self, count: int) -> "FakeCursor":
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int) -> "FakeCursor":
+        return self
+
+    def _ordered(self) -> List[dict]:
+        docs = self._docs
+        if not self._sort:
+            return docs[:self._limit] if self._limit else docs
+        directions = {order for _, order in self._sort}
+        if len(directions) == 1:
+            # One direction: a single keyed pass, and only a top-N heap when limited
+            fields = [key for key, _ in self._sort]
+            reverse = directions.pop() < 0
+            select = heapq.nlargest if reverse else heapq.nsmallest
+
+            def ordered(key):
+                return select(self._limit, docs, key=key) if self._limit else sorted(docs, key=key, reverse=reverse)
+
+            # Plain item lookups when every sort field is present, missing-aware keys otherwise
+            try:
+                return ordered(itemgetter(*fields))
+            except (KeyError, TypeError):
+                return ordered(lambda doc: tuple(_sort_value(doc, field) for field in fields))
+        # Mixed directions: stable sorts from the least significant key up
+        docs = list(docs)
+        for field, order in reversed(self._sort):
+            docs.sort(key=lambda doc: _sort_value(doc, field), reverse=order < 0)
+        return docs[:self._limit] if self._limit else docs
+
+    def _selected(self):
+        return (project(doc, self._projection) for doc in self._ordered())
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._selected():
+            yield doc
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        docs = list(self._selected())
+        return docs[:length] if length else docs
+
+
+class FakeCollection:
+    def __init__(self, name: str, database: Optional["FakeDatabase"] = None):
+        self.name = name
+        self.database = database
+        self.docs: List[dict] = []
+        # Fields of the collection's text index, once one is created
+        self.text_fields: List[str] = []
+
+    async def create_index(self, keys, **kwargs) -> str:
+        if not isinstance(keys, str):
+            self.text_fields = [field for field, kind in keys if kind == 'text'] or self.text_fields
+        return "fake_index"
+
+    async def index_information(self) -> dict:
+        return {}
+
+    async def drop_index(self, name: str) -> None:
+        return None
+
+    async def insert_one(self, doc: dict):
+        doc.setdefault('_id', ObjectId())
+        self.docs.append(copy.deepcopy(doc))
+        return _Result(inserted_id=doc['_id'])
+
+    async def insert_many(self, docs: List[dict], ordered: bool = True):
+        for doc in docs:
+            doc.setdefault('_id', ObjectId())
+            self.docs.append(copy.deepcopy(doc))
+        return _Result(inserted_ids=[doc['_id'] for doc in docs])
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None) -> FakeCursor:
+        return FakeCursor([doc for doc in self.docs if matches(doc, query)], projection)
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None):
+        doc = next((doc for doc in self.docs if matches(doc, query)), None)
+        return project(doc, projection) if doc is not None else None
+
+    async def count_documents(self, query: dict) -> int:
+        return sum(1 for doc in self.docs if matches(doc, query))
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        doc = next((doc for doc in self.docs if matches(doc, query)), None)
+        if doc is None:
+            if not upsert:
+                return _Result(matched_count=0, modified_count=0, upserted_id=None)
+            doc = {key: value for key, value in query.items() if not key.startswith('$')}
+            doc['_id'] = ObjectId()
+            _apply_update(doc, update)
+            _apply_update(doc, {'$set': update.get('$setOnInsert', {})})
+            self.docs.append(doc)
+            return _Result(matched_count=0, modified_count=0, upserted_id=doc['_id'])
+        _apply_update(doc, update)
+        return _Result(matched_count=1, modified_count=1, upserted_id=None)
+
+    async def update_many(self, query: dict, update: dict):
+        docs = [doc for doc in self.docs if matches(doc, query)]
+        for doc in docs:
+            _apply_update(doc, update)
+        return _Result(matched_count=len(docs), modified_count=len(docs))
+
+    async def bulk_write(self, requests, ordered: bool = True):
+        for request in requests:
+            # pymongo keeps the operation's arguments on private attributes
+            await self.update_one(request._filter, request._doc, upsert=bool(request._upsert))
+        return _Result(acknowledged=True)
+
+    async def delete_one(self, query: dict):
+        for index, doc in enumerate(self.docs):
+            if matches(doc, query):
+                del self.docs[index]
+                return _Result(deleted_count=1)
+        return _Result(deleted_count=0)
+
+    async def delete_many(self, query: dict):
+        before = len(self.docs)
+        self.docs = [doc for doc in self.docs if not matches(doc, query)]
+        return _Result(deleted_count=before - len(self.docs))
+
+    def _match_stage(self, docs: List[dict], query: dict) -> List[dict]:
+        query = dict(query)
+        text = query.pop('$text', None)
+        if text is not None:
+            if not self.text_fields:
+                raise NotImplementedError("fake_mongo needs a text index for $text")
+            scored = []
+            for doc in docs:
+                score = _text_score(doc, self.text_fields, text['$search'])
+                if score:
+                    scored.append({**doc, _TEXT_SCORE: score})
+            docs = scored
+        return [doc for doc in docs if matches(doc, query)]
+
+    def aggregate(self, pipeline: List[dict]) -> FakeCursor:
+        docs = list(self.docs)
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == '$match':
+                docs = self._match_stage(docs, spec)
+            elif operator == '$project':
+                docs = [_project_stage(doc, spec) for doc in docs]
+            elif operator == '$group':
+                docs = _group(docs, spec)
+            elif operator == '$sort':
+                docs = FakeCursor(docs, None).sort(list(spec.items()))._ordered()
+            elif operator == '$limit':
+                docs = docs[:spec]
+            elif operator == '$lookup':
+                foreign = self.database[spec['from']]
+                joined_docs = []
+                for doc in docs:
+                    joined = [other for other in foreign.docs
+                              if other.get(spec['foreignField']) == _get(doc, spec['localField'])]
+                    for sub in spec.get('pipeline', []):
+                        (sub_operator, sub_spec), = sub.items()
+                        if sub_operator != '$project':
+                            raise NotImplementedError(f"fake_mongo does not support {sub_operator} in $lookup")
+                        joined = [_project_stage(other, sub_spec) for other in joined]
+                    joined_docs.append({**doc, spec['as']: joined})
+                docs = joined_docs
+            elif operator == '$unwind':
+                field = spec[1:]
+                docs = [{**doc, field: item} for doc in docs for item in doc.get(field) or []]
+            else:
+                raise NotImplementedError(f"fake_mongo does not support {operator}")
+        for doc in docs:
+            doc.pop(_TEXT_SCORE, None)
+        return FakeCursor(docs, None)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name, self)
+        return self._collections[name]
+
+    async def create_collection(self, name: str, **options) -> FakeCollection:
+        return self[name]
+
+    async def command(self, command: Any, *args, **kwargs) -> dict:
+        return {"ok": 1.0}
+
+
+class FakeClient:
+    def __init__(self):
+        self._databases: Dict[str, FakeDatabase] = {}
+
+    def __getitem__(self, name: str) -> FakeDatabase:
+        if name not in self._databases:
+            self._databases[name] = FakeDatabase()
+        return self._databases[name]
+
+    def close(self):
+        pass
@@ -0,0 +1,433 @@
+"""
+Drive the API in-process at a fixed concurrency and compare against a baseline.
+
+Requests go straight into the ASGI app (no sockets, no HTTP client) and
+MongoDB is replaced by ``benchmarks.fake_mongo``, so the numbers are the
+app's own: routing, validation, rendering and serialization. Run from the
+backend directory:
+
+    python -m benchmarks.load
+    python -m benchmarks.load --scenarios generate-docx --concurrency 16
+    python -m benchmarks.load --save-baseline
+    python -m benchmarks.load --check
+
+Each metric is the median of ``--repeat`` runs, and the baseline keeps
+how far those runs spread. By default the changes against the baseline
+are printed for information only: timings on a shared or throttled host
+drift between invocations by more than any fixed tolerance.
+
+With ``--check`` the run exits non-zero when a scenario's p95 latency or
+peak RSS grows, or its throughput drops, by more than the larger of
+``--tolerance`` and ``SPREAD_MARGIN`` times the measured spread. Latency
+and throughput changes must also cost at least ``--latency-floor-ms`` per
+request, so sub-millisecond scenarios are not failed by scheduler noise.
+Only use it on a dedicated host that recorded its own baseline; against
+another host's baseline the deltas are always informational.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from benchmarks.fake_mongo import FakeClient
+
+BASELINE_PATH = Path(__file__).with_name('baseline.json')
+# Metrics gated against the baseline, and how many times their run-to-run spread a change must exceed
+GATED_METRICS = ("p95_ms", "rps", "peak_rss_mb")
+SPREAD_MARGIN = 2.0
+
+
+async def asgi_request(app, method: str, path: str, body: bytes = b"") -> Tuple[int, int]:
+    """
+    Send one request through the ASGI app and return (status, response bytes)
+    """
+    path, _, query = path.partition('?')
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode('ascii'),
+        "query_string": query.encode('ascii'),
+        "root_path": "",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode('ascii')),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    finished = asyncio.Event()
+    delivered = False
+    status = 0
+    size = 0
+
+    async def receive():
+        nonlocal delivered
+        if not delivered:
+            delivered = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Streaming responses listen for a disconnect; only send it once they are done
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, size
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                finished.set()
+
+    await app(scope, receive, send)
+    finished.set()
+    return status, size
+
+
+def _rss_of(pid: str) -> int:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def current_rss() -> int:
+    """
+    Resident memory of this process plus its direct children (render workers)
+    """
+    total = _rss_of('self')
+    if not total:
+        # No /proc: fall back to the lifetime peak, which is the best available
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    try:
+        for task in os.listdir('/proc/self/task'):
+            with open(f'/proc/self/task/{task}/children') as f:
+                total += sum(_rss_of(child) for child in f.read().split())
+    except OSError:
+        pass
+    return total
+
+
+class RssSampler:
+    """Tracks peak RSS from a background thread while a scenario runs"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+@dataclass
+class ScenarioResult:
+    requests: int
+    concurrency: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    rps: float
+    peak_rss_mb: float
+
+
+def percentile(sorted_samples: List[float], fraction: float) -> float:
+    # Nearest-rank percentile
+    index = max(int(round(fraction * len(sorted_samples) + 0.5)) - 1, 0)
+    return sorted_samples[min(index, len(sorted_samples) - 1)]
+
+
+RequestFactory = Callable[[int], Tuple[str, str, bytes]]
+
+
+def make_transcript(lines: int, salt: str = "") -> str:
+    return '\n'.join(
+        f"Line {i}: the quick brown fox jumps over the lazy dog & other <OCR> noise {salt}"
+        for i in range(lines)
+    )
+
+
+def build_scenarios(docx_lines: int) -> Dict[str, RequestFactory]:
+    cached_body = json.dumps({"text": make_transcript(docx_lines)}).encode('utf-8')
+    salts = itertools.count()
+
+    def generate_docx(index: int):
+        # Text never seen before, across runs too, so every request renders instead of hitting the cache
+        body = json.dumps({"text": make_transcript(docx_lines, salt=str(next(salts)))}).encode('utf-8')
+        return "POST", "/api/generate-docx", body
+
+    def generate_docx_cached(index: int):
+        return "POST", "/api/generate-docx", cached_body
+
+    def status_post(index: int):
+        return "POST", "/api/status", json.dumps({"client_name": f"bench-{index % 8}"}).encode('utf-8')
+
+    def status_get(index: int):
+        return "GET", "/api/status?limit=100", b""
+
+    return {
+        "generate-docx": generate_docx,
+        "generate-docx-cached": generate_docx_cached,
+        "status-post": status_post,
+        "status-get": status_get,
+    }
+
+
+async def run_scenario(app, factory: RequestFactory, requests: int, concurrency: int) -> ScenarioResult:
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for index in counter:
+            method, path, body = factory(index)
+            started = time.perf_counter()
+            status, _ = await asgi_request(app, method, path, body)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors += 1
+
+    with RssSampler() as sampler:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return ScenarioResult(
+        requests=requests,
+        concurrency=concurrency,
+        errors=errors,
+        p50_ms=round(percentile(latencies, 0.50) * 1000, 2),
+        p95_ms=round(percentile(latencies, 0.95) * 1000, 2),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 2),
+        rps=round(requests / elapsed, 1),
+        peak_rss_mb=round(sampler.peak / (1024 * 1024), 1),
+    )
+
+
+def summarize(runs: List[ScenarioResult]) -> Tuple[ScenarioResult, Dict[str, float]]:
+    """
+    Each metric's median over ``runs``, and its spread: the range of the
+    runs as a fraction of that median
+    """
+    def median(values):
+        values = sorted(values)
+        middle = len(values) // 2
+        return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+    fields = asdict(runs[0])
+    medians = {field: median([getattr(run, field) for run in runs]) for field in fields}
+    medians["errors"] = max(run.errors for run in runs)
+    result = ScenarioResult(**{field: round(value, 2) if isinstance(value, float) else value
+                               for field, value in medians.items()})
+    spread = {}
+    for metric in GATED_METRICS:
+        values = [getattr(run, metric) for run in runs]
+        spread[metric] = round((max(values) - min(values)) / medians[metric], 3) if medians[metric] else 0.0
+    return result, spread
+
+
+def host_fingerprint() -> dict:
+    return {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()}
+
+
+def seed_status_checks(db, count: int):
+    now = datetime.utcnow()
+    db.status_checks.docs.extend(
+        {"id": str(uuid.uuid4()), "client_name": f"bench-{i % 8}", "timestamp": now - timedelta(seconds=count - i)}
+        for i in range(count)
+    )
+
+
+def allowed_change(metric: str, baseline: dict, spread: Dict[str, float], tolerance: float) -> float:
+    """
+    Fractional change ``metric`` may show before it counts: at least
+    ``tolerance``, widened to ``SPREAD_MARGIN`` times the larger of the
+    baseline's and this run's spread
+    """
+    measured = max(baseline.get("spread", {}).get(metric, 0.0), spread.get(metric, 0.0))
+    return max(tolerance, SPREAD_MARGIN * measured)
+
+
+def compare(name: str, result: ScenarioResult, baseline: dict, tolerance: float,
+            latency_floor_ms: float = 0.0, spread: Optional[Dict[str, float]] = None) -> List[str]:
+    """
+    Return the ways ``result`` regressed against its baseline entry.
+
+    A slowdown counts only past both the allowed change (see
+    ``allowed_change``) and ``latency_floor_ms``; throughput is compared as
+    the time each of the concurrent workers spends per request, so the
+    floor applies to it too.
+    """
+    problems = []
+    spread = spread or {}
+    if baseline.get("requests") != result.requests or baseline.get("concurrency") != result.concurrency:
+        print(f"  {name}: baseline was recorded with different settings, not compared")
+        return problems
+    if result.errors > baseline.get("errors", 0):
+        problems.append(f"{name}: {result.errors} errors (baseline {baseline.get('errors', 0)})")
+    allowed = allowed_change("p95_ms", baseline, spread, tolerance)
+    if result.p95_ms > max(baseline["p95_ms"] * (1 + allowed), baseline["p95_ms"] + latency_floor_ms):
+        problems.append(f"{name}: p95 {result.p95_ms} ms vs baseline {baseline['p95_ms']} ms (allowed +{allowed:.0%})")
+    allowed = allowed_change("rps", baseline, spread, tolerance)
+    per_request_ms = result.concurrency * 1000 / result.rps if result.rps else float('inf')
+    baseline_per_request_ms = result.concurrency * 1000 / baseline["rps"]
+    if result.rps < baseline["rps"] * (1 - min(allowed, 0.95)) and \
+            per_request_ms - baseline_per_request_ms > latency_floor_ms:
+        problems.append(f"{name}: {result.rps} req/s vs baseline {baseline['rps']} req/s (allowed -{allowed:.0%})")
+    allowed = allowed_change("peak_rss_mb", baseline, spread, tolerance)
+    if result.peak_rss_mb > baseline["peak_rss_mb"] * (1 + allowed):
+        problems.append(f"{name}: peak RSS {result.peak_rss_mb} MB vs baseline {baseline['peak_rss_mb']} MB "
+                        f"(allowed +{allowed:.0%})")
+    return problems
+
+
+def deltas(name: str, result: ScenarioResult, baseline: dict) -> str:
+    changes = [
+        f"{metric} {(getattr(result, metric) - baseline[metric]) / baseline[metric]:+.0%}"
+        for metric in GATED_METRICS if baseline.get(metric)
+    ]
+    return f"{name}: {', '.join(changes)}"
+
+
+async def main_async(args) -> int:
+    # Every request comes from one client, so per-client rate limits would only measure 429s
+    os.environ.setdefault('RATE_LIMITS', '')
+    # Import late so --help works without the app's environment
+    import server
+
+    fake = FakeClient()
+    server.client = fake
+    server.db = fake[os.environ.get('DB_NAME', 'bench')]
+    seed_status_checks(server.db, args.seed)
+
+    scenarios = build_scenarios(args.docx_lines)
+    names = args.scenarios or list(scenarios)
+    unknown = set(names) - set(scenarios)
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 2
+
+    await server.app.router.startup()
+    results: Dict[str, ScenarioResult] = {}
+    spreads: Dict[str, Dict[str, float]] = {}
+    try:
+        for name in names:
+            # A short warm-up keeps pool start-up and first-request costs out of the numbers
+            await run_scenario(server.app, scenarios[name], min(args.concurrency * 2, args.requests), args.concurrency)
+            runs = [
+                await run_scenario(server.app, scenarios[name], args.requests, args.concurrency)
+                for _ in range(args.repeat)
+            ]
+            # Medians per metric, so one noisy run neither fails nor flatters the check
+            results[name], spreads[name] = summarize(runs)
+    finally:
+        await server.app.router.shutdown()
+
+    print(f"{args.requests} requests per scenario, concurrency {args.concurrency}, median of {args.repeat} runs")
+    print(f"  {'scenario':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'RSS MB':>9}{'errors':>8}"
+          f"  spread p95/rps/RSS")
+    for name, result in results.items():
+        spread = '/'.join(f"{spreads[name][metric]:.0%}" for metric in GATED_METRICS)
+        print(f"  {name:<22}{result.p50_ms:>9}{result.p95_ms:>9}{result.p99_ms:>9}"
+              f"{result.rps:>9}{result.peak_rss_mb:>9}{result.errors:>8}  {spread}")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        stored = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+        stored.setdefault("scenarios", {}).update(
+            {name: {**asdict(result), "spread": spreads[name]} for name, result in results.items()})
+        stored["host"] = host_fingerprint()
+        stored["docx_lines"] = args.docx_lines
+        stored["repeat"] = args.repeat
+        baseline_path.write_text(json.dumps(stored, indent=2) + '\n')
+        print(f"Baseline written to {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path}; run with --save-baseline to record one")
+        return 0
+    stored = json.loads(baseline_path.read_text())
+    if stored.get("docx_lines") != args.docx_lines:
+        print("Baseline was recorded with a different --docx-lines, not compared")
+        return 0
+    if not args.check or stored.get("host") != host_fingerprint():
+        if args.check:
+            # Another machine's numbers say nothing about this change, so they only inform
+            print(f"Baseline was recorded on {stored.get('host')}, not this host; not checked")
+        print("Changes against baseline (information only):")
+        for name, result in results.items():
+            if name in stored.get("scenarios", {}):
+                print(f"  {deltas(name, result, stored['scenarios'][name])}")
+        return 0
+    problems = []
+    for name, result in results.items():
+        if name in stored.get("scenarios", {}):
+            problems.extend(compare(name, result, stored["scenarios"][name], args.tolerance,
+                                    args.latency_floor_ms, spreads[name]))
+    if problems:
+        print("Regressions beyond the allowed change:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    print("Within the allowed change of baseline")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', nargs='*', help="Subset of scenarios to run (default: all)")
+    parser.add_argument('--requests', type=int, default=300, help="Requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="Runs per scenario; each metric's median is reported")
+    parser.add_argument('--docx-lines', type=int, default=500, help="Lines of text per DOCX request")
+    parser.add_argument('--seed', type=int, default=5000, help="Status checks stored before the run")
+    parser.add_argument('--baseline', default=str(BASELINE_PATH))
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true',
+                        help="Fail on regressions against a baseline recorded on this host")
+    parser.add_argument('--tolerance', type=float, default=0.35, help="Allowed regression as a fraction")
+    parser.add_argument('--latency-floor-ms', type=float, default=2.0,
+                        help="Smallest per-request slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+    return asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
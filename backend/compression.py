@@ -0,0 +1,204 @@
+"""
+Response compression negotiated from Accept-Encoding (brotli when the
+optional ``brotli`` package is installed, gzip otherwise)
+"""
+import zlib
+from typing import Optional, Sequence
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/xml",
+    "application/javascript",
+    "image/svg+xml",
+)
+# Already compressed (docx, odt, pdf, zip) or meant to arrive event by event
+EXCLUDED_TYPES = ("text/event-stream",)
+
+
+def _load_brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def accepted_encodings(header: str) -> dict:
+    """
+    Map each coding in an Accept-Encoding header to its q-value
+    """
+    accepted = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.lower()] = quality
+    return accepted
+
+
+def is_compressible(content_type: str) -> bool:
+    content_type = content_type.split(';')[0].strip().lower()
+    if content_type.startswith(EXCLUDED_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES) or content_type.endswith(('+json', '+xml'))
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, brotli, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        out = self._compressor.process(data)
+        return out + self._compressor.flush() if flush else out
+
+    def finish(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing text-like responses of at least
+    ``minimum_size`` bytes. Binary documents, partial content and responses
+    that already carry a Content-Encoding pass through untouched, so their
+    Content-Length and byte ranges stay exact.
+
+    Streaming bodies are buffered only until they reach ``minimum_size``;
+    after that each chunk is compressed as it arrives. Chunks of at least
+    ``minimum_size`` are flushed immediately so progressive responses (PDF
+    pages as NDJSON) still arrive page by page, while small row-sized
+    chunks are left to fill the compressor's window.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4,
+                 encodings: Sequence[str] = ("br", "gzip")):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._brotli = _load_brotli() if "br" in encodings else None
+        self.encodings = [coding for coding in encodings if coding != "br" or self._brotli is not None]
+
+    def choose_encoding(self, accept_encoding: str) -> Optional[str]:
+        accepted = accepted_encodings(accept_encoding)
+        best, best_quality = None, 0.0
+        for coding in self.encodings:
+            quality = accepted.get(coding, accepted.get('*', 0.0))
+            # Ties go to the earlier entry in self.encodings, i.e. the better ratio
+            if quality > best_quality:
+                best, best_quality = coding, quality
+        return best
+
+    def _compressor(self, coding: str):
+        if coding == "br":
+            return _Brotli(self._brotli, self.brotli_quality)
+        return _Gzip(self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode('latin-1')
+                break
+        coding = self.choose_encoding(accept_encoding) if accept_encoding else None
+
+        start = None
+        buffered = []
+        buffered_size = 0
+        compressor = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start, buffered_size, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                names = {name.lower(): value for name, value in headers}
+                content_type = names.get(b"content-type", b"").decode('latin-1')
+                eligible = (
+                    message["status"] not in (204, 206, 304)
+                    and b"content-encoding" not in names
+                    and b"content-range" not in names
+                    and is_compressible(content_type)
+                )
+                if not eligible:
+                    passthrough = True
+                    await send(message)
+                    return
+                # Caches must key compressible responses on what the client accepts
+                headers = [(name, value) for name, value in headers if name.lower() != b"vary"]
+                vary = names.get(b"vary", b"")
+                headers.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+                start = {**message, "headers": headers}
+                if coding is None:
+                    passthrough = True
+                    await send(start)
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                buffered.append(body)
+                buffered_size += len(body)
+                if buffered_size < self.minimum_size:
+                    if more_body:
+                        return
+                    # Too small to be worth it: send as it would have been sent
+                    passthrough = True
+                    await send(start)
+                    await send({"type": "http.response.body", "body": b"".join(buffered), "more_body": False})
+                    return
+                compressor = self._compressor(coding)
+                body = b"".join(buffered)
+                buffered.clear()
+                await send({**start, "headers": self._compressed_headers(start["headers"], coding)})
+
+            if more_body:
+                data = compressor.compress(body, flush=len(body) >= self.minimum_size)
+                if data:
+                    await send({"type": "http.response.body", "body": data, "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": compressor.finish(body), "more_body": False})
+
+        await self.app(scope, receive, compressing_send)
+
+    @staticmethod
+    def _compressed_headers(headers, coding: str):
+        result = []
+        for name, value in headers:
+            lowered = name.lower()
+            if lowered in (b"content-length", b"accept-ranges"):
+                continue
+            if lowered == b"etag" and not value.startswith(b"W/"):
+                # The encoded bytes differ from the identity ones the strong tag names
+                value = b"W/" + value
+            result.append((name, value))
+        result.append((b"content-encoding", coding.encode('ascii')))
+        return result
@@ -0,0 +1,224 @@
+"""
+MongoDB connection settings, client factory and connection pool tracking
+"""
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+COMPRESSORS = ("zstd", "snappy", "zlib")
+
+
+class MongoConfigError(RuntimeError):
+    """Raised when the MongoDB connection settings are missing or invalid"""
+
+
+def _int_setting(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.environ.get(name, '')
+    if value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise MongoConfigError(f"{name} must be an integer, got {value!r}")
+
+
+def _read_preference_setting(name: str, default: str) -> str:
+    value = os.environ.get(name, '') or default
+    if value not in READ_PREFERENCES:
+        raise MongoConfigError(f"{name} must be one of {', '.join(READ_PREFERENCES)}, got {value!r}")
+    return value
+
+
+def _compressors_setting(name: str) -> Tuple[str, ...]:
+    compressors = tuple(item.strip() for item in os.environ.get(name, '').split(',') if item.strip())
+    unknown = set(compressors) - set(COMPRESSORS)
+    if unknown:
+        raise MongoConfigError(f"{name} has unknown compressors: {', '.join(sorted(unknown))}")
+    return compressors
+
+
+def make_read_preference(mode: str, max_staleness_seconds: int = -1):
+    # The primary is never stale, and pymongo refuses a staleness bound for it
+    if mode == "primary":
+        return Primary()
+    return READ_PREFERENCES[mode](max_staleness=max_staleness_seconds)
+
+
+@dataclass(frozen=True)
+class MongoSettings:
+    url: str
+    db_name: str
+    max_pool_size: int = 100
+    min_pool_size: int = 0
+    connect_timeout_ms: int = 10000
+    server_selection_timeout_ms: int = 5000
+    socket_timeout_ms: Optional[int] = None
+    max_idle_time_ms: Optional[int] = None
+    wait_queue_timeout_ms: Optional[int] = None
+    max_connecting: int = 2
+    # Offered to the server in order; it picks the first one it also supports
+    compressors: Tuple[str, ...] = ()
+    zlib_compression_level: Optional[int] = None
+    read_preference: str = "primary"
+    # Used by routes that list or search and can tolerate slightly stale data
+    read_heavy_preference: str = "primary"
+    max_staleness_seconds: int = -1
+
+    @classmethod
+    def from_env(cls) -> "MongoSettings":
+        url = os.environ.get('MONGO_URL', '')
+        db_name = os.environ.get('DB_NAME', '')
+        if not url or not db_name:
+            raise MongoConfigError("MONGO_URL and DB_NAME must both be set")
+        return cls(
+            url=url,
+            db_name=db_name,
+            max_pool_size=_int_setting('MONGO_MAX_POOL_SIZE', 100),
+            min_pool_size=_int_setting('MONGO_MIN_POOL_SIZE', 0),
+            connect_timeout_ms=_int_setting('MONGO_CONNECT_TIMEOUT_MS', 10000),
+            server_selection_timeout_ms=_int_setting('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000),
+            socket_timeout_ms=_int_setting('MONGO_SOCKET_TIMEOUT_MS', None),
+            max_idle_time_ms=_int_setting('MONGO_MAX_IDLE_TIME_MS', None),
+            wait_queue_timeout_ms=_int_setting('MONGO_WAIT_QUEUE_TIMEOUT_MS', None),
+            max_connecting=_int_setting('MONGO_MAX_CONNECTING', 2),
+            compressors=_compressors_setting('MONGO_COMPRESSORS'),
+            zlib_compression_level=_int_setting('MONGO_ZLIB_COMPRESSION_LEVEL', None),
+            read_preference=_read_preference_setting('MONGO_READ_PREFERENCE', 'primary'),
+            read_heavy_preference=_read_preference_setting(
+                'MONGO_READ_HEAVY_PREFERENCE', os.environ.get('MONGO_READ_PREFERENCE', '') or 'primary'),
+            max_staleness_seconds=_int_setting('MONGO_MAX_STALENESS_SECONDS', -1),
+        )
+
+    def client_options(self) -> dict:
+        options = {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "socketTimeoutMS": self.socket_timeout_ms,
+            "maxIdleTimeMS": self.max_idle_time_ms,
+            "waitQueueTimeoutMS": self.wait_queue_timeout_ms,
+            "maxConnecting": self.max_connecting,
+            "compressors": ','.join(self.compressors) or None,
+            "zlibCompressionLevel": self.zlib_compression_level,
+            "read_preference": make_read_preference(self.read_preference, self.max_staleness_seconds),
+        }
+        # Unset options keep pymongo's own defaults
+        return {key: value for key, value in options.items() if value is not None}
+
+
+def create_client(settings: MongoSettings, event_listeners: Sequence = ()):
+    """
+    Build the motor client. It connects lazily in the background, so this
+    does not block on the server being reachable.
+    """
+    # Motor is imported here so importing the app does not pay for it
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    return AsyncIOMotorClient(settings.url, event_listeners=list(event_listeners), **settings.client_options())
+
+
+def read_heavy_database(client, settings: MongoSettings):
+    """
+    The same database as ``client[settings.db_name]``, reading with the
+    read-heavy preference (e.g. from secondaries)
+    """
+    return client.get_database(
+        settings.db_name,
+        read_preference=make_read_preference(settings.read_heavy_preference, settings.max_staleness_seconds),
+    )
+
+
+class PoolState(monitoring.ConnectionPoolListener):
+    """
+    Connection pool listener keeping per-server counts of open, checked-out
+    and waiting connections, so the pool can be sized from real peaks
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools: Dict[str, dict] = {}
+
+    def _pool(self, address) -> dict:
+        key = f"{address[0]}:{address[1]}"
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = {
+                "ready": False,
+                "open": 0,
+                "checked_out": 0,
+                "peak_checked_out": 0,
+                "waiting": 0,
+                "peak_waiting": 0,
+                "checkouts": 0,
+                "checkout_failures": 0,
+            }
+        return pool
+
+    def _update(self, event, **changes):
+        with self._lock:
+            pool = self._pool(event.address)
+            for field, value in changes.items():
+                pool[field] = value(pool[field]) if callable(value) else value
+
+    def pool_created(self, event):
+        self._update(event)
+
+    def pool_ready(self, event):
+        self._update(event, ready=True)
+
+    def pool_cleared(self, event):
+        # Connections are discarded lazily; the closed events bring the counts down
+        self._update(event, ready=False)
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+    def connection_created(self, event):
+        self._update(event, open=lambda n: n + 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event, open=lambda n: max(n - 1, 0))
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["waiting"] += 1
+            pool["peak_waiting"] = max(pool["peak_waiting"], pool["waiting"])
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["waiting"] = max(pool["waiting"] - 1, 0)
+            pool["checkout_failures"] += 1
+
+    def connection_checked_out(self, event):
+        # A peak near maxPoolSize, or any waiting, means the pool is the bottleneck
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["waiting"] = max(pool["waiting"] - 1, 0)
+            pool["checked_out"] += 1
+            pool["checkouts"] += 1
+            pool["peak_checked_out"] = max(pool["peak_checked_out"], pool["checked_out"])
+
+    def connection_checked_in(self, event):
+        self._update(event, checked_out=lambda n: max(n - 1, 0))
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {address: dict(pool) for address, pool in self._pools.items()}
@@ -0,0 +1,161 @@
+"""
+Content-addressed cache for rendered documents
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+
+class DocumentCache:
+    """
+    Two-tier cache of rendered files keyed by a hash of their inputs.
+
+    The memory tier is an LRU bounded by total bytes. When ``disk_dir`` is set,
+    entries are also written there and memory misses fall back to disk, so a
+    worker restart does not throw away every export.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entry_bytes: int = 8 * 1024 * 1024,
+                 disk_dir: Optional[str] = None, disk_max_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_size = sum(p.stat().st_size for p in self.disk_dir.glob('*/*.bin'))
+
+    @classmethod
+    def from_env(cls) -> "DocumentCache":
+        return cls(
+            max_bytes=int(os.environ.get('DOCX_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+            max_entry_bytes=int(os.environ.get('DOCX_CACHE_MAX_ENTRY_BYTES', str(8 * 1024 * 1024))),
+            disk_dir=os.environ.get('DOCX_CACHE_DIR') or None,
+            disk_max_bytes=int(os.environ.get('DOCX_CACHE_DISK_MAX_BYTES', str(1024 * 1024 * 1024))),
+        )
+
+    @staticmethod
+    def key(text: str, **options) -> str:
+        """
+        Hash the text together with every option that changes the rendered bytes
+        """
+        digest = hashlib.sha256()
+        for name in sorted(options):
+            digest.update(f"{name}={options[name]}\0".encode('utf-8'))
+        digest.update(text.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.bin"
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+
+        if self.disk_dir:
+            try:
+                data = self._disk_path(key).read_bytes()
+            except FileNotFoundError:
+                data = None
+            if data is not None:
+                self.disk_hits += 1
+                self._remember(key, data)
+                return data
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_entry_bytes:
+            return
+        self._remember(key, data)
+        if self.disk_dir:
+            self._write_disk(key, data)
+
+    def _remember(self, key: str, data: bytes):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = data
+            self._size += len(data)
+            # Evict least recently used entries until we are back under budget
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _write_disk(self, key: str, data: bytes):
+        path = self._disk_path(key)
+        if path.exists():
+            return
+        path.parent.mkdir(exist_ok=True)
+        # Write to a temp file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._disk_size += len(data)
+            over_budget = self._disk_size > self.disk_max_bytes
+        if over_budget:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        files = sorted(self.disk_dir.glob('*/*.bin'), key=lambda p: p.stat().st_mtime)
+        size = sum(p.stat().st_size for p in files)
+        for path in files:
+            if size <= self.disk_max_bytes * 0.9:
+                break
+            size -= path.stat().st_size
+            path.unlink(missing_ok=True)
+        with self._lock:
+            self._disk_size = size
+
+    async def tee(self, key: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """
+        Pass a chunk stream through, caching the assembled file once it completes
+        """
+        collected = []
+        size = 0
+        try:
+            async for chunk in chunks:
+                if collected is not None:
+                    size += len(chunk)
+                    if size > self.max_entry_bytes:
+                        collected = None
+                    else:
+                        collected.append(chunk)
+                yield chunk
+        finally:
+            # Closing this stream early must close the render behind it too
+            await chunks.aclose()
+        if collected is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.put, key, b"".join(collected))
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "disk_bytes": self._disk_size if self.disk_dir else None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,536 @@
+"""
+Export writers that turn one parsed layout into DOCX, ODT, PDF, HTML,
+Markdown or plain text.
+
+Every writer streams: ``stream`` yields encoded chunks as blocks are written,
+and ``render`` simply joins them for callers that want the whole file.
+"""
+import re
+import zipfile
+import zlib
+from html import escape as html_escape
+from typing import Dict, Iterable, Iterator, List
+from xml.sax.saxutils import escape
+
+from layout import Block, Layout, table_cells
+from rendering import DOCX_MEDIA_TYPE, RenderProgress, _ChunkSink, _INVALID_XML_CHARS, get_template, zip_member
+
+
+class UnknownExportFormat(ValueError):
+    """Raised for a format no writer is registered for"""
+
+
+class UnsupportedExportText(ValueError):
+    """Raised when a writer cannot represent the text without changing it"""
+
+
+def _track(layout: Layout, progress: RenderProgress = None) -> Iterator[Block]:
+    for block in layout.blocks:
+        yield block
+        if progress is not None and block.kind not in ('title', 'page_break'):
+            progress.rendered += 1
+
+
+def _list_item_text(block: Block) -> str:
+    return '  ' * (block.level - 1) + block.marker + ' ' + block.text
+
+
+def _encode_chunks(fragments: Iterable[str], chunk_size: int) -> Iterator[bytes]:
+    buffer = []
+    size = 0
+    for fragment in fragments:
+        buffer.append(fragment)
+        size += len(fragment)
+        if size >= chunk_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+class Exporter:
+    name = ""
+    extension = ""
+    media_type = "application/octet-stream"
+
+    def stream(self, layout: Layout, chunk_size: int = 64 * 1024, progress: RenderProgress = None) -> Iterator[bytes]:
+        raise NotImplementedError
+
+    def render(self, layout: Layout) -> bytes:
+        return b"".join(self.stream(layout))
+
+    def check(self, layout: Layout):
+        """
+        Raise ``UnsupportedExportText`` before writing if some of the text
+        cannot be written faithfully; every format but PDF takes any text
+        """
+
+
+class _TextExporter(Exporter):
+    """Writers whose output is a single text document"""
+
+    def fragments(self, blocks: Iterator[Block]) -> Iterator[str]:
+        raise NotImplementedError
+
+    def stream(self, layout: Layout, chunk_size: int = 64 * 1024, progress: RenderProgress = None) -> Iterator[bytes]:
+        return _encode_chunks(self.fragments(_track(layout, progress)), chunk_size)
+
+
+class TextExporter(_TextExporter):
+    name = "txt"
+    extension = ".txt"
+    media_type = "text/plain; charset=utf-8"
+
+    def fragments(self, blocks):
+        first = True
+        for block in blocks:
+            if block.kind == 'title':
+                continue
+            if block.kind == 'page_break':
+                yield '\n\x0c' if not first else '\x0c'
+                continue
+            text = _list_item_text(block) if block.kind == 'list_item' else block.text
+            yield text if first else '\n' + text
+            first = False
+        yield '\n'
+
+
+_MD_SPECIAL = re.compile(r'([\\`*_\[\]<>|])')
+_MD_LINE_START = re.compile(r'^(\d*)([#>+=-]|(?<=\d)[.)])')
+_MD_ORDERED_MARKER = re.compile(r'^\d{1,3}[.)]$')
+
+
+def _markdown_escape(text: str) -> str:
+    # Leading indentation would turn the line into a code block
+    text = _MD_SPECIAL.sub(r'\\\1', text.lstrip())
+    return _MD_LINE_START.sub(r'\1\\\2', text)
+
+
+class MarkdownExporter(_TextExporter):
+    name = "md"
+    extension = ".md"
+    media_type = "text/markdown; charset=utf-8"
+
+    def fragments(self, blocks):
+        for block in blocks:
+            if block.kind == 'page_break':
+                yield '---\n\n'
+            elif block.kind == 'paragraph':
+                yield _markdown_escape(block.text) + '\n\n'
+            elif block.kind == 'list_item':
+                # Markdown only has bullets and numbers; other markers stay as text after a bullet
+                marker = block.marker if _MD_ORDERED_MARKER.match(block.marker) else '-'
+                text = _markdown_escape(block.text)
+                if block.marker not in ('\u2022', marker):
+                    text = _markdown_escape(block.marker) + ' ' + text
+                yield '    ' * (block.level - 1) + marker + ' ' + text + '\n\n'
+            elif block.kind == 'table':
+                rows = table_cells(block)
+                lines = ['| ' + ' | '.join(_markdown_escape(cell) for cell in cells) + ' |' for cells in rows]
+                lines.insert(1, '|' + ' --- |' * len(rows[0]))
+                yield '\n'.join(lines) + '\n\n'
+            else:
+                yield '#' * block.level + ' ' + _markdown_escape(block.text) + '\n\n'
+
+
+_HTML_HEAD = (
+    '<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{title}</title><style>'
+    'body{{font:11pt/1.4 sans-serif;max-width:48em;margin:2em auto;padding:0 1em}}'
+    'p{{margin:0 0 .4em;white-space:pre-wrap}}'
+    'hr.page-break{{border:0;page-break-after:always}}'
+    'ul.list{{list-style:none;margin:0 0 .4em;padding:0}}ul.list li{{padding-left:1.5em;text-indent:-1.5em}}'
+    'table{{border-collapse:collapse;margin:0 0 .8em}}td{{border:1px solid #999;padding:.2em .5em}}'
+    '</style></head><body>\n'
+)
+
+
+def _html_text(text: str) -> str:
+    return html_escape(_INVALID_XML_CHARS.sub('', text), quote=False)
+
+
+class HtmlExporter(_TextExporter):
+    name = "html"
+    extension = ".html"
+    media_type = "text/html; charset=utf-8"
+
+    def fragments(self, blocks):
+        started = False
+        in_list = False
+        for block in blocks:
+            if not started:
+                title = block.text if block.kind == 'title' else ''
+                yield _HTML_HEAD.format(title=_html_text(title))
+                started = True
+            if in_list != (block.kind == 'list_item'):
+                # Consecutive items share one list; markers are kept as written
+                in_list = not in_list
+                yield '<ul class="list">\n' if in_list else '</ul>\n'
+            if block.kind == 'list_item':
+                margin = f' style="margin-left:{1.5 * (block.level - 1)}em"' if block.level > 1 else ''
+                yield f'<li{margin}>{_html_text(block.marker)} {_html_text(block.text)}</li>\n'
+            elif block.kind == 'table':
+                rows = ''.join('<tr>' + ''.join(f'<td>{_html_text(cell)}</td>' for cell in cells) + '</tr>'
+                               for cells in table_cells(block))
+                yield f'<table>{rows}</table>\n'
+            elif block.kind == 'page_break':
+                yield '<hr class="page-break">\n'
+            elif block.kind == 'paragraph':
+                yield f'<p>{_html_text(block.text)}</p>\n'
+            else:
+                level = min(block.level, 6)
+                yield f'<h{level}>{_html_text(block.text)}</h{level}>\n'
+        if not started:
+            yield _HTML_HEAD.format(title='')
+        if in_list:
+            yield '</ul>\n'
+        yield '</body></html>\n'
+
+
+class DocxExporter(Exporter):
+    name = "docx"
+    extension = ".docx"
+    media_type = DOCX_MEDIA_TYPE
+
+    def stream(self, layout, chunk_size=64 * 1024, progress=None):
+        return get_template().stream_layout(layout, chunk_size, progress)
+
+    def render(self, layout):
+        return get_template().render_layout(layout)
+
+
+_ODT_MEDIA_TYPE = "application/vnd.oasis.opendocument.text"
+_ODF_NAMESPACES = (
+    'xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+    'xmlns:style="urn:oasis:names:tc:opendocument:xmlns:style:1.0" '
+    'xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" '
+    'xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0" '
+    'xmlns:fo="urn:oasis:names:tc:opendocument:xmlns:xsl-fo-compatible:1.0" '
+    'office:version="1.2"'
+)
+_ODT_MANIFEST = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0" manifest:version="1.2">'
+    f'<manifest:file-entry manifest:full-path="/" manifest:version="1.2" manifest:media-type="{_ODT_MEDIA_TYPE}"/>'
+    '<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>'
+    '<manifest:file-entry manifest:full-path="styles.xml" manifest:media-type="text/xml"/>'
+    '</manifest:manifest>'
+)
+_ODT_HEADING_SIZES = (18, 16, 14, 13, 12, 11)
+_ODT_STYLES = (
+    f'<?xml version="1.0" encoding="UTF-8"?><office:document-styles {_ODF_NAMESPACES}><office:styles>'
+    '<style:style style:name="Standard" style:family="paragraph"/>'
+    '<style:style style:name="Extracted_20_Text" style:display-name="Extracted Text" style:family="paragraph" '
+    'style:parent-style-name="Standard"><style:text-properties fo:font-size="11pt"/></style:style>'
+    '<style:style style:name="Heading" style:family="paragraph" style:parent-style-name="Standard">'
+    '<style:paragraph-properties fo:margin-top="0.17in" fo:margin-bottom="0.08in"/>'
+    '<style:text-properties fo:font-weight="bold"/></style:style>'
+    + ''.join(
+        f'<style:style style:name="List_20_Item_20_{level}" style:display-name="List Item {level}" '
+        f'style:family="paragraph" style:parent-style-name="Extracted_20_Text">'
+        f'<style:paragraph-properties fo:margin-left="{0.25 * (level + 1)}in" fo:text-indent="-0.25in"/>'
+        f'</style:style>'
+        for level in (1, 2, 3)
+    )
+    + ''.join(
+        f'<style:style style:name="Heading_20_{level}" style:display-name="Heading {level}" '
+        f'style:family="paragraph" style:parent-style-name="Heading" style:default-outline-level="{level}">'
+        f'<style:text-properties fo:font-size="{size}pt"/></style:style>'
+        for level, size in enumerate(_ODT_HEADING_SIZES, start=1)
+    )
+    + '</office:styles></office:document-styles>'
+)
+_ODT_CONTENT_PREFIX = (
+    f'<?xml version="1.0" encoding="UTF-8"?><office:document-content {_ODF_NAMESPACES}>'
+    '<office:automatic-styles><style:style style:name="PageBreak" style:family="paragraph" '
+    'style:parent-style-name="Extracted_20_Text"><style:paragraph-properties fo:break-before="page"/>'
+    '</style:style></office:automatic-styles><office:body><office:text>'
+)
+_ODT_CONTENT_SUFFIX = '</office:text></office:body></office:document-content>'
+_ODT_BREAKS = re.compile(r'(\t|\r| {2,}|^ )')
+
+
+def _odt_text(text: str) -> str:
+    # ODF collapses whitespace, so tabs, breaks and runs of spaces need elements
+    pieces = []
+    for piece in _ODT_BREAKS.split(_INVALID_XML_CHARS.sub('', text)):
+        if piece == '\t':
+            pieces.append('<text:tab/>')
+        elif piece == '\r':
+            pieces.append('<text:line-break/>')
+        elif piece and not piece.strip():
+            # Leading spaces all need elements; inside a line the first one is kept
+            leading = not pieces
+            count = len(piece) if leading else len(piece) - 1
+            if not leading:
+                pieces.append(' ')
+            pieces.append(f'<text:s text:c="{count}"/>' if count > 1 else '<text:s/>')
+        elif piece:
+            pieces.append(escape(piece))
+    return ''.join(pieces)
+
+
+class OdtExporter(Exporter):
+    name = "odt"
+    extension = ".odt"
+    media_type = _ODT_MEDIA_TYPE
+
+    def _content(self, blocks):
+        yield _ODT_CONTENT_PREFIX
+        for block in blocks:
+            if block.kind == 'page_break':
+                yield '<text:p text:style-name="PageBreak"/>'
+            elif block.kind == 'paragraph':
+                yield f'<text:p text:style-name="Extracted_20_Text">{_odt_text(block.text)}</text:p>'
+            elif block.kind == 'list_item':
+                yield (f'<text:p text:style-name="List_20_Item_20_{min(block.level, 3)}">'
+                       f'{_odt_text(block.marker)}<text:tab/>{_odt_text(block.text)}</text:p>')
+            elif block.kind == 'table':
+                rows = table_cells(block)
+                yield (f'<table:table><table:table-column table:number-columns-repeated="{len(rows[0])}"/>'
+                       + ''.join(
+                           '<table:table-row>' + ''.join(
+                               f'<table:table-cell office:value-type="string"><text:p text:style-name='
+                               f'"Extracted_20_Text">{_odt_text(cell)}</text:p></table:table-cell>'
+                               for cell in cells
+                           ) + '</table:table-row>'
+                           for cells in rows
+                       )
+                       + '</table:table>')
+            else:
+                level = min(block.level, len(_ODT_HEADING_SIZES))
+                yield (f'<text:h text:style-name="Heading_20_{level}" text:outline-level="{level}">'
+                       f'{_odt_text(block.text)}</text:h>')
+        yield _ODT_CONTENT_SUFFIX
+
+    def stream(self, layout, chunk_size=64 * 1024, progress=None):
+        sink = _ChunkSink()
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+            # The mimetype must be the first entry, uncompressed
+            zf.writestr(zip_member('mimetype', zipfile.ZIP_STORED), _ODT_MEDIA_TYPE)
+            zf.writestr(zip_member('META-INF/manifest.xml'), _ODT_MANIFEST)
+            zf.writestr(zip_member('styles.xml'), _ODT_STYLES)
+            yield sink.drain()
+            with zf.open(zip_member('content.xml'), 'w', force_zip64=layout.chars > 1 << 30) as part:
+                for fragment in self._content(_track(layout, progress)):
+                    part.write(fragment.encode('utf-8'))
+                    if sink.pending >= chunk_size:
+                        yield sink.drain()
+        yield sink.drain()
+
+
+# Advance widths (1/1000 em) of printable ASCII in the standard Helvetica faces
+_HELVETICA_WIDTHS = [int(w) for w in (
+    "278 278 355 556 556 889 667 191 333 333 389 584 278 333 278 278 556 556 556 556 556 556 556 556 "
+    "556 556 278 278 584 584 584 556 1015 667 667 722 722 667 611 778 722 278 500 667 556 833 722 778 "
+    "667 778 722 667 611 722 667 944 667 667 611 278 278 278 469 556 333 556 556 500 556 556 278 556 "
+    "556 222 222 500 222 833 556 556 556 556 333 500 278 556 500 722 500 500 500 334 260 334 584"
+).split()]
+_HELVETICA_BOLD_WIDTHS = [int(w) for w in (
+    "278 333 474 556 556 889 722 238 333 333 389 584 278 333 278 278 556 556 556 556 556 556 556 556 "
+    "556 556 333 333 584 584 584 611 975 722 722 722 722 667 611 778 722 278 556 722 611 833 722 778 "
+    "667 778 722 667 611 722 667 944 667 667 611 333 278 333 584 556 333 556 611 556 611 556 333 611 "
+    "611 278 278 556 278 889 611 611 611 611 389 556 333 611 556 778 556 556 500 389 280 389 584"
+).split()]
+
+
+def _width_table(ascii_widths: List[int]) -> Dict[str, int]:
+    return {chr(32 + index): width for index, width in enumerate(ascii_widths)}
+
+
+_PDF_FONTS = {
+    "F1": ("Helvetica", _width_table(_HELVETICA_WIDTHS)),
+    "F2": ("Helvetica-Bold", _width_table(_HELVETICA_BOLD_WIDTHS)),
+}
+_PDF_PAGE_WIDTH, _PDF_PAGE_HEIGHT, _PDF_MARGIN = 612, 792, 72
+# (font, size, leading, space after) for body text and each heading level
+_PDF_BODY = ("F1", 11, 14, 4)
+_PDF_HEADINGS = {1: ("F2", 18, 24, 8), 2: ("F2", 15, 20, 6), 3: ("F2", 13, 17, 4)}
+_PDF_LIST_INDENT = 18
+_PDF_CONTROL = re.compile(r'[\x00-\x1f]')
+
+
+def _pdf_string(text: str) -> bytes:
+    # Base-14 fonts only cover WinAnsi, so PdfExporter.check rejects anything else up front
+    data = text.encode('cp1252')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _wrap(text: str, widths: Dict[str, int], size: float, max_width: float) -> List[str]:
+    """
+    Greedy word wrap by font metrics; words wider than a line are split
+    """
+    limit = max_width * 1000 / size
+    space = widths[' ']
+    lines, current, current_width = [], [], 0
+    for word in text.split(' '):
+        word_width = sum(widths.get(char, 556) for char in word)
+        while word_width > limit:
+            if current:
+                lines.append(' '.join(current))
+                current, current_width = [], 0
+            cut, cut_width = 0, 0
+            while cut < len(word) and cut_width + widths.get(word[cut], 556) <= limit:
+                cut_width += widths.get(word[cut], 556)
+                cut += 1
+            cut = max(cut, 1)
+            lines.append(word[:cut])
+            word = word[cut:]
+            word_width = sum(widths.get(char, 556) for char in word)
+        extra = word_width + (space if current else 0)
+        if current and current_width + extra > limit:
+            lines.append(' '.join(current))
+            current, current_width = [word], word_width
+        else:
+            current.append(word)
+            current_width += extra
+    if current:
+        lines.append(' '.join(current))
+    return lines
+
+
+class PdfExporter(Exporter):
+    """
+    Minimal PDF 1.4 writer using the base-14 Helvetica faces, so no fonts are
+    embedded and pages are written out as soon as they fill up
+    """
+
+    name = "pdf"
+    extension = ".pdf"
+    media_type = "application/pdf"
+
+    def _pages(self, blocks) -> Iterator[List[bytes]]:
+        top = _PDF_PAGE_HEIGHT - _PDF_MARGIN
+        width = _PDF_PAGE_WIDTH - 2 * _PDF_MARGIN
+        ops, y = [], top
+        for block in blocks:
+            if block.kind == 'page_break':
+                if ops:
+                    yield ops
+                    ops, y = [], top
+                continue
+            if block.kind == 'title':
+                # Drawn as a level 1 heading, like Heading1 in the other formats
+                font, size, leading, after = _PDF_HEADINGS[1]
+            elif block.kind == 'heading':
+                font, size, leading, after = _PDF_HEADINGS.get(block.level, _PDF_HEADINGS[3])
+            else:
+                font, size, leading, after = _PDF_BODY
+            left = _PDF_MARGIN
+            if block.kind == 'list_item':
+                left += _PDF_LIST_INDENT * block.level
+                texts = [block.marker + ' ' + block.text]
+            elif block.kind == 'table':
+                # No ruling: each row on its own line with the cells spaced apart
+                texts = block.text.split('\n')
+            else:
+                texts = [block.text]
+            for text in texts:
+                text = _PDF_CONTROL.sub(' ', text.replace('\t', '    '))
+                for line in _wrap(text, _PDF_FONTS[font][1], size, width - (left - _PDF_MARGIN)):
+                    if y - leading < _PDF_MARGIN:
+                        yield ops
+                        ops, y = [], top
+                    y -= leading
+                    ops.append(b'BT /%s %d Tf %d %d Td %s Tj ET' % (
+                        font.encode('ascii'), size, left, y, _pdf_string(line)))
+            y -= after
+        if ops:
+            yield ops
+
+    def check(self, layout):
+        for block in layout.blocks:
+            for text in (block.marker, block.text):
+                try:
+                    text.encode('cp1252')
+                except UnicodeEncodeError as e:
+                    char = e.object[e.start]
+                    raise UnsupportedExportText(
+                        f"PDF export only covers Western European (Windows-1252) text and cannot write "
+                        f"{char!r} (U+{ord(char):04X}); export to DOCX, ODT or HTML instead"
+                    )
+
+    def stream(self, layout, chunk_size=64 * 1024, progress=None):
+        self.check(layout)
+        offsets = {}
+        position = 0
+        buffer = []
+        pending = 0
+
+        def emit(data: bytes):
+            nonlocal position, pending
+            buffer.append(data)
+            position += len(data)
+            pending += len(data)
+
+        def write_object(number: int, body: bytes):
+            offsets[number] = position
+            emit(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+
+        # 1 catalog, 2 page tree (written last, once the pages are known), 3-4 fonts
+        emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        for number, (base_font, _) in enumerate(_PDF_FONTS.values(), start=3):
+            write_object(number, b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>'
+                         % base_font.encode('ascii'))
+        resources = b' '.join(b'/%s %d 0 R' % (name.encode('ascii'), number)
+                              for number, name in enumerate(_PDF_FONTS, start=3))
+
+        kids = []
+        next_number = 5
+        for ops in self._pages(_track(layout, progress)):
+            content = zlib.compress(b'\n'.join(ops), 6)
+            write_object(next_number, b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(content)
+                         + content + b'\nendstream')
+            write_object(next_number + 1, (
+                b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << %s >> >> '
+                b'/Contents %d 0 R >>' % (_PDF_PAGE_WIDTH, _PDF_PAGE_HEIGHT, resources, next_number)
+            ))
+            kids.append(next_number + 1)
+            next_number += 2
+            if pending >= chunk_size:
+                yield b''.join(buffer)
+                buffer.clear()
+                pending = 0
+
+        if not kids:
+            write_object(next_number, (
+                b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] >>' % (_PDF_PAGE_WIDTH, _PDF_PAGE_HEIGHT)
+            ))
+            kids.append(next_number)
+            next_number += 1
+        write_object(2, b'<< /Type /Pages /Kids [%s] /Count %d >>'
+                     % (b' '.join(b'%d 0 R' % kid for kid in kids), len(kids)))
+        write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+        xref_offset = position
+        emit(b'xref\n0 %d\n0000000000 65535 f \n' % next_number)
+        for number in range(1, next_number):
+            emit(b'%010d 00000 n \n' % offsets[number])
+        emit(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (next_number, xref_offset))
+        yield b''.join(buffer)
+
+
+EXPORTERS: Dict[str, Exporter] = {
+    exporter.name: exporter
+    for exporter in (DocxExporter(), OdtExporter(), PdfExporter(), HtmlExporter(), MarkdownExporter(), TextExporter())
+}
+
+
+def get_exporter(fmt: str) -> Exporter:
+    try:
+        return EXPORTERS[fmt.lower()]
+    except KeyError:
+        raise UnknownExportFormat(f"Unknown export format: {fmt}")
+
+
+def render_export(fmt: str, layout: Layout) -> bytes:
+    """
+    Render a whole file; picklable for process pools
+    """
+    return get_exporter(fmt).render(layout)
+
+
+def stream_export(fmt: str, layout: Layout, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Stream a file; picklable for process pools
+    """
+    return get_exporter(fmt).stream(layout, chunk_size)
@@ -0,0 +1,108 @@
+"""
+Storage helpers for the searchable extraction history.
+
+A transcript is kept whole, zlib-compressed, on its ``extractions`` record and
+split into short ``extraction_segments`` that carry the text index. Searches
+only ever touch segments, so a hit never loads the transcript it came from.
+"""
+import re
+import zlib
+from typing import Iterator, List, Optional
+
+# Languages MongoDB's text index can stem, by ISO 639-1 code. Anything else is
+# tokenized with "none": split on whitespace and punctuation, no stemming or stop words.
+TEXT_SEARCH_LANGUAGES = {
+    "da": "danish", "de": "german", "en": "english", "es": "spanish", "fi": "finnish",
+    "fr": "french", "hu": "hungarian", "it": "italian", "nb": "norwegian", "nl": "dutch",
+    "pt": "portuguese", "ro": "romanian", "ru": "russian", "sv": "swedish", "tr": "turkish",
+}
+DEFAULT_LANGUAGE = "english"
+
+SEGMENT_MAX_CHARS = 1000
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_PHRASE = re.compile(r'"([^"]+)"')
+
+
+def normalize_language(language: Optional[str]) -> str:
+    """
+    Map a code or name to a language the text index understands
+    """
+    if not language:
+        return DEFAULT_LANGUAGE
+    language = language.strip().lower()
+    if language in TEXT_SEARCH_LANGUAGES.values() or language == "none":
+        return language
+    return TEXT_SEARCH_LANGUAGES.get(language.split('-')[0].split('_')[0], "none")
+
+
+def compress_text(text: str) -> bytes:
+    return zlib.compress(text.encode('utf-8', 'surrogatepass'), 6)
+
+
+def decompress_text(data: bytes) -> str:
+    return zlib.decompress(data).decode('utf-8', 'surrogatepass')
+
+
+def split_segments(text: str, max_chars: int = SEGMENT_MAX_CHARS) -> Iterator[str]:
+    """
+    Group lines into segments of at most ``max_chars``, breaking overlong
+    lines at whitespace, so snippets stay short and scores stay local
+    """
+    current = []
+    size = 0
+    for line in text.splitlines():
+        while len(line) > max_chars:
+            cut = line.rfind(' ', 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            if current:
+                yield '\n'.join(current)
+                current, size = [], 0
+            yield line[:cut]
+            line = line[cut:].lstrip()
+        if size + len(line) > max_chars and current:
+            yield '\n'.join(current)
+            current, size = [], 0
+        if line.strip() or current:
+            current.append(line)
+            size += len(line) + 1
+    if current and any(line.strip() for line in current):
+        yield '\n'.join(current)
+
+
+def search_terms(query: str) -> List[str]:
+    """
+    Words and phrases a query matches on, ignoring negated terms
+    """
+    phrases = _PHRASE.findall(query)
+    rest = _PHRASE.sub(' ', query)
+    words = [word for word in rest.split() if not word.startswith('-')]
+    terms = [phrase.lower() for phrase in phrases]
+    terms.extend(match.lower() for word in words for match in _WORD.findall(word))
+    return terms
+
+
+def make_snippet(text: str, terms: List[str], width: int = 160) -> str:
+    """
+    Cut ``width`` characters around the first matching term. Terms are matched
+    as word prefixes so stemmed hits ("running" for "run") are still found.
+    """
+    lowered = text.lower()
+    position = -1
+    for term in terms:
+        match = re.search(r"(?<!\w)" + re.escape(term[:max(len(term) - 2, 3)]), lowered)
+        if match and (position < 0 or match.start() < position):
+            position = match.start()
+    if position < 0:
+        position = 0
+
+    start = max(position - width // 3, 0)
+    end = min(start + width, len(text))
+    start = max(end - width, 0)
+    snippet = ' '.join(text[start:end].split())
+    if start > 0:
+        snippet = '…' + snippet
+    if end < len(text):
+        snippet += '…'
+    return snippet
@@ -0,0 +1,449 @@
+"""
+Format-independent layout of extracted text, shared by every export writer
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import FrozenSet, List, NamedTuple, Optional, Sequence, Tuple
+
+# Bump whenever parsing changes, so cached layouts and documents are not reused
+LAYOUT_VERSION = "5"
+
+DEFAULT_TITLE = "Extracted Text"
+
+_ATX_HEADING = re.compile(r'^(#{1,5})\s+(.+?)\s*#*\s*$')
+
+# Line classifier patterns for reflow, compiled once and mapped over every line
+_BULLETS = '-*+\u2022\u00b7\u25aa\u25cf\u25e6\u2023\u2043'
+_LIST_ITEM = re.compile(r'^\s*([' + re.escape(_BULLETS) + r']|\(?\d{1,3}[.)]|\(?[a-z][.)]|\([A-Z]\))\s+(?=\S)')
+# Column gaps: a tab, three or more spaces, or two spaces not following
+# punctuation (typed text often puts two spaces between sentences)
+_COLUMN_GAP = re.compile(r'(?<=\S)(?:\t+ *| {3,}|(?<![.!?:;,]) {2})(?=\S)')
+# Matching cells of neighbouring table rows start or end within this many characters
+_COLUMN_SLACK = 2
+# Cells that may be right aligned instead: amounts, counts and percentages
+_NUMERIC_CELL = re.compile(r'^[-+(]?[$\u20ac\u00a3]?\d[\d.,]*%?\)?$')
+_SENTENCE_END = re.compile(r'[.!?:;]["\')\]\u201d\u2019]*$')
+# Endings that rule a line out as a heading (a trailing colon is fine)
+_CLAUSE_END = re.compile(r'[.,;!?]["\')\]\u201d\u2019]*$')
+_CAPITALIZED_WORD = re.compile(r'\b[A-Z0-9]')
+_WORD = re.compile(r'\b\w{4,}|\b[A-Z]\w*')
+# A line reaching this share of the typical line width was wrapped, not ended
+_FULL_LINE_RATIO = 0.75
+# Below this the lines are too short to tell wrapping from deliberate breaks
+_MIN_WRAP_WIDTH = 40
+_HEADING_MAX_CHARS = 80
+_HEADING_MAX_WORDS = 12
+
+_DIGITS = re.compile(r'\d+')
+# A line is a running header or footer when it opens (or closes) at least
+# this many pages and this share of them
+RUNNING_MIN_PAGES = 3
+RUNNING_MIN_SHARE = 0.6
+RUNNING_MAX_CHARS = 200
+
+
+class Block(NamedTuple):
+    kind: str  # title, heading, paragraph, list_item, table or page_break
+    # Tables hold their rows as written, one per line; split them with table_cells
+    text: str = ""
+    level: int = 0
+    marker: str = ""  # list items: the bullet or number they started with
+
+
+@dataclass(frozen=True)
+class Layout:
+    blocks: Tuple[Block, ...]
+    # Blocks that came from a line of input, for progress reporting
+    paragraphs: int
+    chars: int
+
+
+PAGE_BREAK = Block("page_break")
+
+
+class RunningLines(NamedTuple):
+    # Pieces of text, with None where the page number goes
+    header: Tuple[Optional[str], ...] = ()
+    footer: Tuple[Optional[str], ...] = ()
+    # Indexes of the body blocks the header and footer stand in for
+    skip: FrozenSet[int] = frozenset()
+    # Number the first page shows, when a page number field is used
+    first_page: int = 1
+
+
+def iter_lines(text: str):
+    # Like text.split('\n') without materialising every line at once
+    start = 0
+    while True:
+        end = text.find('\n', start)
+        if end == -1:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+
+def reflow_enabled() -> bool:
+    return os.environ.get('LAYOUT_REFLOW', 'true').lower() == 'true'
+
+
+def layout_signature() -> str:
+    """
+    Identifies how text is currently parsed, for cache keys of anything
+    rendered from a layout
+    """
+    return f"{LAYOUT_VERSION}+reflow" if reflow_enabled() else LAYOUT_VERSION
+
+
+def parse_layout(pages: Sequence[str], title: str = DEFAULT_TITLE, reflow: Optional[bool] = None) -> Layout:
+    """
+    Split texts into title and body blocks, with a page break between texts.
+
+    With ``reflow`` (the LAYOUT_REFLOW setting unless given) wrapped lines
+    are merged into paragraphs and headings, lists and tables are detected;
+    otherwise every non-blank line is its own paragraph. Either way
+    Markdown-style ``#`` lines become headings one level below the title.
+    """
+    blocks: List[Block] = [Block("title", title, 1)]
+    paragraphs = 0
+    chars = 0
+    for index, text in enumerate(pages):
+        chars += len(text)
+        if index:
+            blocks.append(PAGE_BREAK)
+        body = parse_blocks(text, reflow)
+        blocks.extend(body)
+        paragraphs += len(body)
+    return Layout(tuple(blocks), paragraphs, chars)
+
+
+def parse_blocks(text: str, reflow: Optional[bool] = None) -> List[Block]:
+    """
+    The body blocks of one text, without title or page breaks
+    """
+    if reflow is None:
+        reflow = reflow_enabled()
+    if reflow:
+        return reflow_blocks(text)
+    return [block for block in map(parse_line, iter_lines(text)) if block is not None]
+
+
+def parse_line(line: str) -> Optional[Block]:
+    """
+    The block one line of text becomes, or None for a blank line
+    """
+    if not line.strip():
+        return None
+    heading = _ATX_HEADING.match(line)
+    if heading:
+        return Block("heading", heading.group(2), len(heading.group(1)) + 1)
+    return Block("paragraph", line)
+
+
+def _is_heading_text(line: str) -> bool:
+    if line.isupper():
+        return True
+    words = _WORD.findall(line)
+    # Title Case: every significant word capitalized, and more than one of them
+    return len(words) > 1 and all(_CAPITALIZED_WORD.match(word) for word in words)
+
+
+def _cell_spans(line: str) -> List[Tuple[int, int, bool]]:
+    # (start, end, numeric) of each cell between column gaps, as positions in the line
+    body = line.rstrip()
+    start = len(body) - len(body.lstrip())
+    spans = []
+    for gap in _COLUMN_GAP.finditer(body):
+        spans.append((start, gap.start(), _NUMERIC_CELL.match(body[start:gap.start()]) is not None))
+        start = gap.end()
+    spans.append((start, len(body), _NUMERIC_CELL.match(body[start:]) is not None))
+    return spans
+
+
+def _columns_align(upper: str, lower: str) -> bool:
+    """
+    True when two lines split into the same columns at the same places.
+
+    Tabs are explicit separators, so tabbed rows only need the same number
+    of cells; otherwise every cell after the first must start where the one
+    above starts (or, for numbers, end where it ends), which the words after
+    a stray double space almost never do.
+    """
+    above, below = _cell_spans(upper), _cell_spans(lower)
+    if len(above) != len(below):
+        return False
+    if '\t' in upper and '\t' in lower:
+        return True
+    return all(
+        abs(top[0] - bottom[0]) <= _COLUMN_SLACK
+        or (top[2] and bottom[2] and abs(top[1] - bottom[1]) <= _COLUMN_SLACK)
+        for top, bottom in zip(above[1:], below[1:])
+    )
+
+
+def _join_wrapped(lines: List[str], hyphenated) -> str:
+    # Undo the line breaks of wrapped text; a word split with a hyphen is
+    # rejoined, without the hyphen unless the next part is capitalized
+    pieces = [lines[0]]
+    for line, split_word in zip(lines[1:], hyphenated):
+        if not split_word:
+            pieces.append(' ')
+        elif line[:1].islower():
+            pieces[-1] = pieces[-1][:-1]
+        pieces.append(line)
+    return ''.join(pieces)
+
+
+def reflow_blocks(text: str) -> List[Block]:
+    """
+    Rebuild the structure of wrapped text such as OCR output.
+
+    Every line is classified at once into feature arrays (length, indent,
+    sentence ending, list marker, column gaps, ...); the decisions are then
+    array operations over neighbouring lines rather than per-line branching:
+
+    - a line continues the previous paragraph when the previous one ran to
+      the typical wrap width, or stopped mid-sentence before a lowercase word;
+    - short Title Case or ALL CAPS lines that open a block are headings;
+    - lines starting with a bullet or number are list items, nested by indent;
+    - runs of lines split into the same columns by wide gaps, lined up
+      from row to row, are tables.
+    """
+    # numpy is only needed once there is text to reflow, so importing the app stays cheap
+    import numpy as np
+
+    lines = text.split('\n')
+    count = len(lines)
+    stripped = [line.strip() for line in lines]
+
+    length = np.fromiter(map(len, stripped), dtype=np.int64, count=count)
+    indent = np.fromiter((len(line) - len(line.lstrip()) for line in lines), dtype=np.int64, count=count)
+    blank = length == 0
+    atx = np.fromiter((_ATX_HEADING.match(line) is not None for line in stripped), dtype=bool, count=count)
+    items = [_LIST_ITEM.match(line) for line in lines]
+    bullet = np.fromiter((item is not None for item in items), dtype=bool, count=count) & ~atx
+    # Most lines cannot have a column gap; a substring test is far cheaper than the pattern
+    gaps = np.fromiter(
+        (len(_COLUMN_GAP.findall(line)) if '  ' in line or '\t' in line else 0 for line in stripped),
+        dtype=np.int64, count=count,
+    )
+    ends = np.fromiter((_SENTENCE_END.search(line) is not None for line in stripped), dtype=bool, count=count)
+    clause = np.fromiter((_CLAUSE_END.search(line) is not None for line in stripped), dtype=bool, count=count)
+    lower = np.fromiter((line[:1].islower() for line in stripped), dtype=bool, count=count)
+    hyphen = np.fromiter((line.endswith('-') and line[-2:-1].isalpha() for line in stripped),
+                         dtype=bool, count=count)
+
+    def shifted(values, fill, step):
+        # values[i + step], padded with ``fill`` beyond either end
+        result = np.full(count, fill, dtype=values.dtype)
+        if step > 0:
+            result[:-step] = values[step:]
+        else:
+            result[-step:] = values[:step]
+        return result
+
+    # Tables: two or more adjacent lines cut into the same, aligned columns
+    row = (gaps > 0) & ~blank & ~bullet & ~atx
+    same_columns = row & shifted(row, False, 1) & (gaps == shifted(gaps, -1, 1))
+    for index in np.flatnonzero(same_columns):
+        same_columns[index] = _columns_align(lines[index], lines[index + 1])
+    table = same_columns | shifted(same_columns, False, -1)
+
+    prose = ~blank & ~table & ~atx
+    width = np.percentile(length[prose], 90) if prose.any() else 0
+    full = (length >= _FULL_LINE_RATIO * width) & (width >= _MIN_WRAP_WIDTH)
+
+    # Headings open a block, are short and do not read as a sentence or clause
+    candidate = (
+        prose & ~bullet & ~clause & ~full & shifted(blank, True, -1)
+        & (length <= _HEADING_MAX_CHARS)
+    )
+    # A lone capitalized word counts only directly above a wrapped paragraph
+    above_prose = shifted(full & prose, False, 1)
+    heading = np.zeros(count, dtype=bool)
+    for index in np.flatnonzero(candidate):
+        line = stripped[index]
+        words = line.split()
+        heading[index] = len(words) <= _HEADING_MAX_WORDS and (
+            _is_heading_text(line) or (len(words) == 1 and line[:1].isupper() and above_prose[index])
+        )
+
+    # Does line i continue the block of line i - 1?
+    joinable = prose & ~heading
+    previous_full = shifted(full, False, -1)
+    previous_ends = shifted(ends, True, -1)
+    previous_hyphen = shifted(hyphen, False, -1)
+    wrapped = (previous_full & (~previous_ends | lower)) | (~previous_ends & (previous_hyphen | lower))
+    cont = joinable & shifted(joinable, False, -1) & ~bullet & wrapped
+    cont |= table & shifted(table, False, -1) & shifted(same_columns, False, -1)
+
+    # Block structure so far: the first line of each line's block
+    starts = ~blank & ~cont
+    first = np.maximum.accumulate(np.where(starts, np.arange(count), 0))
+    in_list = bullet[first] & ~blank
+    # Indented lines under a list item belong to it; elsewhere an indent opens a paragraph
+    list_body = joinable & ~bullet & shifted(in_list, False, -1) & (indent > indent[shifted(first, 0, -1)])
+    indented = cont & ~shifted(in_list, False, -1) & (indent > shifted(indent, 0, -1))
+    cont = (cont | list_body) & ~indented
+    starts = ~blank & ~cont
+
+    list_indent = indent[bullet].min() if bullet.any() else 0
+    block_starts = np.flatnonzero(starts)
+    block_ends = np.flatnonzero(~blank & ~shifted(cont, False, 1)) + 1
+
+    blocks = []
+    for start, end in zip(block_starts.tolist(), block_ends.tolist()):
+        if atx[start]:
+            blocks.append(parse_line(stripped[start]))
+        elif heading[start]:
+            blocks.append(Block("heading", stripped[start], 2 if stripped[start].isupper() else 3))
+        elif table[start]:
+            # Rows keep their own spacing so plain-text output is unchanged
+            blocks.append(Block("table", '\n'.join(stripped[start:end]), int(gaps[start]) + 1))
+        elif bullet[start]:
+            item = items[start]
+            marker = item.group(1)
+            body = [lines[start][item.end():].strip()] + stripped[start + 1:end]
+            level = 1 + min(int(indent[start] - list_indent) // 2, 2)
+            blocks.append(Block("list_item", _join_wrapped(body, previous_hyphen[start + 1:end]), level,
+                                '\u2022' if marker in _BULLETS else marker))
+        else:
+            blocks.append(Block("paragraph", _join_wrapped(stripped[start:end], previous_hyphen[start + 1:end])))
+    return blocks
+
+
+def table_cells(block: Block) -> List[List[str]]:
+    """
+    The rows of a table block split at their column gaps, padded to the same width
+    """
+    rows = [_COLUMN_GAP.split(row) for row in block.text.split('\n')]
+    columns = max(len(cells) for cells in rows)
+    return [cells + [''] * (columns - len(cells)) for cells in rows]
+
+
+class LayoutCache:
+    """
+    LRU of parsed layouts bounded by the characters of input they hold, so
+    exporting one text to several formats parses it once
+    """
+
+    def __init__(self, max_chars: int = 32 * 1024 * 1024):
+        self.max_chars = max_chars
+        self._entries = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "LayoutCache":
+        return cls(max_chars=int(os.environ.get('LAYOUT_CACHE_MAX_CHARS', str(32 * 1024 * 1024))))
+
+    @staticmethod
+    def key(pages: Sequence[str]) -> str:
+        digest = hashlib.sha256(f"layout={layout_signature()}\0pages={len(pages)}\0".encode('utf-8'))
+        for text in pages:
+            digest.update(text.encode('utf-8', 'surrogatepass'))
+            digest.update(b'\x0c')
+        return digest.hexdigest()
+
+    def get(self, pages: Sequence[str]) -> Layout:
+        key = self.key(pages)
+        with self._lock:
+            layout = self._entries.get(key)
+            if layout is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return layout
+            self.misses += 1
+
+        layout = parse_layout(pages)
+        if layout.chars <= self.max_chars:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = layout
+                    self._chars += layout.chars
+                while self._chars > self.max_chars and self._entries:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._chars -= evicted.chars
+        return layout
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "chars": self._chars,
+            "max_chars": self.max_chars,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def _running_line(blocks: Sequence[Block], candidates: List[Tuple[int, int]], pages: int):
+    """
+    The commonest repeated line among ``candidates`` ((page, block index)
+    pairs) as text pieces, the blocks it covers and the number shown on the
+    first page, or empty results when no line repeats on enough pages
+    """
+    # Group the candidate blocks by text with the numbers masked out and keep the commonest
+    groups = {}
+    for page, index in candidates:
+        block = blocks[index]
+        if block.kind in ('paragraph', 'heading') and len(block.text) <= RUNNING_MAX_CHARS:
+            groups.setdefault(_DIGITS.sub('#', block.text.strip()), []).append((page, index))
+    if not groups:
+        return (), [], None
+    found = max(groups.values(), key=len)
+    if len(found) < max(RUNNING_MIN_PAGES, RUNNING_MIN_SHARE * pages):
+        return (), [], None
+
+    # Numbers the same on every page are kept; one that changes becomes a page number
+    # field, but only if it is the page's position plus the same offset everywhere
+    texts = [blocks[index].text.strip() for _, index in found]
+    literals = _DIGITS.split(texts[0])
+    pieces = [literals[0]]
+    first_page = None
+    for values, literal in zip(zip(*map(_DIGITS.findall, texts)), literals[1:]):
+        if len(set(values)) == 1:
+            pieces[-1] += values[0] + literal
+            continue
+        offsets = {int(value) - page for value, (page, _) in zip(values, found)}
+        if first_page is not None or len(offsets) != 1 or min(offsets) < 0 \
+                or any(value != str(int(value)) for value in values):
+            # Counters, dates or a second varying number: this is body text after all
+            return (), [], None
+        first_page = offsets.pop()
+        pieces += [None, literal]
+    return tuple(piece for piece in pieces if piece != ''), [index for _, index in found], first_page
+
+
+def find_running_lines(blocks: Sequence[Block]) -> RunningLines:
+    """
+    Find a header and footer repeated at the top and bottom of the pages of
+    a multi-page layout (page numbers may differ), so a renderer can write
+    them once as running header and footer instead of on every page
+    """
+    pages = [[]]
+    for index, block in enumerate(blocks):
+        if block.kind == 'page_break':
+            pages.append([])
+        elif block.kind != 'title':
+            pages[-1].append(index)
+    if len(pages) < RUNNING_MIN_PAGES:
+        return RunningLines()
+
+    header, header_indexes, header_first = _running_line(
+        blocks, [(number, page[0]) for number, page in enumerate(pages) if page], len(pages))
+    taken = set(header_indexes)
+    footer, footer_indexes, footer_first = _running_line(
+        blocks, [(number, page[-1]) for number, page in enumerate(pages) if page and page[-1] not in taken],
+        len(pages))
+    if header_first is not None and footer_first not in (None, header_first):
+        # One section has one page numbering, so a footer counting differently stays in the body
+        footer, footer_indexes, footer_first = (), [], None
+    first_page = header_first if header_first is not None else footer_first
+    return RunningLines(header, footer, frozenset(header_indexes) | frozenset(footer_indexes),
+                        1 if first_page is None else first_page)
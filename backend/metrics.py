@@ -0,0 +1,246 @@
+"""
+In-process metrics in the Prometheus text exposition format
+"""
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from pymongo import monitoring
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: one count per bucket plus +Inf, then the running sum
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_latency = registry.histogram(
+    "http_request_duration_seconds", "Time from request start to the last response byte",
+    ("method", "route"))
+http_in_flight = registry.gauge(
+    "http_requests_in_flight", "Requests currently being handled", ("method",))
+http_request_bytes = registry.histogram(
+    "http_request_size_bytes", "Request body sizes", ("method", "route"), SIZE_BUCKETS)
+http_response_bytes = registry.histogram(
+    "http_response_size_bytes", "Response body sizes", ("method", "route"), SIZE_BUCKETS)
+docx_phase_seconds = registry.histogram(
+    "docx_render_phase_seconds", "DOCX render time split into build and save phases", ("renderer", "phase"))
+mongo_command_seconds = registry.histogram(
+    "mongo_command_duration_seconds", "MongoDB command round trips", ("command", "collection"), MONGO_BUCKETS)
+mongo_command_failures = registry.counter(
+    "mongo_command_failures_total", "MongoDB commands that returned an error", ("command", "collection"))
+
+
+def observe_docx_phases(renderer: str, phases: dict):
+    for phase, seconds in phases.items():
+        docx_phase_seconds.observe(seconds, renderer=renderer, phase=phase)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, in-flight requests and body sizes per
+    route template (``/api/documents/{artifact_id}``, not the concrete path),
+    so high-cardinality ids never become label values. Being plain ASGI it
+    does not buffer streaming responses.
+    """
+
+    def __init__(self, app, exclude: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        started = time.perf_counter()
+        request_bytes = 0
+        response_bytes = 0
+        status = 500
+
+        async def counting_receive():
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                request_bytes += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal response_bytes, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        http_in_flight.inc(method=method)
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            http_in_flight.dec(method=method)
+            # The router stores the matched route in the scope it was given
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            http_requests.inc(method=method, route=route, status=status)
+            http_latency.observe(time.perf_counter() - started, method=method, route=route)
+            http_request_bytes.observe(request_bytes, method=method, route=route)
+            http_response_bytes.observe(response_bytes, method=method, route=route)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """
+    pymongo command listener timing every command motor sends, per command
+    name and collection
+    """
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        # getMore names its collection separately from the cursor id
+        collection = target if isinstance(target, str) else event.command.get("collection", "")
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event) -> str:
+        return self._collections.pop((event.connection_id, event.request_id), "")
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        mongo_command_seconds.observe(event.duration_micros / 1e6, command=event.command_name, collection=collection)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        mongo_command_seconds.observe(event.duration_micros / 1e6, command=event.command_name, collection=collection)
+        mongo_command_failures.inc(command=event.command_name, collection=collection)
@@ -0,0 +1,107 @@
+"""
+Server-side OCR: a preprocessing pipeline followed by a pluggable recognizer
+"""
+import shutil
+import time
+from typing import TYPE_CHECKING, Dict
+
+# NumPy and Pillow are only loaded once a page is actually recognized
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+class RecognizerUnavailable(Exception):
+    """Raised when the configured OCR engine cannot run on this host"""
+
+
+class StubRecognizer:
+    """
+    Returns a fixed string; lets the pipeline run where no engine is
+    installed. Only offered to clients when OCR_ALLOW_STUB is on.
+    """
+
+    name = "stub"
+
+    def __init__(self, text: str = ""):
+        self.text = text
+
+    def recognize(self, image: "Image.Image") -> str:
+        return self.text
+
+
+class TesseractRecognizer:
+    """
+    Local Tesseract engine through pytesseract, which drives the separately
+    installed ``tesseract`` binary
+    """
+
+    name = "tesseract"
+
+    def __init__(self, lang: str = "eng"):
+        try:
+            import pytesseract
+        except ImportError:
+            raise RecognizerUnavailable("pytesseract is not installed")
+        if shutil.which(pytesseract.pytesseract.tesseract_cmd) is None:
+            raise RecognizerUnavailable("The tesseract binary is not installed (e.g. apt install tesseract-ocr)")
+        self._pytesseract = pytesseract
+        self.lang = lang
+
+    def recognize(self, image: "Image.Image") -> str:
+        return self._pytesseract.image_to_string(image, lang=self.lang)
+
+
+RECOGNIZERS = {
+    StubRecognizer.name: StubRecognizer,
+    TesseractRecognizer.name: TesseractRecognizer,
+}
+
+_recognizers: Dict[str, object] = {}
+
+
+def get_recognizer(engine: str):
+    # One instance per engine per process; workers build theirs on first use
+    if engine not in _recognizers:
+        if engine not in RECOGNIZERS:
+            raise RecognizerUnavailable(f"Unknown OCR engine: {engine}")
+        _recognizers[engine] = RECOGNIZERS[engine]()
+    return _recognizers[engine]
+
+
+def ocr_page(data: bytes, engine: str, target_dpi: int = 300, deskew: bool = True,
+             binarization: str = "sauvola") -> dict:
+    """
+    Run one image through every preprocessing stage and the recognizer,
+    timing each stage. Picklable so it can run on a process pool.
+    """
+    import preprocessing
+
+    timings = {}
+
+    def stage(name, fn, *args):
+        started = time.perf_counter()
+        result = fn(*args)
+        timings[name] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    recognizer = get_recognizer(engine)
+    # Decoding already shrinks to the target DPI, inside the JPEG decoder when possible
+    image = stage("decode", preprocessing.load_image, data, target_dpi)
+    pixels = stage("to_array", preprocessing.to_array, image)
+    gray = stage("grayscale", preprocessing.to_grayscale, pixels)
+    binary = stage("threshold", preprocessing.binarize, gray, binarization)
+    angle = 0.0
+    if deskew:
+        binary, angle = stage("deskew", preprocessing.deskew, binary)
+    binary = stage("crop", preprocessing.crop_to_text, binary)
+    page = preprocessing.to_image(binary)
+    text = stage("recognize", recognizer.recognize, page)
+
+    return {
+        "text": text,
+        "engine": engine,
+        "width": page.width,
+        "height": page.height,
+        "skew_angle": angle,
+        "timings_ms": timings,
+    }
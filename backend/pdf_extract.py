@@ -0,0 +1,34 @@
+"""
+PDF text extraction helpers that run inside the worker pool
+"""
+from typing import List
+
+
+def count_pdf_pages(path: str) -> int:
+    # Imported on first use so workers that never see a PDF do not pay for PyPDF2
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    if reader.is_encrypted:
+        raise ValueError("Encrypted PDFs are not supported")
+    return len(reader.pages)
+
+
+def extract_pdf_pages(path: str, start: int, stop: int) -> List[dict]:
+    """
+    Extract pages ``start`` to ``stop`` (exclusive) as ``{"text": ...}`` dicts.
+
+    Each call opens the file itself so workers only ever parse the objects of
+    the pages they were given, not the whole document. A page that cannot be
+    parsed gets ``{"error": ...}`` instead, so it does not take the rest with it.
+    """
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    pages = []
+    for index in range(start, stop):
+        try:
+            pages.append({"text": reader.pages[index].extract_text() or ""})
+        except Exception as e:
+            pages.append({"error": f"{type(e).__name__}: {e}"})
+    return pages
@@ -0,0 +1,133 @@
+"""
+Byte-range responses for rendered documents and stored artifacts, so an
+interrupted download can resume where it stopped
+"""
+import os
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a Range header lies entirely outside the representation"""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a ``Range`` header into an inclusive (first, last) byte pair.
+
+    Returns None when the whole representation should be sent instead:
+    no header, another unit, a malformed value or several ranges (which
+    RFC 9110 lets a server answer with a plain 200).
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - length, 0), size - 1
+        first = int(first)
+        last = int(last) if last else None
+    except ValueError:
+        return None
+    if first < 0 or (last is not None and last < first):
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable()
+    return first, size - 1 if last is None else min(last, size - 1)
+
+
+def if_range_matches(if_range: Optional[str], etag: Optional[str]) -> bool:
+    """
+    True when a Range should be honoured. If-Range needs a strong match, so a
+    weak or stale validator gets the full, current representation instead.
+    """
+    if not if_range:
+        return True
+    return etag is not None and not if_range.startswith('W/') and if_range.strip() == etag
+
+
+def _selected_range(size: int, range_header: Optional[str], if_range: Optional[str],
+                    etag: Optional[str]) -> Optional[Tuple[int, int]]:
+    if not if_range_matches(if_range, etag):
+        return None
+    return parse_range(range_header, size)
+
+
+def _unsatisfiable(size: int, headers: Dict[str, str]) -> Response:
+    return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+
+def bytes_response(data: bytes, media_type: str, headers: Dict[str, str],
+                   range_header: Optional[str] = None, if_range: Optional[str] = None) -> Response:
+    """
+    Serve an in-memory document with an exact length, or the requested slice of it
+    """
+    headers = {**headers, "Accept-Ranges": "bytes"}
+    try:
+        selected = _selected_range(len(data), range_header, if_range, headers.get("ETag"))
+    except RangeNotSatisfiable:
+        return _unsatisfiable(len(data), headers)
+    if selected is None:
+        return Response(data, media_type=media_type, headers=headers)
+    first, last = selected
+    headers["Content-Range"] = f"bytes {first}-{last}/{len(data)}"
+    return Response(data[first:last + 1], status_code=206, media_type=media_type, headers=headers)
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        # Non-ASCII names need the RFC 5987 form
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def _read_file(path: str, offset: int, length: int) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def file_response(path: str, media_type: str, headers: Dict[str, str],
+                  range_header: Optional[str] = None, if_range: Optional[str] = None) -> Response:
+    """
+    Stream a file, or the requested slice of it, with an exact Content-Length
+    """
+    size = os.path.getsize(path)
+    headers = {**headers, "Accept-Ranges": "bytes"}
+    try:
+        selected = _selected_range(size, range_header, if_range, headers.get("ETag"))
+    except RangeNotSatisfiable:
+        return _unsatisfiable(size, headers)
+    status_code = 200
+    first, last = 0, size - 1
+    if selected is not None:
+        first, last = selected
+        status_code = 206
+        headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+    headers["Content-Length"] = str(last - first + 1)
+    return StreamingResponse(
+        iterate_in_threadpool(_read_file(path, first, last - first + 1)),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers,
+    )
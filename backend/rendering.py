@@ -0,0 +1,822 @@
+"""
+DOCX rendering and the worker pool that keeps it off the event loop
+"""
+import asyncio
+import importlib.util
+import io
+import multiprocessing
+import os
+import queue
+import re
+import struct
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional
+from xml.sax.saxutils import escape
+
+from admission import FairQueue, client_identity, parse_weights
+from layout import Block, Layout, RunningLines, find_running_lines, parse_layout, table_cells
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Bump whenever a change alters rendered bytes, so cached documents are not reused
+RENDER_VERSION = "5"
+
+# Build/save phase timings go to the collector of a pool job when one is active
+# (so they travel back from worker processes), otherwise to the observers
+_phase_collector = threading.local()
+_phase_observers = []
+
+
+def add_phase_observer(observer):
+    """
+    Call ``observer(renderer, phases)`` with each render's phase durations in seconds
+    """
+    _phase_observers.append(observer)
+
+
+def report_phases(renderer: str, phases: dict):
+    collected = getattr(_phase_collector, 'phases', None)
+    if collected is not None:
+        collected.append((renderer, phases))
+        return
+    for observer in _phase_observers:
+        observer(renderer, phases)
+
+
+def build_docx(text: str) -> bytes:
+    """
+    Render extracted text into a DOCX file and return its bytes
+    """
+    # python-docx (and lxml under it) are only loaded if this path is used
+    from docx import Document
+    from docx.shared import Pt
+
+    started = time.perf_counter()
+    # Create a new Document
+    doc = Document()
+    # Size body text once on the shared style rather than on every run
+    doc.styles['Normal'].font.size = Pt(11)
+
+    # Add a title
+    doc.add_heading('Extracted Text', level=1)
+
+    # Split text into paragraphs and add them
+    for para in text.split('\n'):
+        if para.strip():  # Only add non-empty paragraphs
+            doc.add_paragraph(para)
+
+    # Save to bytes buffer
+    built = time.perf_counter()
+    docx_buffer = io.BytesIO()
+    doc.save(docx_buffer)
+    report_phases("python-docx", {"build": built - started, "save": time.perf_counter() - built})
+    return docx_buffer.getvalue()
+
+
+# Characters XML 1.0 cannot carry; python-docx rejects them, the stream drops them
+_INVALID_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+_RUN_BREAKS = re.compile(r'(\t|\r)')
+
+_PAGE_BREAK_XML = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable write target that hands out whatever the zip writer produced"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self.pending = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.pending += len(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.pending = 0
+        return data
+
+
+# Shared body style so paragraphs carry a style reference instead of a run-level size
+_BODY_STYLE_ID = 'ExtractedText'
+_BODY_STYLE_XML = (
+    f'<w:style w:type="paragraph" w:customStyle="1" w:styleId="{_BODY_STYLE_ID}">'
+    '<w:name w:val="Extracted Text"/><w:basedOn w:val="Normal"/><w:qFormat/>'
+    '<w:rPr><w:sz w:val="22"/><w:szCs w:val="22"/></w:rPr></w:style>'
+)
+
+
+def _run_xml(text: str) -> str:
+    # Mirrors python-docx: tabs become <w:tab/>, carriage returns <w:br/>
+    pieces = []
+    for piece in _RUN_BREAKS.split(_INVALID_XML_CHARS.sub('', text)):
+        if piece == '\t':
+            pieces.append('<w:tab/>')
+        elif piece == '\r':
+            pieces.append('<w:br/>')
+        elif piece:
+            pieces.append(f'<w:t xml:space="preserve">{escape(piece)}</w:t>')
+    return ''.join(pieces)
+
+
+def _paragraph_xml(text: str, style: str = _BODY_STYLE_ID) -> str:
+    return f'<w:p><w:pPr><w:pStyle w:val="{style}"/></w:pPr><w:r>{_run_xml(text)}</w:r></w:p>'
+
+
+def _list_item_xml(block: Block) -> str:
+    # The marker is kept as written (OCR numbering is not always sequential), hanging before a tab
+    indent = 360 * (block.level + 1)
+    return (f'<w:p><w:pPr><w:pStyle w:val="ListParagraph"/><w:ind w:left="{indent}" w:hanging="360"/>'
+            f'</w:pPr><w:r>{_run_xml(block.marker + chr(9) + block.text)}</w:r></w:p>')
+
+
+def _table_xml(block: Block) -> str:
+    rows = table_cells(block)
+    parts = ['<w:tbl><w:tblPr><w:tblStyle w:val="TableGrid"/><w:tblW w:w="0" w:type="auto"/>'
+             '<w:tblLook w:val="04A0"/></w:tblPr><w:tblGrid>', '<w:gridCol/>' * len(rows[0]), '</w:tblGrid>']
+    for cells in rows:
+        parts.append('<w:tr>')
+        for cell in cells:
+            parts.append(f'<w:tc><w:tcPr><w:tcW w:w="0" w:type="auto"/></w:tcPr>{_paragraph_xml(cell)}</w:tc>')
+        parts.append('</w:tr>')
+    parts.append('</w:tbl>')
+    return ''.join(parts)
+
+
+def block_xml(block: Block) -> str:
+    """
+    WordprocessingML for one layout block
+    """
+    if block.kind == 'page_break':
+        return _PAGE_BREAK_XML
+    if block.kind == 'paragraph':
+        return _paragraph_xml(block.text)
+    if block.kind == 'list_item':
+        return _list_item_xml(block)
+    if block.kind == 'table':
+        return _table_xml(block)
+    return _paragraph_xml(block.text, f'Heading{block.level}')
+
+
+class BlockXmlStore:
+    """
+    Serialized blocks keyed by the blocks themselves, so a paragraph that
+    recurs in a document (a repeated label, a header left in the body) is
+    escaped and encoded once. Bounded, and long blocks are never kept, since
+    those rarely repeat.
+    """
+
+    def __init__(self, max_entries: int = 4096, max_chars: int = 512):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._entries: Dict[Block, bytes] = {}
+        self.hits = 0
+
+    def get(self, block: Block) -> bytes:
+        if len(block.text) > self.max_chars:
+            return block_xml(block).encode('utf-8')
+        data = self._entries.get(block)
+        if data is not None:
+            self.hits += 1
+            return data
+        data = block_xml(block).encode('utf-8')
+        if len(self._entries) < self.max_entries:
+            self._entries[block] = data
+        return data
+
+
+_WORD_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+_PAGE_FIELD_XML = '<w:fldSimple w:instr=" PAGE "><w:r><w:t>1</w:t></w:r></w:fldSimple>'
+# part, root element, paragraph style, relationship id, reference element
+_RUNNING_PARTS = {
+    "header": ("word/header1.xml", "hdr", "Header", "rIdRunningHeader", "headerReference"),
+    "footer": ("word/footer1.xml", "ftr", "Footer", "rIdRunningFooter", "footerReference"),
+}
+
+
+def _running_part_xml(kind: str, pieces) -> bytes:
+    _, root, style, _, _ = _RUNNING_PARTS[kind]
+    runs = ''.join(_PAGE_FIELD_XML if piece is None else f'<w:r>{_run_xml(piece)}</w:r>' for piece in pieces)
+    return (f"<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n<w:{root} xmlns:w=\"{_WORD_NAMESPACE}\">"
+            f'<w:p><w:pPr><w:pStyle w:val="{style}"/></w:pPr>{runs}</w:p></w:{root}>').encode('utf-8')
+
+
+# Every archive member gets this timestamp, so identical input renders identical bytes
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def zip_member(name: str, compress_type: int = zipfile.ZIP_DEFLATED) -> zipfile.ZipInfo:
+    """
+    Archive entry with a fixed timestamp; passing a bare name to ``writestr``
+    or ``open`` would stamp it with the current time
+    """
+    info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+    info.compress_type = compress_type
+    info.external_attr = 0o600 << 16
+    return info
+
+
+def _zip_parts(parts) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in parts:
+            zf.writestr(zip_member(name), data)
+    return buffer.getvalue()
+
+
+@dataclass
+class RenderProgress:
+    """Shared counter a renderer bumps as paragraphs are written"""
+    total: int = 0
+    rendered: int = 0
+
+
+class DocxTemplate:
+    """
+    Precompiled DOCX package used by the fast rendering paths.
+
+    The base package (python-docx's default template plus an 11pt body style)
+    is parsed and zipped once; each render only produces the body XML and
+    appends ``word/document.xml`` to a copy of the prebuilt archive.
+    """
+
+    def __init__(self, static_parts, prefix: bytes, suffix: bytes):
+        self.static_parts = static_parts
+        self.prefix = prefix
+        self.suffix = suffix
+        self._directory = None
+        self.static_zip = _zip_parts(static_parts)
+        # (static parts, static zip, suffix) per combination of running header and footer
+        self._variants = {((), 1): (static_parts, self.static_zip, suffix)}
+        self._variants_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str = None) -> "DocxTemplate":
+        if path is None:
+            # Locate python-docx's template without importing the package
+            package_dir = importlib.util.find_spec('docx').submodule_search_locations[0]
+            path = os.path.join(package_dir, 'templates', 'default.docx')
+        with zipfile.ZipFile(path) as zf:
+            parts = [(info.filename, zf.read(info)) for info in zf.infolist()]
+
+        static_parts = []
+        for name, data in parts:
+            if name == 'word/document.xml':
+                document_xml = data.decode('utf-8')
+                continue
+            if name == 'word/styles.xml':
+                data = data.replace(b'</w:styles>', _BODY_STYLE_XML.encode('utf-8') + b'</w:styles>')
+            static_parts.append((name, data))
+
+        # Split document.xml around its (empty) body so paragraphs go in between
+        body_start = document_xml.index('<w:body>') + len('<w:body>')
+        sect_start = document_xml.index('<w:sectPr', body_start)
+        prefix = document_xml[:body_start].encode('utf-8')
+        suffix = re.sub(r'>\s+<', '><', document_xml[sect_start:]).encode('utf-8')
+        return cls(static_parts, prefix, suffix)
+
+    def _body(self, layout: Layout, skip=frozenset(), progress: RenderProgress = None):
+        store = BlockXmlStore()
+        for index, block in enumerate(layout.blocks):
+            if index not in skip:
+                yield store.get(block)
+            if progress is not None and block.kind not in ('title', 'page_break'):
+                progress.rendered += 1
+
+    def _variant(self, running: RunningLines):
+        """
+        The static parts, prebuilt archive and document suffix for a package
+        that also has the given running header and footer parts. Only the
+        content types, relationships and section properties differ, so each
+        combination is built once.
+        """
+        kinds = tuple(kind for kind in ("header", "footer") if getattr(running, kind))
+        key = (kinds, running.first_page)
+        variant = self._variants.get(key)
+        if variant is not None:
+            return variant
+        overrides = ''.join(
+            f'<Override PartName="/{_RUNNING_PARTS[kind][0]}" ContentType="application/'
+            f'vnd.openxmlformats-officedocument.wordprocessingml.{kind}+xml"/>' for kind in kinds
+        ).encode('utf-8')
+        relationships = ''.join(
+            f'<Relationship Id="{_RUNNING_PARTS[kind][3]}" Type="http://schemas.openxmlformats.org/'
+            f'officeDocument/2006/relationships/{kind}" Target="{_RUNNING_PARTS[kind][0][5:]}"/>' for kind in kinds
+        ).encode('utf-8')
+        static_parts = []
+        for name, data in self.static_parts:
+            if name == '[Content_Types].xml':
+                data = data.replace(b'</Types>', overrides + b'</Types>')
+            elif name == 'word/_rels/document.xml.rels':
+                data = data.replace(b'</Relationships>', relationships + b'</Relationships>')
+            static_parts.append((name, data))
+        # References open the section properties, headers before footers
+        references = ''.join(
+            f'<w:{_RUNNING_PARTS[kind][4]} w:type="default" r:id="{_RUNNING_PARTS[kind][3]}"/>' for kind in kinds
+        ).encode('utf-8')
+        opening = self.suffix.index(b'>') + 1
+        suffix = self.suffix[:opening] + references + self.suffix[opening:]
+        if running.first_page != 1:
+            # Page numbering restarts where the source's did; pgNumType precedes cols in sectPr
+            columns = suffix.index(b'<w:cols')
+            suffix = suffix[:columns] + b'<w:pgNumType w:start="%d"/>' % running.first_page + suffix[columns:]
+        variant = (static_parts, _zip_parts(static_parts), suffix)
+        with self._variants_lock:
+            self._variants[key] = variant
+        return variant
+
+    def _running_parts(self, running: RunningLines):
+        return [(_RUNNING_PARTS[kind][0], _running_part_xml(kind, getattr(running, kind)))
+                for kind in ("header", "footer") if getattr(running, kind)]
+
+    def _static_directory(self):
+        # Local entries and central directory records of the static parts, split apart once
+        if self._directory is None:
+            with zipfile.ZipFile(io.BytesIO(self.static_zip)) as zf:
+                count = len(zf.infolist())
+                start_dir = zf.start_dir
+            # The archive has no comment, so the end record is its last 22 bytes
+            self._directory = (self.static_zip[:start_dir], self.static_zip[start_dir:-22], count)
+        return self._directory
+
+    def package(self, deflated: bytes, crc: int, size: int, date_time=(1980, 1, 1, 0, 0, 0)) -> bytes:
+        """
+        Build the DOCX around an already deflated ``word/document.xml``.
+
+        ``deflated`` is a raw deflate stream of ``size`` bytes of XML with CRC
+        ``crc``; callers that keep it as independently compressed segments
+        (see ``sessions.DocumentSession``) never recompress unchanged parts.
+        """
+        if len(deflated) > 0xFFFFFFFF or size > 0xFFFFFFFF:
+            raise ValueError("document.xml is too large for an incremental package")
+        local_entries, central_directory, count = self._static_directory()
+        name = b'word/document.xml'
+        dos_time = (date_time[3] << 11) | (date_time[4] << 5) | (date_time[5] // 2)
+        dos_date = ((date_time[0] - 1980) << 9) | (date_time[1] << 5) | date_time[2]
+        local_header = struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, 20, 0, zipfile.ZIP_DEFLATED, dos_time, dos_date,
+            crc, len(deflated), size, len(name), 0,
+        ) + name
+        central_record = struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | 20, 20, 0, zipfile.ZIP_DEFLATED, dos_time, dos_date,
+            crc, len(deflated), size, len(name), 0, 0, 0, 0, 0o600 << 16, len(local_entries),
+        ) + name
+        directory_offset = len(local_entries) + len(local_header) + len(deflated)
+        directory_size = len(central_directory) + len(central_record)
+        end_record = struct.pack(
+            '<IHHHHIIH', 0x06054b50, 0, 0, count + 1, count + 1, directory_size, directory_offset, 0,
+        )
+        return b''.join((local_entries, local_header, deflated, central_directory, central_record, end_record))
+
+    def render(self, text: str) -> bytes:
+        """
+        Render ``text`` into complete DOCX bytes
+        """
+        return self.render_layout(parse_layout([text]))
+
+    def render_pages(self, pages) -> bytes:
+        """
+        Render several texts into one document, separated by page breaks
+        """
+        return self.render_layout(parse_layout(pages))
+
+    def render_layout(self, layout: Layout) -> bytes:
+        started = time.perf_counter()
+        running = find_running_lines(layout.blocks)
+        _, static_zip, suffix = self._variant(running)
+        document_xml = self.prefix + b''.join(self._body(layout, running.skip)) + suffix
+        built = time.perf_counter()
+        buffer = io.BytesIO(static_zip)
+        buffer.seek(0, io.SEEK_END)
+        with zipfile.ZipFile(buffer, 'a', zipfile.ZIP_DEFLATED) as zf:
+            for name, data in self._running_parts(running):
+                zf.writestr(zip_member(name), data)
+            zf.writestr(zip_member('word/document.xml'), document_xml)
+        report_phases("template", {"build": built - started, "save": time.perf_counter() - built})
+        return buffer.getvalue()
+
+    def stream(self, text: str, chunk_size: int = 64 * 1024, progress: RenderProgress = None):
+        return self.stream_layout(parse_layout([text]), chunk_size, progress)
+
+    def stream_pages(self, pages, chunk_size: int = 64 * 1024, progress: RenderProgress = None):
+        return self.stream_layout(parse_layout(pages), chunk_size, progress)
+
+    def stream_layout(self, layout: Layout, chunk_size: int = 64 * 1024, progress: RenderProgress = None):
+        """
+        Yield the DOCX as zip chunks while document.xml is still being written,
+        never holding more than roughly ``chunk_size`` bytes of output at once
+        """
+        sink = _ChunkSink()
+        # Time spent producing body XML versus compressing it; waits on the client are excluded
+        build_seconds = save_seconds = 0.0
+        clock = time.perf_counter
+        running = find_running_lines(layout.blocks)
+        static_parts, _, suffix = self._variant(running)
+        mark = clock()
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name, data in static_parts + self._running_parts(running):
+                zf.writestr(zip_member(name), data)
+            save_seconds += clock() - mark
+            yield sink.drain()
+
+            # Entry size is unknown up front, so ask for zip64 when it could overflow
+            large = layout.chars > 1 << 30
+            mark = clock()
+            with zf.open(zip_member('word/document.xml'), 'w', force_zip64=large) as part:
+                part.write(self.prefix)
+                for data in self._body(layout, running.skip, progress):
+                    now = clock()
+                    build_seconds += now - mark
+                    part.write(data)
+                    mark = clock()
+                    save_seconds += mark - now
+                    if sink.pending >= chunk_size:
+                        yield sink.drain()
+                        mark = clock()
+                part.write(suffix)
+            save_seconds += clock() - mark
+        report_phases("template-stream", {"build": build_seconds, "save": save_seconds})
+        yield sink.drain()
+
+
+@lru_cache(maxsize=1)
+def get_template() -> DocxTemplate:
+    return DocxTemplate.load()
+
+
+def render_docx(text: str) -> bytes:
+    """
+    Template fast path equivalent of ``build_docx``; picklable for process pools
+    """
+    return get_template().render(text)
+
+
+def render_docx_pages(pages) -> bytes:
+    return get_template().render_pages(pages)
+
+
+def stream_docx(text: str, chunk_size: int = 64 * 1024, progress: RenderProgress = None):
+    return get_template().stream(text, chunk_size, progress)
+
+
+def stream_docx_pages(pages, chunk_size: int = 64 * 1024):
+    return get_template().stream_pages(pages, chunk_size)
+
+
+def stream_docx_progress(layout: Layout, chunk_size: int = 64 * 1024):
+    """
+    Yield ``(chunk, paragraphs rendered)`` pairs; unlike a shared
+    ``RenderProgress`` the count survives the trip back from a pool process
+    """
+    progress = RenderProgress(total=layout.paragraphs)
+    for chunk in get_template().stream_layout(layout, chunk_size, progress):
+        yield chunk, progress.rendered
+
+
+class ZipStreamWriter:
+    """
+    Incrementally build a zip archive whose bytes can be handed out as each
+    member is added, for bundling already-rendered documents
+    """
+
+    def __init__(self):
+        self._sink = _ChunkSink()
+        self._zip = zipfile.ZipFile(self._sink, 'w', zipfile.ZIP_STORED, allowZip64=True)
+        self._names = set()
+
+    def unique_name(self, filename: str) -> str:
+        # Members are flat: drop any directory parts and number duplicates
+        name = os.path.basename(filename.replace('\\', '/')) or 'document.docx'
+        stem, ext = os.path.splitext(name)
+        counter = 2
+        while name in self._names:
+            name = f"{stem} ({counter}){ext}"
+            counter += 1
+        self._names.add(name)
+        return name
+
+    def add(self, filename: str, data: bytes) -> bytes:
+        # DOCX files are already deflated, so store them as-is
+        self._zip.writestr(zip_member(self.unique_name(filename), self._zip.compression), data)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
+
+
+def _timed_call(fn, *args):
+    # Runs inside the worker so the measured time excludes queueing
+    _phase_collector.phases = []
+    try:
+        started = time.perf_counter()
+        result = fn(*args)
+        return result, time.perf_counter() - started, _phase_collector.phases
+    finally:
+        _phase_collector.phases = None
+
+
+def _produce_chunks(fn, args, channel, stop):
+    """
+    Run the chunk generator ``fn(*args)`` in a pool process, handing chunks
+    back through ``channel`` (a bounded manager queue, so a slow client
+    holds the producer back) until it ends or ``stop`` is set
+    """
+    _phase_collector.phases = []
+    gen = fn(*args)
+    try:
+        for chunk in gen:
+            if stop.is_set():
+                break
+            channel.put(("chunk", chunk))
+    except Exception as e:
+        channel.put(("error", f"{type(e).__name__}: {e}"))
+        return
+    finally:
+        gen.close()
+        phases, _phase_collector.phases = _phase_collector.phases, None
+    channel.put(("end", phases))
+
+
+def _discard_until_done(channel, producer):
+    # Keep a stopped producer from blocking on a full channel until it has finished
+    while not producer.done():
+        try:
+            channel.get(timeout=0.1)
+        except queue.Empty:
+            pass
+        except (EOFError, OSError):
+            # The manager has shut down, and the producer with it
+            return
+
+
+class RenderPoolSaturated(Exception):
+    """Raised when the render pool already holds its maximum number of jobs"""
+
+
+@dataclass
+class RenderResult:
+    data: bytes
+    queued_ms: float
+    render_ms: float
+
+    def server_timing(self) -> str:
+        return f"queue;dur={self.queued_ms:.1f}, render;dur={self.render_ms:.1f}"
+
+
+class RenderPool:
+    """
+    Bounded executor for CPU-bound document rendering.
+
+    At most ``workers`` jobs run at once and at most ``queue_depth`` more wait
+    for a free worker; anything beyond that is rejected immediately so callers
+    can answer 503 instead of piling up requests. Waiting jobs are started in
+    weighted fair order across clients (see ``admission.FairQueue``), not
+    first come first served.
+    """
+
+    def __init__(self, kind: str = "process", workers: int = 0, queue_depth: int = 16,
+                 weights: Optional[Dict[str, float]] = None):
+        if kind not in ("process", "thread"):
+            raise ValueError(f"Unknown render executor kind: {kind}")
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_depth = queue_depth
+        self.fair_queue = FairQueue(self.workers, weights)
+        self._executor = None
+        # Process pools stream through queues owned by a manager process, started on first use
+        self._manager = None
+        self._pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_queued_ms = 0.0
+        self.total_render_ms = 0.0
+
+    @classmethod
+    def from_env(cls) -> "RenderPool":
+        return cls(
+            kind=os.environ.get('DOCX_RENDER_EXECUTOR', 'process'),
+            workers=int(os.environ.get('DOCX_RENDER_WORKERS', '0')),
+            queue_depth=int(os.environ.get('DOCX_RENDER_QUEUE_DEPTH', '16')),
+            weights=parse_weights(os.environ.get('FAIR_QUEUE_WEIGHTS', '')),
+        )
+
+    def start(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_depth
+
+    async def submit(self, fn, *args, wait: bool = False) -> RenderResult:
+        """
+        Run ``fn(*args)`` on the pool and return its result with per-job timing.
+
+        A full pool raises ``RenderPoolSaturated`` unless ``wait`` is set, in
+        which case the call waits for capacity instead.
+        """
+        if wait:
+            await self.wait_for_capacity()
+        elif self._pending >= self.capacity:
+            self.rejected += 1
+            raise RenderPoolSaturated(f"Render queue is full ({self.capacity} jobs)")
+
+        self.start()
+        self._pending += 1
+        submitted = time.perf_counter()
+        try:
+            async with self.fair_queue.slot(client_identity.get()):
+                loop = asyncio.get_running_loop()
+                data, render_seconds, phases = await loop.run_in_executor(self._executor, _timed_call, fn, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._pending -= 1
+
+        for renderer, timings in phases:
+            report_phases(renderer, timings)
+        render_ms = render_seconds * 1000
+        queued_ms = max((time.perf_counter() - submitted) * 1000 - render_ms, 0.0)
+        self.completed += 1
+        self.total_queued_ms += queued_ms
+        self.total_render_ms += render_ms
+        return RenderResult(data=data, queued_ms=queued_ms, render_ms=render_ms)
+
+    async def wait_for_capacity(self):
+        """
+        Return once a job or stream can be started without being rejected;
+        nothing is reserved, so start it before awaiting anything else
+        """
+        while self._pending >= self.capacity:
+            await asyncio.sleep(0.05)
+
+    def stream(self, fn, *args):
+        """
+        Run the chunk generator ``fn(*args)`` on the pool and yield its chunks,
+        counting it against the pool's capacity until the stream is closed.
+
+        A full pool is rejected here, so callers can still answer 503, but the
+        slot is only taken once the stream is first iterated: a stream that is
+        dropped unstarted (an error before the response goes out, a client that
+        disconnects first) holds nothing. With a process pool ``fn`` and its
+        arguments must be picklable; the generator runs in a worker process,
+        so streaming renders scale across cores like ``submit``.
+        """
+        if self._pending >= self.capacity:
+            self.rejected += 1
+            raise RenderPoolSaturated(f"Render queue is full ({self.capacity} jobs)")
+        self.start()
+        if self.kind == "process":
+            return self._drain_process(fn, args, client_identity.get())
+        return self._drain_thread(fn, args, client_identity.get())
+
+    async def _reserve(self):
+        # Streams that passed the check together may find the pool full by now; they wait their turn
+        await self.wait_for_capacity()
+        self._pending += 1
+
+    def _stream_done(self, failed: bool, started: float):
+        if failed:
+            self.failed += 1
+        else:
+            self.completed += 1
+            self.total_render_ms += (time.perf_counter() - started) * 1000
+
+    async def _drain_thread(self, fn, args, client: str):
+        gen = fn(*args)
+        await self._reserve()
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        running = None
+        state = {"failed": False, "done": False}
+
+        def finish():
+            # Only once no worker is inside the generator may it be closed and its slot freed
+            gen.close()
+            self._pending -= 1
+
+        try:
+            while True:
+                # Each chunk takes its own fair-queue turn so streams interleave with jobs
+                await self.fair_queue.acquire(client)
+                chunk_started = time.perf_counter()
+                running = self._executor.submit(next, gen, None)
+                running.add_done_callback(lambda _, since=chunk_started: loop.call_soon_threadsafe(
+                    self.fair_queue.release, client, time.perf_counter() - since))
+                chunk = await asyncio.wrap_future(running)
+                if chunk is None:
+                    state["done"] = True
+                    break
+                if chunk:
+                    yield chunk
+        except Exception:
+            state["failed"] = True
+            raise
+        finally:
+            if state["done"] or state["failed"]:
+                self._stream_done(state["failed"], started)
+            if running is not None and not running.done():
+                # The client went away mid-chunk: the worker is still in the
+                # generator, so close it once the chunk is finished
+                running.add_done_callback(lambda _: loop.call_soon_threadsafe(finish))
+            else:
+                finish()
+
+    def _channel_manager(self):
+        if self._manager is None:
+            self._manager = multiprocessing.Manager()
+        return self._manager
+
+    async def _drain_process(self, fn, args, client: str):
+        await self._reserve()
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        producer = None
+        state = {"failed": False, "done": False}
+
+        def finish():
+            self.fair_queue.release(client, time.perf_counter() - started)
+            self._pending -= 1
+
+        acquired = False
+        try:
+            manager = await loop.run_in_executor(None, self._channel_manager)
+            channel = await loop.run_in_executor(None, manager.Queue, 2)
+            stop = await loop.run_in_executor(None, manager.Event)
+            # The producer holds a worker process for the whole stream, and its fair-queue slot with it
+            await self.fair_queue.acquire(client)
+            acquired = True
+            producer = self._executor.submit(_produce_chunks, fn, args, channel, stop)
+            while True:
+                kind, payload = await loop.run_in_executor(None, channel.get)
+                if kind == "chunk":
+                    if payload:
+                        yield payload
+                elif kind == "error":
+                    raise RuntimeError(payload)
+                else:
+                    for renderer, timings in payload:
+                        report_phases(renderer, timings)
+                    state["done"] = True
+                    break
+        except Exception:
+            state["failed"] = True
+            raise
+        finally:
+            if state["done"] or state["failed"]:
+                self._stream_done(state["failed"], started)
+            if producer is None:
+                if acquired:
+                    self.fair_queue.release(client, 0.0)
+                self._pending -= 1
+            elif producer.done():
+                finish()
+            else:
+                # Stopped early: tell the producer, keep its channel moving until it exits, then free the slot
+                stop.set()
+                loop.run_in_executor(None, _discard_until_done, channel, producer)
+                producer.add_done_callback(lambda _: loop.call_soon_threadsafe(finish))
+
+    def stats(self) -> dict:
+        done = self.completed or 1
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "pending": self._pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_queued_ms": round(self.total_queued_ms / done, 2),
+            "avg_render_ms": round(self.total_render_ms / done, 2),
+            "fair_queue": self.fair_queue.stats(),
+        }
@@ -1,26 +1,139 @@
-from fastapi import FastAPI, APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Header, Query, Request, UploadFile, File
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import CollectionInvalid
+from pymongo.topology_description import TopologyDescription
+from bson import Binary
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Literal, Optional
 import uuid
-from datetime import datetime
-from docx import Document
-from docx.shared import Pt
-import io
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+import asyncio
+import base64
+import json
+import re
+import tempfile
+import time
+from admission import AdmissionMiddleware, RateLimiter, parse_rate_limits
+from artifacts import ArtifactStore
+from compression import CompressionMiddleware
+from database import MongoSettings, PoolState, create_client, read_heavy_database
+from document_cache import DocumentCache
+from exporters import (
+    EXPORTERS,
+    UnknownExportFormat,
+    UnsupportedExportText,
+    get_exporter,
+    render_export,
+    stream_export,
+)
+from extractions import compress_text, decompress_text, make_snippet, normalize_language, search_terms, split_segments
+from ocr import RecognizerUnavailable, StubRecognizer, get_recognizer, ocr_page
+from layout import DEFAULT_TITLE, Layout, LayoutCache, layout_signature
+from metrics import PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, MongoCommandTimer, observe_docx_phases, registry
+from pdf_extract import count_pdf_pages, extract_pdf_pages
+from ranges import bytes_response, content_disposition, file_response
+from sessions import EditOp, SessionError, SessionStore
+from status_ingest import StatusBufferFull, StatusWriteBuffer
+from uploads import UploadError, UploadStore
+from rendering import (
+    DOCX_MEDIA_TYPE,
+    RENDER_VERSION,
+    RenderPool,
+    RenderPoolSaturated,
+    ZipStreamWriter,
+    add_phase_observer,
+    build_docx,
+    get_template,
+    render_docx,
+    render_docx_pages,
+    stream_docx_progress,
+    stream_docx_pages,
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection, built on startup (see connect_to_mongo) rather than at import
+client = None
+db = None
+# Listing and search routes read through this one, which may prefer secondaries
+replica_db = None
+mongo_settings = None
+mongo_pool_state = PoolState()
+ready_ping_timeout = float(os.environ.get('READY_PING_TIMEOUT_SECONDS', '1'))
+
+def read_heavy_db():
+    """
+    Database handle for routes that only read and tolerate replication lag
+    """
+    return replica_db if replica_db is not None else db
+
+# Worker pool for CPU-bound document work (rendering, PDF extraction)
+render_pool = RenderPool.from_env()
+add_phase_observer(observe_docx_phases)
+docx_streaming = os.environ.get('DOCX_STREAMING', 'true').lower() == 'true'
+# "template" fills a precompiled package; "python-docx" builds a Document per request
+docx_render_mode = os.environ.get('DOCX_RENDER_MODE', 'template')
+document_cache = DocumentCache.from_env()
+# Parsed text layouts, shared by every export format
+layout_cache = LayoutCache.from_env()
+docx_batch_max_items = int(os.environ.get('DOCX_BATCH_MAX_ITEMS', '100'))
+# Longest text a single document may be rendered from
+docx_max_text_chars = int(os.environ.get('DOCX_MAX_TEXT_CHARS', '2000000'))
+
+# Per-client token buckets for the expensive routes, checked before any body is read
+rate_limiter = RateLimiter(
+    parse_rate_limits(os.environ.get('RATE_LIMITS', '')),
+    max_clients=int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', '10000')),
+)
+
+# Rendered files kept briefly so clients can download them with a plain GET
+artifact_store = ArtifactStore.from_env()
+
+# Background export jobs: records live in Mongo, rendering runs on the render pool
+export_job_slots = asyncio.Semaphore(int(os.environ.get('EXPORT_JOB_WORKERS', '2')))
+export_job_record_ttl = int(os.environ.get('EXPORT_JOB_RECORD_TTL_SECONDS', '86400'))
+# Each queued job holds its parsed text, so only this many may wait in one process
+export_job_queue_max = int(os.environ.get('EXPORT_JOB_QUEUE_MAX', '32'))
+# Live jobs are touched this often; unfinished jobs not touched for three beats were orphaned
+export_job_heartbeat = float(os.environ.get('EXPORT_JOB_HEARTBEAT_SECONDS', '10'))
+# Job id -> task for the jobs this process is running
+export_job_tasks = {}
+
+# Uploaded PDFs are spooled to disk and extracted a few pages per pool job
+pdf_max_bytes = int(os.environ.get('PDF_MAX_BYTES', str(50 * 1024 * 1024)))
+pdf_pages_per_job = int(os.environ.get('PDF_PAGES_PER_JOB', '4'))
+
+# Optional server-side OCR for devices that cannot do it well themselves
+ocr_engine = os.environ.get('OCR_ENGINE', 'tesseract')
+# The stub engine returns canned text; only tests and local debugging may pick it
+ocr_allow_stub = os.environ.get('OCR_ALLOW_STUB', 'false').lower() == 'true'
+ocr_max_image_bytes = int(os.environ.get('OCR_MAX_IMAGE_BYTES', str(20 * 1024 * 1024)))
+ocr_max_pages = int(os.environ.get('OCR_MAX_PAGES', '20'))
+
+# Large files can be sent in resumable chunks and then fed to a pipeline
+upload_store = UploadStore.from_env()
+upload_locks = {}
+
+# Editable documents kept parsed in memory between exports
+session_store = SessionStore.from_env()
+
+# Extraction history: compressed transcripts plus short text-indexed segments
+extraction_max_chars = int(os.environ.get('EXTRACTION_MAX_CHARS', str(5 * 1024 * 1024)))
+extraction_block_compressor = os.environ.get('EXTRACTION_BLOCK_COMPRESSOR', 'zstd')
+
+# Status checks can be written per request or batched through a write-behind buffer
+status_buffer = StatusWriteBuffer.from_env(lambda: db.status_checks, on_flushed=lambda docs: record_status_rollups(docs))
+default_status_durability = os.environ.get('STATUS_DEFAULT_DURABILITY', 'acknowledged')
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -38,64 +151,1324 @@ class StatusCheckCreate(BaseModel):
     client_name: str
 
 class TextToDocxRequest(BaseModel):
+    text: str = Field(..., max_length=docx_max_text_chars)
+    filename: str = "extracted_text.docx"
+
+class ExportRequest(BaseModel):
+    text: str = Field(..., max_length=docx_max_text_chars)
+    # Defaults to extracted_text plus the format's extension
+    filename: Optional[str] = None
+
+class BatchDocxRequest(BaseModel):
+    items: List[TextToDocxRequest] = Field(..., min_length=1)
+    # Merge every item into one document, one page per item, instead of a zip
+    merge: bool = False
+    filename: Optional[str] = None
+
+class DocumentArtifact(BaseModel):
+    id: str
+    url: str
+    filename: str
+    size: int
+    expires_at: datetime
+
+class ExportJob(BaseModel):
+    id: str
+    status: str  # queued, running, done or failed
+    filename: str
+    paragraphs_total: int
+    paragraphs_rendered: int = 0
+    created_at: datetime
+    updated_at: datetime
+    error: Optional[str] = None
+    document: Optional[DocumentArtifact] = None
+
+class OcrPage(BaseModel):
+    page: int
     text: str
+    engine: str
+    width: int
+    height: int
+    skew_angle: float
+    queued_ms: float
+    timings_ms: dict
+
+class OcrResult(BaseModel):
+    text: str
+    pages: List[OcrPage]
+    total_ms: float
+
+class UploadCreate(BaseModel):
+    filename: str
+    size: int = Field(..., ge=0)
+    media_type: str = "application/octet-stream"
+    # Optional checksum of the whole file, verified before processing
+    sha256: Optional[str] = None
+
+class UploadStatus(BaseModel):
+    id: str
+    filename: str
+    media_type: str
+    size: int
+    offset: int
+    complete: bool
+    expires_at: datetime
+
+class UploadComplete(BaseModel):
+    action: Literal["extract-pdf", "ocr", "docx"]
+    # docx: name of the generated document
+    filename: Optional[str] = None
+    # ocr: same options as /api/ocr
+    engine: Optional[str] = None
+    target_dpi: int = Field(300, ge=72, le=600)
+    deskew: bool = True
+    binarization: Literal["sauvola", "otsu"] = "sauvola"
+
+class SessionCreate(BaseModel):
+    text: str = Field(..., max_length=docx_max_text_chars)
+    title: Optional[str] = None
     filename: str = "extracted_text.docx"
 
+class SessionEdit(BaseModel):
+    op: Literal["insert", "replace", "delete"]
+    # Block index, counting from the first block after the title
+    index: int = Field(..., ge=0)
+    # Blocks replaced or deleted; ignored for insert
+    count: int = Field(1, ge=1)
+    # Parsed like a whole document: with LAYOUT_REFLOW wrapped lines join into paragraphs
+    # and lists and tables are detected, otherwise one block per non-blank line. "# " lines are headings
+    text: str = Field("", max_length=docx_max_text_chars)
+
+class SessionPatch(BaseModel):
+    # Rejects the edits with 409 if another client changed the document first
+    base_version: Optional[int] = None
+    ops: List[SessionEdit] = Field(..., min_length=1, max_length=1000)
+
+class SessionBlock(BaseModel):
+    kind: str
+    text: str
+    level: int
+    marker: str = ""
+
+class DocumentSessionInfo(BaseModel):
+    id: str
+    version: int
+    title: str
+    filename: str
+    blocks: int
+    url: str
+    expires_at: datetime
+    content: Optional[List[SessionBlock]] = None
+
+class ExtractionCreate(BaseModel):
+    text: str = Field(..., min_length=1)
+    title: Optional[str] = None
+    source: Optional[str] = None  # pdf, image, ...
+    # ISO 639-1 code or MongoDB language name; decides stemming and stop words
+    language: Optional[str] = None
+
+class Extraction(BaseModel):
+    id: str
+    title: str
+    source: Optional[str] = None
+    language: str
+    size: int
+    segments: int
+    created_at: datetime
+
+class ExtractionDetail(Extraction):
+    text: str
+
+class ExtractionPage(BaseModel):
+    items: List[Extraction]
+    next_cursor: Optional[str] = None
+
+class ExtractionHit(BaseModel):
+    extraction_id: str
+    title: str
+    created_at: datetime
+    segment: int
+    score: float
+    snippet: str
+
+class ExtractionSearchPage(BaseModel):
+    items: List[ExtractionHit]
+    next_cursor: Optional[str] = None
+
+class StatusBucket(BaseModel):
+    bucket: datetime
+    client_name: str
+    count: int
+
+class StatusStats(BaseModel):
+    granularity: str
+    since: datetime
+    until: datetime
+    buckets: List[StatusBucket]
+
 # Routes
 @api_router.get("/")
 async def root():
     return {"message": "OCR App Backend API"}
 
+# acknowledged: written before responding; buffered: batched, still awaited;
+# fire-and-forget: batched and not awaited
+Durability = Literal["acknowledged", "buffered", "fire-and-forget"]
+
+async def record_status_rollups(docs: List[dict]):
+    """
+    Add written status checks to the per-minute, per-client counters that
+    back /status/stats
+    """
+    counts = Counter(
+        (doc["client_name"], doc["timestamp"].replace(second=0, microsecond=0)) for doc in docs
+    )
+    await db.status_rollups.bulk_write(
+        [
+            UpdateOne({"minute": minute, "client_name": client_name}, {"$inc": {"count": count}}, upsert=True)
+            for (client_name, minute), count in counts.items()
+        ],
+        ordered=False,
+    )
+
+async def store_status_checks(status_objs: List[StatusCheck], durability: Optional[str]):
+    durability = durability or default_status_durability
+    docs = [status_obj.dict() for status_obj in status_objs]
+    if durability == "acknowledged":
+        if len(docs) == 1:
+            await db.status_checks.insert_one(docs[0])
+        else:
+            await db.status_checks.insert_many(docs, ordered=False)
+        await record_status_rollups(docs)
+        return
+    try:
+        written = status_buffer.submit(docs, wait=durability == "buffered")
+    except StatusBufferFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    if written is not None:
+        await written
+
 @api_router.post("/status", response_model=StatusCheck)
-async def create_status_check(input: StatusCheckCreate):
+async def create_status_check(input: StatusCheckCreate, durability: Optional[Durability] = None):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
+    await store_status_checks([status_obj], durability)
     return status_obj
 
-@api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+@api_router.post("/status/bulk", response_model=List[StatusCheck])
+async def create_status_checks_bulk(inputs: List[StatusCheckCreate], durability: Optional[Durability] = None):
+    status_objs = [StatusCheck(**input.dict()) for input in inputs]
+    if status_objs:
+        await store_status_checks(status_objs, durability)
+    return status_objs
+
+STATS_DEFAULT_WINDOWS = {"minute": timedelta(hours=6), "hour": timedelta(days=7), "day": timedelta(days=90)}
+
+@api_router.get("/status/stats", response_model=StatusStats)
+async def get_status_stats(
+    granularity: Literal["minute", "hour", "day"] = "hour",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    client_name: Optional[str] = None,
+    source: Literal["rollup", "raw"] = "rollup",
+):
+    """
+    Count status checks per client per minute, hour or day.
+
+    Reads the per-minute rollups by default; ``source=raw`` scans
+    status_checks instead, e.g. to verify or rebuild the rollups.
+    """
+    until = as_naive_utc(until) or datetime.utcnow()
+    since = as_naive_utc(since) or until - STATS_DEFAULT_WINDOWS[granularity]
+
+    if source == "rollup":
+        collection, time_field, count = read_heavy_db().status_rollups, "minute", "$count"
+    else:
+        collection, time_field, count = read_heavy_db().status_checks, "timestamp", 1
+
+    match = {time_field: {"$gte": since, "$lt": until}}
+    if client_name:
+        match["client_name"] = client_name
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "client_name": "$client_name",
+                "bucket": {"$dateTrunc": {"date": f"${time_field}", "unit": granularity}},
+            },
+            "count": {"$sum": count},
+        }},
+        {"$sort": {"_id.bucket": 1, "_id.client_name": 1}},
+    ]
+    buckets = [
+        StatusBucket(bucket=row["_id"]["bucket"], client_name=row["_id"]["client_name"], count=row["count"])
+        async for row in collection.aggregate(pipeline)
+    ]
+    return StatusStats(granularity=granularity, since=since, until=until, buckets=buckets)
+
+@api_router.get("/status/ingest-stats")
+async def get_status_ingest_stats():
+    return status_buffer.stats()
+
+STATUS_FIELDS = ("id", "client_name", "timestamp")
+
+def encode_status_cursor(doc: dict) -> str:
+    raw = json.dumps([doc["timestamp"].isoformat(), doc["id"]]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_status_cursor(cursor: str):
+    try:
+        timestamp, status_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(timestamp), status_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def as_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Timestamps are stored as naive UTC, so compare against the same
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def encode_status(doc: dict, fields) -> str:
+    return json.dumps({
+        field: doc[field].isoformat() if isinstance(doc[field], datetime) else doc[field]
+        for field in fields if field in doc
+    })
+
+@api_router.get("/status")
+async def get_status_checks(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    client_name: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated subset of id,client_name,timestamp"),
+):
+    """
+    List status checks oldest first, one page at a time.
+
+    Pass the returned ``next_cursor`` back as ``cursor`` to get the next page;
+    it is null once the last page has been reached.
+    """
+    selected = STATUS_FIELDS
+    if fields:
+        selected = tuple(field.strip() for field in fields.split(',') if field.strip())
+        unknown = set(selected) - set(STATUS_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    query = {}
+    if client_name:
+        query["client_name"] = client_name
+    since, until = as_naive_utc(since), as_naive_utc(until)
+    if since or until:
+        query["timestamp"] = {}
+        if since:
+            query["timestamp"]["$gte"] = since
+        if until:
+            query["timestamp"]["$lt"] = until
+    if cursor:
+        after_timestamp, after_id = decode_status_cursor(cursor)
+        query["$or"] = [
+            {"timestamp": {"$gt": after_timestamp}},
+            {"timestamp": after_timestamp, "id": {"$gt": after_id}},
+        ]
+
+    # timestamp and id are always fetched because the cursor is built from them
+    projection = {"_id": 0, "id": 1, "timestamp": 1, **{field: 1 for field in selected}}
+    status_cursor = (
+        read_heavy_db().status_checks.find(query, projection)
+        .sort([("timestamp", 1), ("id", 1)])
+        .limit(limit)
+        .batch_size(min(limit, 200))
+    )
+
+    async def stream_page():
+        yield '{"items":['
+        count = 0
+        last = None
+        async for doc in status_cursor:
+            yield (',' if count else '') + encode_status(doc, selected)
+            count += 1
+            last = doc
+        next_cursor = encode_status_cursor(last) if last is not None and count == limit else None
+        yield '],"next_cursor":' + json.dumps(next_cursor) + '}'
+
+    return StreamingResponse(stream_page(), media_type="application/json")
+
+EXTRACTION_SUMMARY = {"_id": 0, "id": 1, "title": 1, "source": 1, "language": 1, "size": 1,
+                      "segments": 1, "created_at": 1}
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+# Ids the app generates once per install; long and random enough to act as the key to its history
+CLIENT_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{16,128}")
+
+def extraction_owner(x_client_id: Optional[str] = Header(None)) -> str:
+    """
+    Saved extractions belong to the client that saved them, named by its
+    X-Client-Id header; every read, search and delete is scoped to it
+    """
+    if not x_client_id or not CLIENT_ID_PATTERN.fullmatch(x_client_id):
+        raise HTTPException(
+            status_code=400,
+            detail="X-Client-Id header of 16 to 128 letters, digits, '-' or '_' is required",
+        )
+    return x_client_id
+
+def prepare_extraction(text: str):
+    # Compressing and splitting a long transcript is CPU work, so it runs off the event loop
+    return compress_text(text), list(split_segments(text))
+
+@api_router.post("/extractions", response_model=Extraction, status_code=201)
+async def create_extraction(request: ExtractionCreate, owner: str = Depends(extraction_owner)):
+    """
+    Save an extracted transcript to the searchable history
+    """
+    if len(request.text) > extraction_max_chars:
+        raise HTTPException(status_code=413, detail=f"Extractions are limited to {extraction_max_chars} characters")
+    compressed, segments = await run_in_threadpool(prepare_extraction, request.text)
+    language = normalize_language(request.language)
+    first_line = next((line.strip() for line in request.text.splitlines() if line.strip()), "")
+    extraction = Extraction(
+        id=str(uuid.uuid4()),
+        title=(request.title or first_line[:80] or "Untitled").strip(),
+        source=request.source,
+        language=language,
+        size=len(request.text),
+        segments=len(segments),
+        created_at=datetime.utcnow(),
+    )
+
+    try:
+        await db.extractions.insert_one({**extraction.dict(), "owner": owner, "content": Binary(compressed)})
+        if segments:
+            await db.extraction_segments.insert_many([
+                {"extraction_id": extraction.id, "owner": owner, "seq": seq, "text": text, "language": language}
+                for seq, text in enumerate(segments)
+            ], ordered=False)
+    except Exception as e:
+        logger.error(f"Error saving extraction: {str(e)}")
+        await db.extractions.delete_one({"id": extraction.id})
+        await db.extraction_segments.delete_many({"extraction_id": extraction.id})
+        raise HTTPException(status_code=500, detail=f"Error saving extraction: {str(e)}")
+    return extraction
+
+@api_router.get("/extractions", response_model=ExtractionPage)
+async def list_extractions(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    owner: str = Depends(extraction_owner),
+):
+    """
+    List the client's saved extractions newest first, without their text
+    """
+    query = {"owner": owner}
+    if cursor:
+        try:
+            created_at, extraction_id = decode_cursor(cursor)
+            created_at, extraction_id = datetime.fromisoformat(created_at), str(extraction_id)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$gt": extraction_id}},
+        ]
+    docs = await (
+        read_heavy_db().extractions.find(query, EXTRACTION_SUMMARY)
+        .sort([("created_at", -1), ("id", 1)])
+        .limit(limit)
+        .to_list(limit)
+    )
+    next_cursor = None
+    if len(docs) == limit:
+        next_cursor = encode_cursor([docs[-1]["created_at"].isoformat(), docs[-1]["id"]])
+    return ExtractionPage(items=[Extraction(**doc) for doc in docs], next_cursor=next_cursor)
+
+@api_router.get("/extractions/search", response_model=ExtractionSearchPage)
+async def search_extractions(
+    q: str = Query(..., min_length=1, max_length=500),
+    language: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    owner: str = Depends(extraction_owner),
+):
+    """
+    Full-text search over the client's saved extractions, best matches first.
+
+    Each hit is one segment of a transcript with a snippet around the match;
+    pass ``next_cursor`` back as ``cursor`` for the next page.
+    """
+    text_query = {"$search": q}
+    if language:
+        text_query["$language"] = normalize_language(language)
+    pipeline = [
+        {"$match": {"$text": text_query, "owner": owner}},
+        {"$project": {"_id": 0, "extraction_id": 1, "seq": 1, "text": 1, "score": {"$meta": "textScore"}}},
+    ]
+    if cursor:
+        try:
+            score, extraction_id, seq = decode_cursor(cursor)
+            score, seq = float(score), int(seq)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        pipeline.append({"$match": {"$or": [
+            {"score": {"$lt": score}},
+            {"score": score, "extraction_id": {"$gt": extraction_id}},
+            {"score": score, "extraction_id": extraction_id, "seq": {"$gt": seq}},
+        ]}})
+    pipeline += [
+        {"$sort": {"score": -1, "extraction_id": 1, "seq": 1}},
+        {"$limit": limit},
+        # Only the page's hits are joined, and only to the transcript's summary fields
+        {"$lookup": {
+            "from": "extractions",
+            "localField": "extraction_id",
+            "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, "title": 1, "created_at": 1}}],
+            "as": "extraction",
+        }},
+        {"$unwind": "$extraction"},
+    ]
+
+    try:
+        hits = await read_heavy_db().extraction_segments.aggregate(pipeline).to_list(limit)
+    except Exception as e:
+        logger.error(f"Error searching extractions: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error searching extractions: {str(e)}")
+
+    terms = search_terms(q)
+    items = [
+        ExtractionHit(
+            extraction_id=hit["extraction_id"],
+            title=hit["extraction"]["title"],
+            created_at=hit["extraction"]["created_at"],
+            segment=hit["seq"],
+            score=hit["score"],
+            snippet=make_snippet(hit["text"], terms),
+        )
+        for hit in hits
+    ]
+    next_cursor = None
+    if len(hits) == limit:
+        last = hits[-1]
+        next_cursor = encode_cursor([last["score"], last["extraction_id"], last["seq"]])
+    return ExtractionSearchPage(items=items, next_cursor=next_cursor)
+
+@api_router.get("/extractions/{extraction_id}", response_model=ExtractionDetail)
+async def get_extraction(extraction_id: str, owner: str = Depends(extraction_owner)):
+    doc = await db.extractions.find_one({"id": extraction_id, "owner": owner}, {**EXTRACTION_SUMMARY, "content": 1})
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Extraction not found")
+    text = await run_in_threadpool(decompress_text, doc.pop("content"))
+    return ExtractionDetail(**doc, text=text)
+
+@api_router.delete("/extractions/{extraction_id}", status_code=204)
+async def delete_extraction(extraction_id: str, owner: str = Depends(extraction_owner)):
+    result = await db.extractions.delete_one({"id": extraction_id, "owner": owner})
+    if not result.deleted_count:
+        raise HTTPException(status_code=404, detail="Extraction not found")
+    await db.extraction_segments.delete_many({"extraction_id": extraction_id})
+    return Response(status_code=204)
+
+def export_cache_key(text: str, fmt: str, streamed: bool, **options) -> str:
+    return DocumentCache.key(
+        text, format=fmt, mode=docx_render_mode, streamed=streamed, version=RENDER_VERSION,
+        layout=layout_signature(), **options
+    )
+
+def docx_cache_key(text: str, streamed: bool, **options) -> str:
+    return export_cache_key(text, "docx", streamed, **options)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f"W/{etag}" in candidates
+
+async def export_document(text: str, fmt: str, filename: Optional[str], if_none_match: Optional[str],
+                          range_header: Optional[str] = None, if_range: Optional[str] = None):
+    """
+    Render ``text`` in any registered export format, through the document
+    cache and with the same ETag, streaming and pool handling for all of them.
+
+    A Range header (a resumed download) is honoured only from the cached
+    bytes; on a cache miss the whole file is sent with a 200.
+    """
+    try:
+        exporter = get_exporter(fmt)
+    except UnknownExportFormat as e:
+        raise HTTPException(status_code=404, detail=f"{str(e)}; expected one of {', '.join(EXPORTERS)}")
+    # python-docx mode renders from the raw text and cannot stream
+    legacy = exporter.name == 'docx' and docx_render_mode != 'template'
+    streamed = docx_streaming and not legacy
+
+    # Identical text and options always render identical bytes, so the hash doubles as ETag
+    cache_key = export_cache_key(text, exporter.name, streamed=streamed)
+    etag = f'"{cache_key}"'
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    headers = {
+        "Content-Disposition": content_disposition(filename or 'extracted_text' + exporter.extension),
+        "ETag": etag,
+    }
+    cached = await run_in_threadpool(document_cache.get, cache_key)
+    if cached is not None:
+        headers["X-Cache"] = "HIT"
+        return bytes_response(cached, exporter.media_type, headers, range_header, if_range)
+    headers["X-Cache"] = "MISS"
+    # A resumed download may only be sliced from the bytes it started on; a
+    # fresh render is not those bytes, so the whole file is sent with a 200
+    range_header = if_range = None
+
+    try:
+        if legacy:
+            result = await render_pool.submit(build_docx, text)
+        else:
+            # One parse per text, however many formats it is exported to
+            layout = await run_in_threadpool(layout_cache.get, [text])
+            # Rejected before any of a streamed response is sent
+            await run_in_threadpool(exporter.check, layout)
+            if streamed:
+                # Write the file straight into the response as blocks are rendered
+                body = document_cache.tee(cache_key, render_pool.stream(stream_export, exporter.name, layout))
+            else:
+                # Render on the worker pool so the event loop stays responsive
+                result = await render_pool.submit(render_export, exporter.name, layout)
+        if not streamed:
+            await run_in_threadpool(document_cache.put, cache_key, result.data)
+            headers["Server-Timing"] = result.server_timing()
+    except RenderPoolSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except UnsupportedExportText as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error generating {exporter.name.upper()}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error generating {exporter.name.upper()}: {str(e)}")
+
+    if not streamed:
+        return bytes_response(result.data, exporter.media_type, headers)
+    # Length is unknown until the last block is written; once cached, a resumed request can be sliced
+    headers["Accept-Ranges"] = "bytes"
+    return StreamingResponse(body, media_type=exporter.media_type, headers=headers)
 
 @api_router.post("/generate-docx")
-async def generate_docx(request: TextToDocxRequest):
+async def generate_docx(
+    request: TextToDocxRequest,
+    if_none_match: Optional[str] = Header(None),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None),
+):
     """
     Generate a DOCX file from extracted text
     """
+    return await export_document(request.text, "docx", request.filename, if_none_match, range_header, if_range)
+
+@api_router.get("/export/formats")
+async def get_export_formats():
+    return [
+        {"format": exporter.name, "extension": exporter.extension, "media_type": exporter.media_type}
+        for exporter in EXPORTERS.values()
+    ]
+
+@api_router.post("/export/{fmt}")
+async def export_text(
+    fmt: str,
+    request: ExportRequest,
+    if_none_match: Optional[str] = Header(None),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None),
+):
+    """
+    Export extracted text as docx, odt, pdf, html, md or txt
+    """
+    return await export_document(request.text, fmt, request.filename, if_none_match, range_header, if_range)
+
+async def render_cached(cache_key: str, fn, *args) -> bytes:
+    """
+    Render through the cache, waiting for pool capacity instead of failing
+    """
+    cached = await run_in_threadpool(document_cache.get, cache_key)
+    if cached is not None:
+        return cached
+    result = await render_pool.submit(fn, *args, wait=True)
+    await run_in_threadpool(document_cache.put, cache_key, result.data)
+    return result.data
+
+async def stream_batch_zip(items: List[TextToDocxRequest]):
+    """
+    Render batch items concurrently and emit each zip member as soon as it is done
+    """
+    render = render_docx if docx_render_mode == 'template' else build_docx
+    # Keep at most one job per worker in flight so a batch cannot monopolise the queue
+    slots = asyncio.Semaphore(render_pool.workers)
+
+    async def render_item(index: int, item: TextToDocxRequest):
+        async with slots:
+            try:
+                return index, await render_cached(docx_cache_key(item.text, streamed=False), render, item.text), None
+            except Exception as e:
+                return index, None, str(e)
+
+    tasks = [asyncio.create_task(render_item(i, item)) for i, item in enumerate(items)]
+    writer = ZipStreamWriter()
+    errors = []
     try:
-        # Create a new Document
-        doc = Document()
-        
-        # Add a title
-        heading = doc.add_heading('Extracted Text', level=1)
-        
-        # Split text into paragraphs and add them
-        paragraphs = request.text.split('\n')
-        for para in paragraphs:
-            if para.strip():  # Only add non-empty paragraphs
-                p = doc.add_paragraph(para)
-                # Set font size
-                for run in p.runs:
-                    run.font.size = Pt(11)
-        
-        # Save to bytes buffer
-        docx_buffer = io.BytesIO()
-        doc.save(docx_buffer)
-        docx_buffer.seek(0)
-        
-        # Return as streaming response
+        for finished in asyncio.as_completed(tasks):
+            index, data, error = await finished
+            if error is not None:
+                logger.error(f"Error generating DOCX for batch item {index}: {error}")
+                errors.append({"index": index, "filename": items[index].filename, "detail": error})
+                continue
+            yield writer.add(items[index].filename, data)
+        if errors:
+            yield writer.add("errors.json", json.dumps(errors, indent=2).encode('utf-8'))
+        yield writer.close()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+@api_router.post("/generate-docx/batch")
+async def generate_docx_batch(request: BatchDocxRequest):
+    """
+    Generate DOCX files for many texts in one request, either as a zip of
+    separate documents or merged into one document with page breaks
+    """
+    if len(request.items) > docx_batch_max_items:
+        raise HTTPException(status_code=413, detail=f"Batch is limited to {docx_batch_max_items} items")
+
+    if not request.merge:
         return StreamingResponse(
-            docx_buffer,
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={
-                "Content-Disposition": f"attachment; filename={request.filename}"
-            }
+            stream_batch_zip(request.items),
+            media_type="application/zip",
+            headers={"Content-Disposition": content_disposition(request.filename or 'extracted_documents.zip')}
         )
+
+    pages = [item.text for item in request.items]
+    streamed = docx_streaming
+    cache_key = docx_cache_key("\x0c".join(pages), streamed=streamed, merged=True)
+    headers = {"Content-Disposition": content_disposition(request.filename or 'extracted_text.docx')}
+    cached = await run_in_threadpool(document_cache.get, cache_key)
+    if cached is not None:
+        return bytes_response(cached, DOCX_MEDIA_TYPE, headers)
+
+    try:
+        if streamed:
+            body = document_cache.tee(cache_key, render_pool.stream(stream_docx_pages, pages))
+        else:
+            result = await render_pool.submit(render_docx_pages, pages)
+            await run_in_threadpool(document_cache.put, cache_key, result.data)
+            return bytes_response(result.data, DOCX_MEDIA_TYPE, headers)
+    except RenderPoolSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.error(f"Error generating merged DOCX: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error generating DOCX: {str(e)}")
+
+    return StreamingResponse(body, media_type=DOCX_MEDIA_TYPE, headers=headers)
+
+def artifact_response(artifact) -> DocumentArtifact:
+    return DocumentArtifact(
+        id=artifact.id,
+        url=f"{api_router.prefix}/documents/{artifact.id}",
+        filename=artifact.filename,
+        size=artifact.size,
+        expires_at=datetime.utcfromtimestamp(artifact.expires_at),
+    )
+
+async def store_docx_artifact(text: str, filename: str) -> DocumentArtifact:
+    render = render_docx if docx_render_mode == 'template' else build_docx
+    try:
+        data = await render_cached(docx_cache_key(text, streamed=False), render, text)
     except Exception as e:
         logger.error(f"Error generating DOCX: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating DOCX: {str(e)}")
 
+    artifact = await run_in_threadpool(artifact_store.save, data, filename, DOCX_MEDIA_TYPE)
+    return artifact_response(artifact)
+
+@api_router.post("/documents", response_model=DocumentArtifact)
+async def create_document(request: TextToDocxRequest):
+    """
+    Render a DOCX into the artifact store and return a short-lived download URL
+    """
+    return await store_docx_artifact(request.text, request.filename)
+
+@api_router.api_route("/documents/{artifact_id}", methods=["GET", "HEAD"])
+async def download_document(
+    artifact_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None),
+):
+    """
+    Download a stored document; Range requests resume an interrupted download
+    """
+    artifact = await run_in_threadpool(artifact_store.get, artifact_id)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="Document not found or expired")
+    # Artifacts never change once written, so the id is a strong validator
+    headers = {"ETag": f'"{artifact.id}"', "Content-Disposition": content_disposition(artifact.filename)}
+    return await run_in_threadpool(file_response, artifact.path, artifact.media_type, headers, range_header, if_range)
+
+async def update_export_job(job_id: str, **fields):
+    fields["updated_at"] = datetime.utcnow()
+    await db.export_jobs.update_one({"id": job_id}, {"$set": fields})
+
+async def run_export_job(job_id: str, filename: str, layout: Layout):
+    async with export_job_slots:
+        await update_export_job(job_id, status="running")
+        # Stream the document straight into the artifact store under the job id
+        writer = await run_in_threadpool(artifact_store.open_writer, filename, DOCX_MEDIA_TYPE, job_id)
+        rendered = 0
+        try:
+            # A job has no client waiting on it, so it waits for the pool rather than failing
+            await render_pool.wait_for_capacity()
+            chunks = render_pool.stream(stream_docx_progress, layout)
+            reported = time.monotonic()
+            try:
+                async for chunk, rendered in chunks:
+                    await run_in_threadpool(writer.write, chunk)
+                    if time.monotonic() - reported >= 1:
+                        await update_export_job(job_id, paragraphs_rendered=rendered)
+                        reported = time.monotonic()
+            finally:
+                await chunks.aclose()
+            artifact = await run_in_threadpool(writer.commit)
+        except Exception as e:
+            writer.abort()
+            logger.error(f"Error running export job {job_id}: {str(e)}")
+            await update_export_job(job_id, status="failed", error=str(e))
+            return
+        except BaseException:
+            writer.abort()
+            raise
+        await update_export_job(
+            job_id,
+            status="done",
+            paragraphs_rendered=rendered,
+            document=artifact_response(artifact).dict(),
+        )
+
+@api_router.post("/export-jobs", response_model=ExportJob, status_code=202)
+async def create_export_job(request: TextToDocxRequest):
+    """
+    Queue a DOCX export and return immediately; poll the job for progress
+    """
+    if len(export_job_tasks) >= export_job_queue_max:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Export job queue is full ({export_job_queue_max} jobs)",
+            headers={"Retry-After": "5"},
+        )
+    now = datetime.utcnow()
+    # Parsing a long text is CPU work; the job renders this same layout, so it is parsed once
+    layout = await run_in_threadpool(layout_cache.get, [request.text])
+    job = ExportJob(
+        id=artifact_store.new_id(),
+        status="queued",
+        filename=request.filename,
+        paragraphs_total=layout.paragraphs,
+        created_at=now,
+        updated_at=now,
+    )
+    await db.export_jobs.insert_one(
+        {**job.dict(), "expires_at": now + timedelta(seconds=export_job_record_ttl)}
+    )
+
+    task = asyncio.create_task(run_export_job(job.id, request.filename, layout))
+    export_job_tasks[job.id] = task
+    task.add_done_callback(lambda _: export_job_tasks.pop(job.id, None))
+    return job
+
+async def fail_orphaned_export_jobs() -> int:
+    """
+    Mark unfinished jobs whose process stopped touching them (a restart or
+    crash) as failed, so pollers stop waiting on them
+    """
+    stale = datetime.utcnow() - timedelta(seconds=export_job_heartbeat * 3)
+    result = await db.export_jobs.update_many(
+        {"status": {"$in": ["queued", "running"]}, "updated_at": {"$lt": stale}},
+        {"$set": {
+            "status": "failed",
+            "error": "Export job was interrupted by a server restart",
+            "updated_at": datetime.utcnow(),
+        }},
+    )
+    return result.modified_count
+
+async def export_job_heartbeats():
+    while True:
+        try:
+            if export_job_tasks:
+                await db.export_jobs.update_many(
+                    {"id": {"$in": list(export_job_tasks)}, "status": {"$in": ["queued", "running"]}},
+                    {"$set": {"updated_at": datetime.utcnow()}},
+                )
+            failed = await fail_orphaned_export_jobs()
+            if failed:
+                logger.warning(f"Marked {failed} orphaned export jobs as failed")
+        except Exception as e:
+            logger.error(f"Error updating export job heartbeats: {str(e)}")
+        await asyncio.sleep(export_job_heartbeat)
+
+@api_router.get("/export-jobs/{job_id}", response_model=ExportJob)
+async def get_export_job(job_id: str):
+    job = await db.export_jobs.find_one({"id": job_id}, {"_id": 0})
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return ExportJob(**job)
+
+@api_router.api_route("/export-jobs/{job_id}/document", methods=["GET", "HEAD"])
+async def download_export_job(
+    job_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None),
+):
+    job = await get_export_job(job_id)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Export job is {job.status}")
+    return await download_document(job_id, range_header, if_range)
+
+def unlink_quietly(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def spool_upload(upload: UploadFile, max_bytes: int, suffix: str = "") -> str:
+    """
+    Copy an upload to a named temp file in chunks, enforcing a size limit
+    """
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = upload.file.read(1024 * 1024)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Upload exceeds {max_bytes} bytes")
+                out.write(chunk)
+    except BaseException:
+        unlink_quietly(path)
+        raise
+    return path
+
+async def stream_pdf_pages(path: str, page_count: int):
+    """
+    Extract pages in parallel, emitting one NDJSON line per page in page order.
+
+    A page that fails gets an {"page", "error"} line instead of its text, and
+    the stream always ends with a status line, {"done": true, "pages",
+    "failed"}, or {"done": false, "error"} if extraction stopped early.
+    """
+    # Only a window of jobs is in flight so extracted text never piles up in memory
+    window = render_pool.workers * 2
+    jobs = deque()
+    failed = 0
+    try:
+        for start in range(0, page_count, pdf_pages_per_job):
+            stop = min(start + pdf_pages_per_job, page_count)
+            jobs.append((start, stop, asyncio.ensure_future(
+                render_pool.submit(extract_pdf_pages, path, start, stop, wait=True)
+            )))
+            while len(jobs) >= window or (jobs and stop == page_count):
+                first_page, last_page, job = jobs.popleft()
+                try:
+                    pages = (await job).data
+                except Exception as e:
+                    logger.error(f"Error extracting PDF pages {first_page + 1}-{last_page}: {str(e)}")
+                    pages = [{"error": str(e)}] * (last_page - first_page)
+                failed += sum(1 for page in pages if "error" in page)
+                yield "".join(
+                    json.dumps({"page": first_page + offset + 1, **page}) + "\n"
+                    for offset, page in enumerate(pages)
+                )
+        yield json.dumps({"done": True, "pages": page_count, "failed": failed}) + "\n"
+    except Exception as e:
+        logger.error(f"Error streaming PDF pages: {str(e)}")
+        yield json.dumps({"done": False, "error": str(e)}) + "\n"
+    finally:
+        for _, _, job in jobs:
+            job.cancel()
+
+@api_router.post("/extract-pdf")
+async def extract_pdf(file: UploadFile = File(...)):
+    """
+    Extract text from an uploaded PDF, streamed back as NDJSON with one
+    {"page", "text"} (or {"page", "error"}) object per page followed by a
+    {"done", ...} status line
+    """
+    path = await run_in_threadpool(spool_upload, file, pdf_max_bytes, ".pdf")
+    try:
+        return await pdf_pages_response(path, lambda: unlink_quietly(path))
+    except BaseException:
+        unlink_quietly(path)
+        raise
+
+async def pdf_pages_response(path: str, cleanup) -> StreamingResponse:
+    """
+    Stream the pages of the PDF at ``path``; ``cleanup`` runs once the
+    response has been sent, and is left to the caller if this raises
+    """
+    try:
+        page_count = (await render_pool.submit(count_pdf_pages, path, wait=True)).data
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read PDF: {str(e)}")
+
+    return StreamingResponse(
+        stream_pdf_pages(path, page_count),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(cleanup),
+    )
+
+async def read_upload(upload: UploadFile, max_bytes: int) -> bytes:
+    data = await upload.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"{upload.filename} exceeds {max_bytes} bytes")
+    return data
+
+@api_router.post("/ocr", response_model=OcrResult)
+async def ocr_images(
+    files: List[UploadFile] = File(...),
+    engine: Optional[str] = None,
+    target_dpi: int = Query(300, ge=72, le=600),
+    deskew: bool = True,
+    binarization: Literal["sauvola", "otsu"] = "sauvola",
+):
+    """
+    Recognize text in uploaded page images. Pages are preprocessed and
+    recognized concurrently on the worker pool, with per-stage timings.
+    """
+    if len(files) > ocr_max_pages:
+        raise HTTPException(status_code=413, detail=f"At most {ocr_max_pages} pages per request")
+    images = [await read_upload(upload, ocr_max_image_bytes) for upload in files]
+    return await run_ocr(images, engine, target_dpi, deskew, binarization)
+
+async def run_ocr(images: List[bytes], engine: Optional[str], target_dpi: int, deskew: bool,
+                  binarization: str) -> OcrResult:
+    engine = engine or ocr_engine
+    if engine == StubRecognizer.name and not ocr_allow_stub:
+        raise HTTPException(status_code=400, detail="The stub OCR engine is only available with OCR_ALLOW_STUB on")
+    try:
+        get_recognizer(engine)
+    except RecognizerUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    started = asyncio.get_running_loop().time()
+    try:
+        results = await asyncio.gather(*(
+            render_pool.submit(ocr_page, data, engine, target_dpi, deskew, binarization, wait=True) for data in images
+        ))
+    except Exception as e:
+        logger.error(f"Error running OCR: {str(e)}")
+        raise HTTPException(status_code=422, detail=f"Error running OCR: {str(e)}")
+
+    pages = [
+        OcrPage(page=index + 1, queued_ms=round(result.queued_ms, 2), **result.data)
+        for index, result in enumerate(results)
+    ]
+    return OcrResult(
+        text="\n\n".join(page.text.strip() for page in pages if page.text.strip()),
+        pages=pages,
+        total_ms=round((asyncio.get_running_loop().time() - started) * 1000, 2),
+    )
+
+def upload_status(upload) -> UploadStatus:
+    return UploadStatus(
+        id=upload.id,
+        filename=upload.filename,
+        media_type=upload.media_type,
+        size=upload.size,
+        offset=upload.offset,
+        complete=upload.complete,
+        expires_at=datetime.utcfromtimestamp(upload.expires_at),
+    )
+
+async def get_upload_or_404(upload_id: str):
+    upload = await run_in_threadpool(upload_store.get, upload_id)
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    return upload
+
+@api_router.post("/uploads", response_model=UploadStatus, status_code=201)
+async def create_upload(request: UploadCreate):
+    """
+    Start a resumable upload; send the bytes with PATCH in any number of chunks
+    """
+    try:
+        upload = await run_in_threadpool(
+            upload_store.create, request.filename, request.size, request.media_type, request.sha256
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return upload_status(upload)
+
+@api_router.get("/uploads/{upload_id}", response_model=UploadStatus)
+async def get_upload(upload_id: str):
+    return upload_status(await get_upload_or_404(upload_id))
+
+@api_router.head("/uploads/{upload_id}")
+async def get_upload_offset(upload_id: str):
+    upload = await get_upload_or_404(upload_id)
+    return Response(headers={"Upload-Offset": str(upload.offset), "Upload-Length": str(upload.size)})
+
+@api_router.patch("/uploads/{upload_id}", response_model=UploadStatus)
+async def append_upload_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., ge=0),
+    x_chunk_sha256: Optional[str] = Header(None),
+):
+    """
+    Append the request body at ``Upload-Offset``. The offset must equal the
+    bytes received so far (HEAD tells a resuming client where that is), and a
+    chunk that fails its ``X-Chunk-SHA256`` check is discarded.
+    """
+    upload = await get_upload_or_404(upload_id)
+    lock = upload_locks.setdefault(upload_id, asyncio.Lock())
+    if lock.locked():
+        raise HTTPException(status_code=409, detail="Another chunk is being written to this upload")
+    async with lock:
+        try:
+            writer = await run_in_threadpool(upload_store.open_chunk, upload, upload_offset)
+            try:
+                # Body chunks go straight to the spool file as they arrive
+                async for chunk in request.stream():
+                    if chunk:
+                        await run_in_threadpool(writer.write, chunk)
+            except BaseException:
+                await run_in_threadpool(writer.abort)
+                raise
+            await run_in_threadpool(writer.commit, x_chunk_sha256)
+        except UploadError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail,
+                                headers={"Upload-Offset": str(upload.offset)})
+        finally:
+            upload_locks.pop(upload_id, None)
+    return upload_status(upload)
+
+@api_router.delete("/uploads/{upload_id}", status_code=204)
+async def delete_upload(upload_id: str):
+    await get_upload_or_404(upload_id)
+    await run_in_threadpool(upload_store.delete, upload_id)
+    return Response(status_code=204)
+
+@api_router.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str, request: UploadComplete):
+    """
+    Hand a fully received upload to a pipeline: ``extract-pdf`` streams page
+    text like /api/extract-pdf, ``ocr`` returns the same result as /api/ocr and
+    ``docx`` renders the uploaded text into a downloadable document
+    """
+    upload = await get_upload_or_404(upload_id)
+    if not upload.complete:
+        raise HTTPException(status_code=409, detail=f"Upload has {upload.offset} of {upload.size} bytes")
+    if not await run_in_threadpool(upload_store.verify, upload):
+        raise HTTPException(status_code=422, detail="Upload checksum mismatch")
+
+    def cleanup():
+        upload_store.delete(upload_id)
+
+    # Rejected or failed uploads are kept until they expire, so the client can retry
+    if request.action == "extract-pdf":
+        return await pdf_pages_response(upload.path, cleanup)
+
+    if request.action == "ocr":
+        if upload.size > ocr_max_image_bytes:
+            raise HTTPException(status_code=413, detail=f"Images are limited to {ocr_max_image_bytes} bytes")
+        data = await run_in_threadpool(Path(upload.path).read_bytes)
+        result = await run_ocr([data], request.engine, request.target_dpi, request.deskew, request.binarization)
+    else:
+        # UTF-8 takes at most four bytes per character, so a larger file is too long whatever it holds
+        if upload.size > docx_max_text_chars * 4:
+            raise HTTPException(status_code=413, detail=f"Text is limited to {docx_max_text_chars} characters")
+        text = (await run_in_threadpool(Path(upload.path).read_bytes)).decode('utf-8', errors='replace')
+        if len(text) > docx_max_text_chars:
+            raise HTTPException(status_code=413, detail=f"Text is limited to {docx_max_text_chars} characters")
+        filename = request.filename or f"{os.path.splitext(upload.filename)[0]}.docx"
+        result = await store_docx_artifact(text, filename)
+    await run_in_threadpool(cleanup)
+    return result
+
+def session_info(session, include_blocks: bool = False) -> DocumentSessionInfo:
+    content = None
+    if include_blocks:
+        content = [
+            SessionBlock(kind=block.kind, text=block.text, level=block.level, marker=block.marker)
+            for block in session.blocks()
+        ]
+    return DocumentSessionInfo(
+        id=session.id,
+        version=session.version,
+        title=session.title,
+        filename=session.filename,
+        blocks=len(session),
+        url=f"{api_router.prefix}/sessions/{session.id}/document",
+        expires_at=datetime.utcfromtimestamp(session.expires_at),
+        content=content,
+    )
+
+def get_session_or_404(session_id: str):
+    try:
+        return session_store.get(session_id)
+    except SessionError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+def with_session_lock(session, fn, *args):
+    # Edits and renders of one session are serialized; other sessions proceed in parallel
+    with session.lock:
+        return fn(*args)
+
+@api_router.post("/sessions", response_model=DocumentSessionInfo, status_code=201)
+async def create_session(request: SessionCreate):
+    """
+    Parse a document once and keep it for paragraph-level edits
+    """
+    session = await run_in_threadpool(
+        session_store.create, request.text, request.title or DEFAULT_TITLE, request.filename
+    )
+    return session_info(session)
+
+@api_router.get("/sessions/{session_id}", response_model=DocumentSessionInfo)
+async def get_session(session_id: str, include_blocks: bool = False):
+    return session_info(get_session_or_404(session_id), include_blocks)
+
+@api_router.patch("/sessions/{session_id}", response_model=DocumentSessionInfo)
+async def edit_session(session_id: str, request: SessionPatch):
+    """
+    Apply insert, replace and delete edits by block index, all or none
+    """
+    session = get_session_or_404(session_id)
+    ops = [EditOp(op=edit.op, index=edit.index, count=edit.count, text=edit.text) for edit in request.ops]
+    try:
+        await run_in_threadpool(with_session_lock, session, session.apply, ops, request.base_version)
+    except SessionError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    await run_in_threadpool(session_store.fit)
+    return session_info(session)
+
+@api_router.api_route("/sessions/{session_id}/document", methods=["GET", "HEAD"])
+async def download_session_document(
+    session_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None),
+):
+    """
+    DOCX of the session's current version; only edited parts are recompressed
+    """
+    session = get_session_or_404(session_id)
+    started = asyncio.get_running_loop().time()
+    data, version, recompressed = await run_in_threadpool(
+        with_session_lock, session, lambda: (session.render(get_template()), session.version, session.last_recompressed)
+    )
+    await run_in_threadpool(session_store.fit)
+    headers = {
+        "ETag": f'"{session.id}.{version}"',
+        "Content-Disposition": content_disposition(session.filename),
+        "X-Session-Version": str(version),
+        "Server-Timing": f"render;dur={(asyncio.get_running_loop().time() - started) * 1000:.1f}",
+        "X-Recompressed-Segments": str(recompressed),
+    }
+    return bytes_response(data, DOCX_MEDIA_TYPE, headers, range_header, if_range)
+
+@api_router.delete("/sessions/{session_id}", status_code=204)
+async def delete_session(session_id: str):
+    try:
+        session_store.delete(session_id)
+    except SessionError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return Response(status_code=204)
+
+@api_router.get("/render/stats")
+async def get_render_stats():
+    return {
+        **render_pool.stats(),
+        "cache": document_cache.stats(),
+        "layout_cache": layout_cache.stats(),
+        "sessions": session_store.stats(),
+    }
+
+@api_router.get("/admission/stats")
+async def get_admission_stats():
+    return {"rate_limits": rate_limiter.stats(), "fair_queue": render_pool.fair_queue.stats()}
+
+@api_router.get("/ready")
+async def get_readiness():
+    """
+    Readiness probe: 200 once Mongo answers a ping and the render pool is up,
+    503 otherwise. The body reports the connection pools either way.
+    """
+    checks = {"render_pool": render_pool.started, "mongo": False}
+    mongo = {"pools": mongo_pool_state.stats()}
+    if db is None:
+        mongo["error"] = "not connected"
+    else:
+        try:
+            await asyncio.wait_for(db.command("ping"), timeout=ready_ping_timeout)
+            checks["mongo"] = True
+        except Exception as e:
+            mongo["error"] = str(e) or type(e).__name__
+        # Motor proxies unknown attributes to databases, so ask the wrapped pymongo client
+        topology = getattr(getattr(client, "delegate", None), "topology_description", None)
+        if isinstance(topology, TopologyDescription):
+            mongo["topology"] = topology.topology_type_name
+            mongo["servers"] = {
+                f"{host}:{port}": server.server_type_name
+                for (host, port), server in topology.server_descriptions().items()
+            }
+    ready = all(checks.values())
+    body = {"ready": ready, "checks": checks, "mongo": mongo, "render_pool": render_pool.stats()}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@api_router.get("/db/pool")
+async def get_db_pool_stats():
+    """
+    Connection pool settings and per-server usage, for sizing MONGO_MAX_POOL_SIZE
+    """
+    settings = None
+    if mongo_settings is not None:
+        settings = {
+            "max_pool_size": mongo_settings.max_pool_size,
+            "min_pool_size": mongo_settings.min_pool_size,
+            "max_connecting": mongo_settings.max_connecting,
+            "wait_queue_timeout_ms": mongo_settings.wait_queue_timeout_ms,
+            "compressors": list(mongo_settings.compressors),
+            "read_preference": mongo_settings.read_preference,
+            "read_heavy_preference": mongo_settings.read_heavy_preference,
+        }
+    return {"settings": settings, "pools": mongo_pool_state.stats()}
+
+render_pool_pending = registry.gauge("render_pool_pending_jobs", "Render jobs running or queued")
+status_buffer_depth = registry.gauge("status_buffer_queue_depth", "Status checks waiting to be flushed")
+mongo_pool_connections = registry.gauge(
+    "mongo_pool_connections", "MongoDB connections per server by state", ("address", "state"))
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus scrape endpoint
+    """
+    render_pool_pending.set(render_pool.stats()["pending"])
+    status_buffer_depth.set(status_buffer.stats()["queue_depth"])
+    for address, pool in mongo_pool_state.stats().items():
+        for state in ("open", "checked_out", "waiting"):
+            mongo_pool_connections.set(pool[state], address=address, state=state)
+    return Response(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -107,6 +1480,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Text-like responses only; documents keep their exact length and byte ranges
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_BYTES', '1024')),
+    gzip_level=int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6')),
+    brotli_quality=int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4')),
+)
+
+# Rate limits and body caps run before compression and routing, but inside metrics so rejections are counted
+app.add_middleware(
+    AdmissionMiddleware,
+    limiter=rate_limiter,
+    max_json_bytes=int(os.environ.get('REQUEST_MAX_JSON_BYTES', '10485760')),
+    client_header=os.environ.get('RATE_LIMIT_CLIENT_HEADER', ''),
+    trust_forwarded=os.environ.get('RATE_LIMIT_TRUST_FORWARDED', 'false').lower() == 'true',
+    # Upload chunks are streamed to disk whatever their Content-Type
+    raw_body_routes=["PATCH /api/uploads/{upload_id}"],
+)
+
+# Added last so it is outermost and times everything else
+app.add_middleware(MetricsMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -114,6 +1509,126 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def connect_to_mongo():
+    global client, db, replica_db, mongo_settings
+    # A client injected before startup (tests, benchmarks) is kept as is
+    if client is None:
+        mongo_settings = MongoSettings.from_env()
+        # Every command motor sends is timed into the mongo_command_duration_seconds histogram
+        client = create_client(mongo_settings, event_listeners=[MongoCommandTimer(), mongo_pool_state])
+        db = client[mongo_settings.db_name]
+        replica_db = read_heavy_database(client, mongo_settings)
+
+
+@app.on_event("startup")
+async def check_rate_limit_identity():
+    # Behind a proxy or ingress every peer address is the proxy's, so one bucket would throttle everyone
+    identified = os.environ.get('RATE_LIMIT_CLIENT_HEADER') or \
+        os.environ.get('RATE_LIMIT_TRUST_FORWARDED', 'false').lower() == 'true'
+    if rate_limiter.rules and not identified:
+        logger.warning("RATE_LIMITS keys clients by peer address; behind a proxy set "
+                       "RATE_LIMIT_TRUST_FORWARDED or RATE_LIMIT_CLIENT_HEADER")
+
+@app.on_event("startup")
+async def check_ocr_engine():
+    try:
+        get_recognizer(ocr_engine)
+    except RecognizerUnavailable as e:
+        logger.warning(f"OCR_ENGINE {ocr_engine!r} cannot run here, /api/ocr will answer 503: {str(e)}")
+
+@app.on_event("startup")
+async def start_render_pool():
+    # Parse the DOCX template before the pool forks so workers inherit it
+    get_template()
+    render_pool.start()
+
+async def purge_artifacts_periodically():
+    while True:
+        await asyncio.sleep(60)
+        try:
+            await run_in_threadpool(artifact_store.purge_expired)
+            await run_in_threadpool(upload_store.purge_expired)
+            await run_in_threadpool(session_store.purge_expired)
+        except Exception as e:
+            logger.error(f"Error purging artifacts: {str(e)}")
+
+@app.on_event("startup")
+async def start_artifact_purger():
+    app.state.artifact_purger = asyncio.create_task(purge_artifacts_periodically())
+
+@app.on_event("shutdown")
+async def stop_artifact_purger():
+    app.state.artifact_purger.cancel()
+
+@app.on_event("startup")
+async def create_indexes():
+    try:
+        # Serve paginated /status listings, optionally filtered by client, from indexes
+        await db.status_checks.create_index([("timestamp", 1), ("id", 1)])
+        await db.status_checks.create_index([("client_name", 1), ("timestamp", 1), ("id", 1)])
+        await db.status_rollups.create_index([("minute", 1), ("client_name", 1)], unique=True)
+        await db.export_jobs.create_index("id", unique=True)
+        # Let Mongo drop finished job records once they are no longer useful
+        await db.export_jobs.create_index("expires_at", expireAfterSeconds=0)
+    except Exception as e:
+        logger.error(f"Error creating indexes: {str(e)}")
+
+    try:
+        await create_extraction_collections()
+    except Exception as e:
+        logger.error(f"Error creating extraction indexes: {str(e)}")
+
+async def create_extraction_collections():
+    # Segments are mostly plain prose, which block compression shrinks well on disk
+    for name in ("extractions", "extraction_segments"):
+        try:
+            await db.create_collection(name, storageEngine={
+                "wiredTiger": {"configString": f"block_compressor={extraction_block_compressor}"}
+            })
+        except CollectionInvalid:
+            pass  # already exists
+        except Exception as e:
+            logger.error(f"Could not create {name} with {extraction_block_compressor} compression: {str(e)}")
+    await db.extractions.create_index("id", unique=True)
+    await db.extractions.create_index([("owner", 1), ("created_at", -1), ("id", 1)])
+    await db.extraction_segments.create_index([("extraction_id", 1), ("seq", 1)], unique=True)
+    # A collection has one text index; the unscoped one predates per-client history
+    if "segment_text" in await db.extraction_segments.index_information():
+        await db.extraction_segments.drop_index("segment_text")
+    # Searches always name their owner, so it prefixes the text index.
+    # Each segment names its own language, so stemming follows the transcript it came from
+    await db.extraction_segments.create_index(
+        [("owner", 1), ("text", "text")],
+        default_language="english",
+        language_override="language",
+        name="owner_segment_text",
+    )
+
+@app.on_event("startup")
+async def start_export_job_heartbeats():
+    # The first beat also fails jobs left unfinished by a previous run
+    app.state.export_job_heartbeats = asyncio.create_task(export_job_heartbeats())
+
+@app.on_event("shutdown")
+async def cancel_export_jobs():
+    app.state.export_job_heartbeats.cancel()
+    for task in list(export_job_tasks.values()):
+        task.cancel()
+
+@app.on_event("startup")
+async def start_status_buffer():
+    status_buffer.start()
+
+@app.on_event("shutdown")
+async def stop_status_buffer():
+    await status_buffer.stop()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    if client is not None:
+        client.close()
+
+@app.on_event("shutdown")
+async def shutdown_render_pool():
+    render_pool.shutdown()
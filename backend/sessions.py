@@ -0,0 +1,341 @@
+"""
+Editable document sessions: a parsed document kept in memory so that small
+edits only re-serialize and recompress the paragraphs they touch
+"""
+import os
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from layout import DEFAULT_TITLE, Block, parse_blocks
+from rendering import DocxTemplate, block_xml, report_phases
+
+# Blocks per independently compressed piece of document.xml. Smaller pieces
+# make edits cheaper to recompress but compress slightly worse.
+SEGMENT_BLOCKS = 64
+
+
+class SessionError(Exception):
+    """Raised for edits or lookups a session cannot accept"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class EditOp:
+    op: str  # insert, replace or delete
+    index: int
+    count: int = 1
+    text: str = ""
+
+
+def _encode(block: Block) -> bytes:
+    return block_xml(block).encode('utf-8')
+
+
+def _deflate(data: bytes, final: bool = False) -> bytes:
+    """
+    Raw deflate ``data`` on its own. A sync flush ends each piece on a byte
+    boundary without marking the stream finished, so pieces compressed
+    separately concatenate into one valid stream; only the last is final.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _Segment:
+    __slots__ = ('blocks', 'xml', 'raw', 'deflated')
+
+    def __init__(self, blocks: List[Block], xml: List[bytes]):
+        self.blocks = blocks
+        self.xml = xml
+        self.raw = None
+        self.deflated = None
+
+    def invalidate(self):
+        self.raw = None
+        self.deflated = None
+
+
+class DocumentSession:
+    """
+    A document as segments of blocks, each block with its serialized XML
+    and each segment with its deflated bytes. An edit re-serializes only
+    the blocks it inserts or replaces and drops the compressed bytes of
+    the segments it touches; rendering recompresses just those and stitches
+    the rest back together with the static package parts.
+    """
+
+    def __init__(self, session_id: str, blocks: Sequence[Block], title: str = DEFAULT_TITLE,
+                 filename: str = "extracted_text.docx", max_chars: Optional[int] = None):
+        self.id = session_id
+        self.title = title
+        self.filename = filename
+        self.version = 1
+        self.updated_at = time.time()
+        self.expires_at = 0.0
+        self.lock = threading.Lock()
+        self._title_xml = _encode(Block("title", title, 1))
+        self._segments: List[_Segment] = []
+        self._length = 0
+        # Block text the edits may grow the document to; None for no limit
+        self.max_chars = max_chars
+        self._chars = 0
+        self._xml_bytes = 0
+        # Compressed segments and package held by the last render
+        self._rendered_bytes = 0
+        self._package: Optional[Tuple[int, bytes]] = None
+        # Segments recompressed by the last render, for the response headers
+        self.last_recompressed = 0
+        self._insert(0, list(blocks))
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def chars(self) -> int:
+        return self._chars
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Rough memory held: block text, its XML and the last render's bytes
+        """
+        return self._chars + self._xml_bytes + self._rendered_bytes
+
+    def blocks(self) -> List[Block]:
+        return [block for segment in self._segments for block in segment.blocks]
+
+    def _locate(self, index: int) -> Tuple[int, int]:
+        # (segment, offset within it); index == len(self) lands after the last block
+        for position, segment in enumerate(self._segments):
+            if index < len(segment.blocks):
+                return position, index
+            index -= len(segment.blocks)
+        if not self._segments:
+            self._segments.append(_Segment([], []))
+        return len(self._segments) - 1, len(self._segments[-1].blocks)
+
+    def _insert(self, index: int, blocks: List[Block]):
+        if not blocks:
+            return
+        position, offset = self._locate(index)
+        segment = self._segments[position]
+        xml = [_encode(block) for block in blocks]
+        segment.blocks[offset:offset] = blocks
+        segment.xml[offset:offset] = xml
+        segment.invalidate()
+        self._length += len(blocks)
+        self._chars += sum(len(block.text) for block in blocks)
+        self._xml_bytes += sum(len(piece) for piece in xml)
+        if len(segment.blocks) > 2 * SEGMENT_BLOCKS:
+            # Re-cut an overgrown segment so one edit never recompresses much
+            pieces = [
+                _Segment(segment.blocks[start:start + SEGMENT_BLOCKS], segment.xml[start:start + SEGMENT_BLOCKS])
+                for start in range(0, len(segment.blocks), SEGMENT_BLOCKS)
+            ]
+            self._segments[position:position + 1] = pieces
+
+    def _delete(self, index: int, count: int):
+        while count:
+            position, offset = self._locate(index)
+            segment = self._segments[position]
+            taken = min(count, len(segment.blocks) - offset)
+            self._chars -= sum(len(block.text) for block in segment.blocks[offset:offset + taken])
+            self._xml_bytes -= sum(len(piece) for piece in segment.xml[offset:offset + taken])
+            del segment.blocks[offset:offset + taken]
+            del segment.xml[offset:offset + taken]
+            segment.invalidate()
+            self._length -= taken
+            count -= taken
+            if not segment.blocks:
+                del self._segments[position]
+            elif len(segment.blocks) < SEGMENT_BLOCKS // 4 and position + 1 < len(self._segments):
+                # Fold a shrunken segment into the next so pieces stay worth compressing
+                following = self._segments.pop(position + 1)
+                segment.blocks.extend(following.blocks)
+                segment.xml.extend(following.xml)
+
+    def apply(self, ops: Sequence[EditOp], base_version: Optional[int] = None) -> int:
+        """
+        Apply edits in order, all or none. Indexes count blocks after the
+        title and refer to the document as left by the previous edit. Edits
+        that would grow the text past ``max_chars`` are rejected with 413.
+        """
+        if base_version is not None and base_version != self.version:
+            raise SessionError(409, f"Session is at version {self.version}, not {base_version}")
+
+        # Validate everything against the lengths the edits will produce before changing anything
+        parsed = []
+        length = self._length
+        for number, op in enumerate(ops):
+            limit = length if op.op == "insert" else length - op.count
+            if op.index < 0 or op.count < 1 or op.index > limit:
+                raise SessionError(422, f"Edit {number}: index {op.index} is out of range for {length} blocks")
+            blocks = parse_blocks(op.text) if op.op != "delete" else []
+            if op.op == "insert":
+                length += len(blocks)
+            elif op.op == "replace":
+                length += len(blocks) - op.count
+            elif op.op == "delete":
+                length -= op.count
+            else:
+                raise SessionError(422, f"Edit {number}: unknown op {op.op!r}")
+            parsed.append(blocks)
+        self._check_growth(ops, parsed)
+
+        for op, blocks in zip(ops, parsed):
+            if op.op != "insert":
+                self._delete(op.index, op.count)
+            self._insert(op.index, blocks)
+        self.version += 1
+        self.updated_at = time.time()
+        return self.version
+
+    def _check_growth(self, ops: Sequence[EditOp], parsed: List[List[Block]]):
+        if self.max_chars is None:
+            return
+        added = sum(len(block.text) for blocks in parsed for block in blocks)
+        if self._chars + added <= self.max_chars:
+            return
+        # Close to the limit: replay the edits on the block lengths to count what they remove
+        lengths = [len(block.text) for block in self.blocks()]
+        for op, blocks in zip(ops, parsed):
+            if op.op != "insert":
+                del lengths[op.index:op.index + op.count]
+            lengths[op.index:op.index] = [len(block.text) for block in blocks]
+        chars = sum(lengths)
+        if chars > self.max_chars:
+            raise SessionError(413, f"Edits would grow the document to {chars} characters; "
+                                    f"the limit is {self.max_chars}")
+
+    def render(self, template: DocxTemplate) -> bytes:
+        """
+        DOCX bytes for the current version, recompressing only edited segments
+        """
+        if self._package is not None and self._package[0] == self.version:
+            return self._package[1]
+        started = time.perf_counter()
+        prefix = template.prefix + self._title_xml
+        size = len(prefix) + len(template.suffix)
+        crc = zlib.crc32(prefix)
+        pieces = [_deflate(prefix)]
+        recompressed = 0
+        for segment in self._segments:
+            if segment.deflated is None:
+                segment.raw = b''.join(segment.xml)
+                segment.deflated = _deflate(segment.raw)
+                recompressed += 1
+            crc = zlib.crc32(segment.raw, crc)
+            size += len(segment.raw)
+            pieces.append(segment.deflated)
+        crc = zlib.crc32(template.suffix, crc)
+        pieces.append(_deflate(template.suffix, final=True))
+        built = time.perf_counter()
+        # The timestamp follows the version, so every download of a version is byte-identical
+        data = template.package(b''.join(pieces), crc, size, time.localtime(self.updated_at)[:6])
+        report_phases("session", {"build": built - started, "save": time.perf_counter() - built})
+        self._package = (self.version, data)
+        self._rendered_bytes = len(data) + sum(len(segment.deflated) + len(segment.raw) for segment in self._segments)
+        self.last_recompressed = recompressed
+        return data
+
+
+class SessionStore:
+    """
+    In-memory LRU of document sessions with a sliding expiry. Sessions live
+    in the process that created them, so several workers need sticky routing.
+
+    Besides the session count, the memory all sessions hold together is
+    bounded by ``max_bytes``: once edits or renders push it over, the least
+    recently used sessions are dropped.
+    """
+
+    def __init__(self, ttl_seconds: int = 3600, max_sessions: int = 1000, max_bytes: int = 256 * 1024 * 1024,
+                 max_chars: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.evicted = 0
+        self._sessions: "OrderedDict[str, DocumentSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        return cls(
+            ttl_seconds=int(os.environ.get('DOCUMENT_SESSION_TTL_SECONDS', '3600')),
+            max_sessions=int(os.environ.get('DOCUMENT_SESSION_MAX', '1000')),
+            max_bytes=int(os.environ.get('DOCUMENT_SESSION_MAX_BYTES', str(256 * 1024 * 1024))),
+            max_chars=int(os.environ.get('DOCX_MAX_TEXT_CHARS', '2000000')),
+        )
+
+    def create(self, text: str, title: str = DEFAULT_TITLE, filename: str = "extracted_text.docx") -> DocumentSession:
+        session = DocumentSession(uuid.uuid4().hex, parse_blocks(text), title, filename, self.max_chars)
+        session.expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+        self.fit()
+        return session
+
+    def fit(self) -> int:
+        """
+        Drop least recently used sessions until all of them fit in
+        ``max_bytes``, always keeping the most recent; call after edits and
+        renders, which change what a session holds
+        """
+        with self._lock:
+            total = sum(session.nbytes for session in self._sessions.values())
+            dropped = 0
+            while total > self.max_bytes and len(self._sessions) > 1:
+                _, session = self._sessions.popitem(last=False)
+                total -= session.nbytes
+                dropped += 1
+            self.evicted += dropped
+        return dropped
+
+    def get(self, session_id: str) -> DocumentSession:
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.expires_at < now:
+                self._sessions.pop(session_id, None)
+                raise SessionError(404, "Session not found or expired")
+            self._sessions.move_to_end(session_id)
+            session.expires_at = now + self.ttl_seconds
+            return session
+
+    def delete(self, session_id: str):
+        with self._lock:
+            if self._sessions.pop(session_id, None) is None:
+                raise SessionError(404, "Session not found or expired")
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [session_id for session_id, session in self._sessions.items() if session.expires_at < now]
+            for session_id in expired:
+                del self._sessions[session_id]
+        return len(expired)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = sum(session.nbytes for session in self._sessions.values())
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "evicted": self.evicted,
+            "ttl_seconds": self.ttl_seconds,
+        }
@@ -0,0 +1,183 @@
+"""
+Write-behind buffering for status check ingestion
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+
+class StatusBufferFull(Exception):
+    """Raised when accepting more documents would exceed the buffer's limit"""
+
+
+class _Ticket:
+    # Tracks one submit call until every one of its documents has been flushed
+    __slots__ = ("future", "remaining", "failed")
+
+    def __init__(self, future: Optional[asyncio.Future], remaining: int):
+        self.future = future
+        self.remaining = remaining
+        self.failed = 0
+
+
+class StatusWriteBuffer:
+    """
+    Collects documents and writes them with ``insert_many(ordered=False)``
+    once ``max_batch`` documents are waiting or ``max_delay_ms`` has passed
+    since the first of them arrived, whichever comes first.
+    """
+
+    def __init__(self, collection: Callable, max_batch: int = 500, max_delay_ms: int = 50,
+                 max_pending: int = 10000, on_flushed: Optional[Callable] = None):
+        self._collection = collection
+        # Awaited with the documents of each flush that were actually written
+        self._on_flushed = on_flushed
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.max_pending = max_pending
+        self._pending = []
+        self._wake = None
+        self._full = None
+        self._task = None
+        # The flush the background task is awaiting, kept so stop() can let it finish
+        self._flushing = None
+        self.flushes = 0
+        self.flushed_docs = 0
+        self.failed_docs = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    @classmethod
+    def from_env(cls, collection: Callable, on_flushed: Optional[Callable] = None) -> "StatusWriteBuffer":
+        return cls(
+            collection,
+            on_flushed=on_flushed,
+            max_batch=int(os.environ.get('STATUS_BUFFER_MAX_BATCH', '500')),
+            max_delay_ms=int(os.environ.get('STATUS_BUFFER_MAX_DELAY_MS', '50')),
+            max_pending=int(os.environ.get('STATUS_BUFFER_MAX_PENDING', '10000')),
+        )
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # A batch already taken off the queue is only written by the flush that took it
+        if self._flushing is not None:
+            try:
+                await self._flushing
+            except Exception:
+                pass
+            self._flushing = None
+        # Do not drop what was accepted before shutdown
+        while self._pending:
+            await self._flush()
+
+    def submit(self, docs: List[dict], wait: bool = True) -> Optional[asyncio.Future]:
+        """
+        Queue documents for the next flush.
+
+        Returns a future that resolves once they are written when ``wait`` is
+        true; otherwise the write is fire-and-forget and None is returned.
+        """
+        if len(self._pending) + len(docs) > self.max_pending:
+            raise StatusBufferFull(f"Status buffer is full ({self.max_pending} documents)")
+        if self._task is None:
+            raise RuntimeError("Status buffer is not running")
+
+        future = asyncio.get_running_loop().create_future() if wait else None
+        ticket = _Ticket(future, len(docs))
+        self._pending.extend((doc, ticket) for doc in docs)
+        self._wake.set()
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        return future
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            if len(self._pending) < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            self._full.clear()
+            while self._pending:
+                # Shielded so cancelling the loop never abandons a batch mid-write
+                self._flushing = asyncio.ensure_future(self._flush())
+                await asyncio.shield(self._flushing)
+                self._flushing = None
+
+    async def _flush(self):
+        batch = self._pending[:self.max_batch]
+        del self._pending[:self.max_batch]
+
+        failed_indexes = set()
+        error = None
+        started = time.perf_counter()
+        try:
+            await self._collection().insert_many([doc for doc, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            # Unordered inserts keep going past failures, so only some documents are lost
+            failed_indexes = {write_error["index"] for write_error in e.details.get("writeErrors", [])}
+            error = e
+        except Exception as e:
+            failed_indexes = set(range(len(batch)))
+            error = e
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.flushed_docs += len(batch) - len(failed_indexes)
+        self.failed_docs += len(failed_indexes)
+        self.last_flush_ms = elapsed_ms
+        self.total_flush_ms += elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        if error is not None:
+            logger.error(f"Error flushing {len(failed_indexes)} of {len(batch)} status checks: {str(error)}")
+
+        if self._on_flushed is not None and len(failed_indexes) < len(batch):
+            written = [doc for index, (doc, _) in enumerate(batch) if index not in failed_indexes]
+            try:
+                await self._on_flushed(written)
+            except Exception as e:
+                logger.error(f"Error in status flush hook: {str(e)}")
+
+        for index, (_, ticket) in enumerate(batch):
+            ticket.remaining -= 1
+            if index in failed_indexes:
+                ticket.failed += 1
+            if ticket.remaining == 0 and ticket.future is not None and not ticket.future.done():
+                if ticket.failed:
+                    ticket.future.set_exception(RuntimeError(f"{ticket.failed} status checks were not written"))
+                else:
+                    ticket.future.set_result(None)
+
+    def stats(self) -> dict:
+        flushes = self.flushes or 1
+        return {
+            "queue_depth": len(self._pending),
+            "max_pending": self.max_pending,
+            "flushes": self.flushes,
+            "flushed_docs": self.flushed_docs,
+            "failed_docs": self.failed_docs,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / flushes, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
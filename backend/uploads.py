@@ -0,0 +1,168 @@
+"""
+Resumable chunked uploads spooled to disk
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+
+class UploadError(Exception):
+    """Raised for chunk writes the upload cannot accept"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class Upload:
+    id: str
+    filename: str
+    media_type: str
+    size: int
+    sha256: Optional[str]
+    expires_at: float
+    path: str
+
+    @property
+    def offset(self) -> int:
+        # The spool file itself is the source of truth for how much has arrived
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    @property
+    def complete(self) -> bool:
+        return self.offset == self.size
+
+
+class UploadStore:
+    """
+    Each upload is a spool file plus a JSON sidecar in ``directory``. Chunks
+    are appended at the offset the client says it is resuming from, and a
+    chunk whose checksum does not match is rolled back.
+    """
+
+    def __init__(self, directory: Optional[str] = None, ttl_seconds: int = 86400,
+                 max_bytes: int = 200 * 1024 * 1024):
+        self.directory = Path(directory or os.path.join(tempfile.gettempdir(), 'ocr-uploads'))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_env(cls) -> "UploadStore":
+        return cls(
+            directory=os.environ.get('UPLOAD_DIR') or None,
+            ttl_seconds=int(os.environ.get('UPLOAD_TTL_SECONDS', '86400')),
+            max_bytes=int(os.environ.get('UPLOAD_MAX_BYTES', str(200 * 1024 * 1024))),
+        )
+
+    def _meta_path(self, upload_id: str) -> Path:
+        return self.directory / f"{upload_id}.json"
+
+    def create(self, filename: str, size: int, media_type: str, sha256: Optional[str] = None) -> Upload:
+        if size > self.max_bytes:
+            raise UploadError(413, f"Uploads are limited to {self.max_bytes} bytes")
+        upload_id = uuid.uuid4().hex
+        upload = Upload(
+            id=upload_id,
+            filename=os.path.basename(filename) or upload_id,
+            media_type=media_type,
+            size=size,
+            sha256=sha256.lower() if sha256 else None,
+            expires_at=time.time() + self.ttl_seconds,
+            path=str(self.directory / f"{upload_id}.part"),
+        )
+        Path(upload.path).touch()
+        self._meta_path(upload_id).write_text(json.dumps(asdict(upload)))
+        return upload
+
+    def get(self, upload_id: str) -> Optional[Upload]:
+        if not upload_id.isalnum():
+            return None
+        try:
+            upload = Upload(**json.loads(self._meta_path(upload_id).read_text()))
+        except FileNotFoundError:
+            return None
+        if upload.expires_at < time.time():
+            self.delete(upload_id)
+            return None
+        return upload
+
+    def delete(self, upload_id: str):
+        self._meta_path(upload_id).unlink(missing_ok=True)
+        (self.directory / f"{upload_id}.part").unlink(missing_ok=True)
+
+    def open_chunk(self, upload: Upload, offset: int) -> "ChunkWriter":
+        if offset != upload.offset:
+            raise UploadError(409, f"Upload is at offset {upload.offset}, not {offset}")
+        return ChunkWriter(upload, offset)
+
+    def verify(self, upload: Upload) -> bool:
+        """
+        Check the whole file against the checksum declared at creation, if any
+        """
+        if upload.sha256 is None:
+            return True
+        digest = hashlib.sha256()
+        with open(upload.path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest() == upload.sha256
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        purged = 0
+        for meta_path in self.directory.glob('*.json'):
+            try:
+                expires_at = json.loads(meta_path.read_text())['expires_at']
+            except (FileNotFoundError, ValueError, KeyError):
+                continue
+            if expires_at < now:
+                self.delete(meta_path.stem)
+                purged += 1
+        return purged
+
+
+class ChunkWriter:
+    """
+    Appends one chunk straight to the spool file, hashing it on the way
+    """
+
+    def __init__(self, upload: Upload, offset: int):
+        self.upload = upload
+        self.offset = offset
+        self.written = 0
+        self._digest = hashlib.sha256()
+        self._file = open(upload.path, 'r+b')
+        self._file.seek(offset)
+
+    def write(self, data: bytes):
+        if self.offset + self.written + len(data) > self.upload.size:
+            raise UploadError(413, f"Chunk runs past the declared size of {self.upload.size} bytes")
+        self._file.write(data)
+        self._digest.update(data)
+        self.written += len(data)
+
+    def commit(self, expected_sha256: Optional[str]) -> int:
+        """
+        Keep the chunk if its checksum matches; otherwise roll it back
+        """
+        if expected_sha256 and self._digest.hexdigest() != expected_sha256.lower():
+            self.abort()
+            raise UploadError(422, "Chunk checksum mismatch")
+        self._file.close()
+        return self.offset + self.written
+
+    def abort(self):
+        self._file.truncate(self.offset)
+        self._file.close()
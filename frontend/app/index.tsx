@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useEffect, useState } from 'react';
 import {
   View,
   Text,
@@ -8,6 +8,7 @@ import {
   ActivityIndicator,
   Alert,
   Platform,
+  Switch,
 } from 'react-native';
 import { StatusBar } from 'expo-status-bar';
 import * as ImagePicker from 'expo-image-picker';
@@ -19,10 +20,35 @@ import * as TextExtractor from 'expo-text-extractor';
 import { Ionicons } from '@expo/vector-icons';
 import Constants from 'expo-constants';
 
+// Random id generated once per install; the server keeps each install's saved extractions to itself.
+// It is the only key to that history, so without a secure random source there is no id (and no history)
+let clientIdPromise: Promise<string> | null = null;
+const getClientId = () => {
+  if (!clientIdPromise) {
+    const path = `${FileSystem.documentDirectory}client-id`;
+    clientIdPromise = FileSystem.readAsStringAsync(path).catch(async () => {
+      if (!globalThis.crypto?.getRandomValues) {
+        throw new Error('No secure random source to generate a client id');
+      }
+      const bytes = new Uint8Array(16);
+      globalThis.crypto.getRandomValues(bytes);
+      const id = Array.from(bytes, (byte) => byte.toString(16).padStart(2, '0')).join('');
+      await FileSystem.writeAsStringAsync(path, id);
+      return id;
+    });
+    clientIdPromise.catch(() => { clientIdPromise = null; });
+  }
+  return clientIdPromise;
+};
+
+// Saving extractions to the server is opt-in; the choice is kept on the device
+const HISTORY_SETTING_PATH = `${FileSystem.documentDirectory}history-enabled`;
+
 export default function HomeScreen() {
   const [extractedText, setExtractedText] = useState('');
   const [loading, setLoading] = useState(false);
   const [imageUri, setImageUri] = useState<string | null>(null);
+  const [historyEnabled, setHistoryEnabled] = useState(false);
 
   const BACKEND_URL = Constants.expoConfig?.extra?.EXPO_BACKEND_URL || process.env.EXPO_BACKEND_URL || 'http://localhost:8001';
 
@@ -38,6 +64,38 @@ export default function HomeScreen() {
     return true;
   };
 
+  useEffect(() => {
+    FileSystem.readAsStringAsync(HISTORY_SETTING_PATH)
+      .then((value) => setHistoryEnabled(value === 'on'))
+      .catch(() => setHistoryEnabled(false));
+  }, []);
+
+  // Turning history on needs a client id first, so a device that cannot make one keeps it off
+  const toggleHistory = async (enabled: boolean) => {
+    try {
+      if (enabled) {
+        await getClientId();
+      }
+      await FileSystem.writeAsStringAsync(HISTORY_SETTING_PATH, enabled ? 'on' : 'off');
+      setHistoryEnabled(enabled);
+    } catch (error) {
+      console.warn('Could not change history setting:', error);
+      Alert.alert('History Unavailable', 'Saving history is not supported on this device.');
+    }
+  };
+
+  // With history turned on, keep a searchable copy of each extraction on the server; failures are not fatal
+  const saveExtraction = (text: string, source: string) => {
+    if (!historyEnabled) return;
+    getClientId()
+      .then((clientId) => fetch(`${BACKEND_URL}/api/extractions`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'X-Client-Id': clientId },
+        body: JSON.stringify({ text, source }),
+      }))
+      .catch((error) => console.warn('Could not save extraction:', error));
+  };
+
   // Process image with OCR
   const processImage = async (uri: string) => {
     try {
@@ -57,6 +115,7 @@ export default function HomeScreen() {
       if (result && result.length > 0) {
         const text = result.join('\n');
         setExtractedText(text);
+        saveExtraction(text, 'image');
       } else {
         Alert.alert('No Text Found', 'Could not extract any text from this image.');
         setExtractedText('');
@@ -120,14 +179,56 @@ export default function HomeScreen() {
       });
 
       if (!result.canceled && result.assets[0]) {
-        Alert.alert(
-          'PDF Processing',
-          'PDF text extraction requires converting pages to images first. This feature is limited in the current offline implementation. Please use image screenshots of PDF pages instead.'
-        );
+        setLoading(true);
+        setImageUri(null);
+
+        // Upload the file and let the backend extract text page by page
+        const upload = await FileSystem.uploadAsync(`${BACKEND_URL}/api/extract-pdf`, result.assets[0].uri, {
+          httpMethod: 'POST',
+          uploadType: FileSystem.FileSystemUploadType.MULTIPART,
+          fieldName: 'file',
+          mimeType: 'application/pdf',
+        });
+
+        if (upload.status !== 200) {
+          throw new Error('Failed to extract PDF text');
+        }
+
+        // The response is one JSON object per page, then a status line
+        const lines = upload.body
+          .split('\n')
+          .filter((line) => line.trim())
+          .map((line) => JSON.parse(line));
+        const status = lines.find((line) => typeof line.done === 'boolean');
+        if (!status || !status.done) {
+          throw new Error(status?.error || 'PDF extraction stopped before the last page');
+        }
+        const pages = lines.filter((line) => typeof line.page === 'number');
+        const failedPages = pages.filter((page) => typeof page.error === 'string').map((page) => page.page);
+        const text = pages
+          .filter((page) => typeof page.text === 'string')
+          .map((page) => page.text.trim())
+          .filter(Boolean)
+          .join('\n\n');
+
+        if (failedPages.length) {
+          Alert.alert('Some Pages Failed', `Could not extract text from page(s) ${failedPages.join(', ')}.`);
+        }
+        if (text) {
+          setExtractedText(text);
+          saveExtraction(text, 'pdf');
+        } else {
+          if (!failedPages.length) {
+            Alert.alert('No Text Found', 'Could not extract any text from this PDF.');
+          }
+          setExtractedText('');
+        }
       }
     } catch (error) {
       console.error('PDF Error:', error);
       Alert.alert('Error', 'Failed to process PDF.');
+    } finally {
+      setLoading(false);
     }
   };
 
@@ -181,8 +282,8 @@ export default function HomeScreen() {
       setLoading(true);
       const filename = `extracted_text_${Date.now()}.docx`;
 
-      // Call backend API to generate DOCX
-      const response = await fetch(`${BACKEND_URL}/api/generate-docx`, {
+      // Ask the backend to render the DOCX and hand back a download URL
+      const response = await fetch(`${BACKEND_URL}/api/documents`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -197,27 +298,20 @@ export default function HomeScreen() {
         throw new Error('Failed to generate DOCX');
       }
 
-      // Get blob and save
-      const blob = await response.blob();
-      const reader = new FileReader();
-      
-      reader.onloadend = async () => {
-        const base64data = reader.result as string;
-        const base64 = base64data.split(',')[1];
-        
-        const fileUri = `${FileSystem.documentDirectory}${filename}`;
-        await FileSystem.writeAsStringAsync(fileUri, base64, {
-          encoding: FileSystem.EncodingType.Base64,
-        });
-        
-        if (await Sharing.isAvailableAsync()) {
-          await Sharing.shareAsync(fileUri);
-        } else {
-          Alert.alert('Success', `File saved to: ${fileUri}`);
-        }
-      };
-      
-      reader.readAsDataURL(blob);
+      // Download straight to a file instead of round-tripping through base64
+      const { url } = await response.json();
+      const fileUri = `${FileSystem.documentDirectory}${filename}`;
+      const download = await FileSystem.downloadAsync(`${BACKEND_URL}${url}`, fileUri);
+
+      if (download.status !== 200) {
+        throw new Error('Failed to download DOCX');
+      }
+
+      if (await Sharing.isAvailableAsync()) {
+        await Sharing.shareAsync(download.uri);
+      } else {
+        Alert.alert('Success', `File saved to: ${download.uri}`);
+      }
     } catch (error) {
       console.error('DOCX Download Error:', error);
       Alert.alert('Error', 'Failed to generate DOCX file.');
@@ -240,7 +334,9 @@ export default function HomeScreen() {
       <View style={styles.header}>
         <Ionicons name="document-text" size={40} color="#fff" />
         <Text style={styles.headerTitle}>OCR Text Extractor</Text>
-        <Text style={styles.headerSubtitle}>Offline • No History Saved</Text>
+        <Text style={styles.headerSubtitle}>
+          {historyEnabled ? 'History saved to the server' : 'Offline • No History Saved'}
+        </Text>
       </View>
 
       <ScrollView style={styles.content} contentContainerStyle={styles.contentContainer}>
@@ -327,6 +423,13 @@ export default function HomeScreen() {
             <Text style={styles.infoText}>
               Works best with clear, well-lit images and printed text. Handwriting recognition is limited.
             </Text>
+            <View style={styles.historyRow}>
+              <Text style={styles.historyText}>Save history on the server</Text>
+              <Switch value={historyEnabled} onValueChange={toggleHistory} />
+            </View>
+            <Text style={styles.infoText}>
+              Off by default. When on, the text of each extraction is sent to the backend so it can be listed and searched later.
+            </Text>
           </View>
         )}
       </ScrollView>
@@ -489,4 +592,16 @@ const styles = StyleSheet.create({
     marginTop: 8,
     lineHeight: 20,
   },
+  historyRow: {
+    flexDirection: 'row',
+    alignItems: 'center',
+    justifyContent: 'space-between',
+    alignSelf: 'stretch',
+    marginTop: 16,
+  },
+  historyText: {
+    fontSize: 14,
+    fontWeight: '600',
+    color: '#333',
+  },
 });
\ No newline at end of file
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from admission import AdmissionMiddleware, RateLimiter, parse_rate_limits
+
+CAP = 100
+
+
+def _call(middleware, method="POST", path="/api/export/docx", headers=(), body=b"", client=("10.0.0.1", 1234)):
+    """Run one request through the middleware; returns the status sent and the body the app read"""
+    seen = {}
+
+    async def app(scope, receive, send):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        seen["body"] = b"".join(chunks)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    messages = [{"type": "http.request", "body": body[i:i + 40], "more_body": i + 40 < len(body)}
+                for i in range(0, max(len(body), 1), 40)]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            seen["status"] = message["status"]
+
+    middleware.app = app
+    scope = {
+        "type": "http", "method": method, "path": path, "client": client,
+        "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+    }
+    asyncio.run(middleware(scope, receive, send))
+    return seen
+
+
+def _middleware(rules="", **options):
+    return AdmissionMiddleware(None, RateLimiter(parse_rate_limits(rules)), max_json_bytes=CAP, **options)
+
+
+@pytest.mark.parametrize("content_type", [None, "application/json", "application/merge-patch+json; charset=utf-8"])
+def test_json_bodies_over_the_cap_are_refused(content_type):
+    headers = [("content-length", str(CAP + 1))]
+    if content_type:
+        headers.append(("content-type", content_type))
+    seen = _call(_middleware(), headers=headers, body=b"x" * (CAP + 1))
+    assert seen["status"] == 413 and "body" not in seen
+
+
+@pytest.mark.parametrize("content_type", [None, "application/vnd.api+json"])
+def test_chunked_json_bodies_are_cut_off(content_type):
+    headers = [("content-type", content_type)] if content_type else []
+    with pytest.raises(HTTPException) as raised:
+        _call(_middleware(), headers=headers, body=b"x" * (CAP * 2))
+    assert raised.value.status_code == 413
+
+
+def test_other_bodies_and_raw_routes_are_not_capped():
+    body = b"x" * (CAP * 2)
+    multipart = _call(_middleware(), headers=[("content-type", "multipart/form-data; boundary=b")], body=body)
+    assert multipart["body"] == body
+    raw = _middleware(raw_body_routes=["PATCH /api/uploads/{upload_id}"])
+    assert _call(raw, method="PATCH", path="/api/uploads/abc123", body=body)["body"] == body
+    # Other routes without a Content-Type are still treated as JSON
+    with pytest.raises(HTTPException):
+        _call(raw, method="PATCH", path="/api/sessions/abc123", body=body)
+
+
+def test_rate_limits_key_on_forwarded_clients_when_trusted():
+    rules = "POST /api/export/{fmt}=0.001:1"
+    direct = _middleware(rules)
+    assert _call(direct)["status"] == 200
+    # Behind a proxy every request shares its address, so they share one bucket
+    assert _call(direct, headers=[("x-forwarded-for", "203.0.113.9")])["status"] == 429
+
+    proxied = _middleware(rules, trust_forwarded=True)
+    for address in ("203.0.113.8", "203.0.113.9"):
+        assert _call(proxied, headers=[("x-forwarded-for", f"{address}, 10.0.0.1")])["status"] == 200
+    assert _call(proxied, headers=[("x-forwarded-for", "203.0.113.9")])["status"] == 429
+
+
+def test_rate_limits_key_on_the_client_header():
+    limited = _middleware("POST /api/export/{fmt}=0.001:1", client_header="X-Client-Id")
+    assert _call(limited, headers=[("x-client-id", "device-a")])["status"] == 200
+    assert _call(limited, headers=[("x-client-id", "device-b")])["status"] == 200
+    assert _call(limited, headers=[("x-client-id", "device-a")])["status"] == 429
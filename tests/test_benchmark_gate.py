@@ -0,0 +1,30 @@
+from dataclasses import replace
+
+from benchmarks.load import ScenarioResult, compare, summarize
+
+RUN = ScenarioResult(requests=300, concurrency=8, errors=0, p50_ms=0.3, p95_ms=10.0, p99_ms=1.0, rps=1000.0,
+                     peak_rss_mb=100.0)
+
+
+def test_baseline_is_the_median_of_each_metric_with_its_spread():
+    runs = [replace(RUN, p95_ms=p95, rps=rps) for p95, rps in ((10.0, 900.0), (30.0, 1000.0), (12.0, 1200.0))]
+    result, spread = summarize(runs)
+    assert (result.p95_ms, result.rps, result.peak_rss_mb) == (12.0, 1000.0, 100.0)
+    assert spread == {"p95_ms": round(20 / 12, 3), "rps": 0.3, "peak_rss_mb": 0.0}
+
+
+def test_noisy_metrics_get_a_wider_allowance():
+    baseline = {**vars(RUN), "spread": {"p95_ms": 0.05, "rps": 0.05, "peak_rss_mb": 0.0}}
+    slower = replace(RUN, p95_ms=15.0, rps=600.0)
+    assert len(compare("scenario", slower, baseline, 0.35)) == 2
+    noisy = {**baseline, "spread": {"p95_ms": 0.3, "rps": 0.25, "peak_rss_mb": 0.0}}
+    assert compare("scenario", slower, noisy, 0.35) == []
+    # A noisy run widens the allowance as much as a noisy baseline
+    assert compare("scenario", slower, baseline, 0.35, spread={"p95_ms": 0.3, "rps": 0.25}) == []
+
+
+def test_sub_millisecond_changes_stay_under_the_floor():
+    fast = replace(RUN, p95_ms=0.5, rps=8000.0)
+    baseline = {**vars(fast), "spread": {}}
+    assert compare("fast", replace(fast, p95_ms=1.5, rps=4000.0), baseline, 0.35, latency_floor_ms=2.0) == []
+    assert len(compare("fast", replace(fast, p95_ms=3.0), baseline, 0.35, latency_floor_ms=2.0)) == 1
@@ -0,0 +1,127 @@
+import asyncio
+import gzip
+import json
+import zlib
+
+import pytest
+
+import server
+from compression import CompressionMiddleware, accepted_encodings
+from document_cache import DocumentCache
+from rendering import DOCX_MEDIA_TYPE, RenderPool
+
+MIN = 1024
+
+
+def _call(chunks, accept_encoding=None, status=200, content_type="application/json", headers=()):
+    """Send one response through the middleware; returns its start message and body messages"""
+    response_headers = [(b"content-type", content_type.encode()), *headers]
+    if len(chunks) == 1:
+        response_headers.append((b"content-length", str(len(chunks[0])).encode()))
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": status, "headers": response_headers})
+        for index, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": index < len(chunks) - 1})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    request_headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    scope = {"type": "http", "method": "GET", "path": "/api/status", "headers": request_headers}
+    asyncio.run(CompressionMiddleware(app, minimum_size=MIN, encodings=("gzip",))(scope, None, send))
+    start, bodies = sent[0], sent[1:]
+    return start["status"], dict(start["headers"]), bodies
+
+
+def _json(size):
+    return json.dumps([{"id": n, "client_name": "alpha"} for n in range(size)]).encode()
+
+
+def test_accept_encoding_negotiation():
+    middleware = CompressionMiddleware(None, encodings=("gzip",))
+    assert accepted_encodings("gzip;q=0.5, br, identity;q=0") == {"gzip": 0.5, "br": 1.0, "identity": 0.0}
+    assert middleware.choose_encoding("gzip, deflate") == "gzip"
+    assert middleware.choose_encoding("*;q=0.2") == "gzip"
+    assert middleware.choose_encoding("gzip;q=0, *") is None
+    assert middleware.choose_encoding("identity") is None
+    assert middleware.choose_encoding("gzip;q=nonsense") is None
+
+
+def test_brotli_wins_ties_when_installed():
+    pytest.importorskip("brotli")
+    middleware = CompressionMiddleware(None)
+    assert middleware.choose_encoding("gzip, br") == "br"
+    assert middleware.choose_encoding("gzip, br;q=0.5") == "gzip"
+
+
+def test_large_text_is_gzipped_with_a_weak_etag_and_vary():
+    body = _json(200)
+    status, headers, bodies = _call([body], "gzip", headers=[(b"etag", b'"abc"'), (b"vary", b"Origin")])
+    assert status == 200
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"etag"] == b'W/"abc"'
+    assert headers[b"vary"] == b"Origin, Accept-Encoding"
+    assert b"content-length" not in headers
+    assert gzip.decompress(b"".join(message["body"] for message in bodies)) == body
+
+
+@pytest.mark.parametrize("chunks, accept", [
+    ([b'{"small": true}'], "gzip"),
+    ([_json(200)], None),
+    ([_json(200)], "br;q=1, gzip;q=0"),
+])
+def test_small_or_unaccepted_responses_stay_identity_but_vary(chunks, accept):
+    status, headers, bodies = _call(chunks, accept, headers=[(b"etag", b'"abc"')])
+    assert b"content-encoding" not in headers
+    assert headers[b"etag"] == b'"abc"'
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert b"".join(message["body"] for message in bodies) == b"".join(chunks)
+
+
+@pytest.mark.parametrize("status, content_type, extra", [
+    (200, DOCX_MEDIA_TYPE, []),
+    (200, "application/pdf", []),
+    (206, "text/plain", [(b"content-range", b"bytes 0-2047/4096")]),
+    (200, "application/json", [(b"content-encoding", b"br")]),
+    (200, "text/event-stream", []),
+])
+def test_documents_ranges_and_encoded_bodies_pass_through(status, content_type, extra):
+    body = b"x" * 2048
+    got_status, headers, bodies = _call([body], "gzip", status, content_type,
+                                        [(b"etag", b'"abc"'), (b"accept-ranges", b"bytes"), *extra])
+    assert got_status == status
+    assert headers.get(b"content-encoding") == dict(extra).get(b"content-encoding")
+    assert headers[b"content-length"] == b"2048" and headers[b"accept-ranges"] == b"bytes"
+    assert headers[b"etag"] == b'"abc"'
+    assert b"vary" not in headers
+    assert bodies[0]["body"] == body
+
+
+def test_streamed_pages_are_flushed_as_they_arrive():
+    pages = [json.dumps({"page": n, "text": "word " * 400}).encode() + b"\n" for n in range(3)]
+    _, headers, bodies = _call(pages, "gzip", content_type="application/x-ndjson")
+    assert headers[b"content-encoding"] == b"gzip"
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # Every page can be decoded from the bytes sent so far, before the stream ends
+    for page, message in zip(pages, bodies):
+        assert decompressor.decompress(message["body"]) == page
+    assert bodies[-1]["more_body"] is False
+
+
+def test_weak_etags_still_revalidate_documents(monkeypatch):
+    monkeypatch.setattr(server, "document_cache", DocumentCache())
+    pool = RenderPool("thread", workers=1)
+    monkeypatch.setattr(server, "render_pool", pool)
+    monkeypatch.setattr(server, "docx_streaming", False)
+
+    async def scenario():
+        first = await server.export_document("Some text", "txt", None, None)
+        return await server.export_document("Some text", "txt", None, "W/" + first.headers["ETag"])
+
+    try:
+        assert asyncio.run(scenario()).status_code == 304
+    finally:
+        pool.shutdown()
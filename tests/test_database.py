@@ -0,0 +1,96 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+import server
+from database import MongoConfigError, MongoSettings, PoolState, create_client, read_heavy_database
+
+SETTINGS = ("MONGO_MAX_POOL_SIZE", "MONGO_MIN_POOL_SIZE", "MONGO_WAIT_QUEUE_TIMEOUT_MS", "MONGO_COMPRESSORS",
+            "MONGO_READ_PREFERENCE", "MONGO_READ_HEAVY_PREFERENCE", "MONGO_MAX_STALENESS_SECONDS",
+            "MONGO_MAX_CONNECTING", "MONGO_ZLIB_COMPRESSION_LEVEL", "MONGO_SOCKET_TIMEOUT_MS",
+            "MONGO_MAX_IDLE_TIME_MS", "MONGO_CONNECT_TIMEOUT_MS", "MONGO_SERVER_SELECTION_TIMEOUT_MS")
+
+
+@pytest.fixture
+def env(monkeypatch):
+    for name in SETTINGS:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("MONGO_URL", "mongodb://127.0.0.1:1")
+    monkeypatch.setenv("DB_NAME", "probe")
+    return monkeypatch
+
+
+def test_settings_come_from_the_environment(env):
+    env.setenv("MONGO_MAX_POOL_SIZE", "40")
+    env.setenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "250")
+    env.setenv("MONGO_COMPRESSORS", "snappy, zlib")
+    env.setenv("MONGO_READ_PREFERENCE", "primaryPreferred")
+    settings = MongoSettings.from_env()
+    options = settings.client_options()
+    assert options["maxPoolSize"] == 40
+    assert options["waitQueueTimeoutMS"] == 250
+    assert options["compressors"] == "snappy,zlib"
+    assert options["read_preference"].mongos_mode == "primaryPreferred"
+    # Unset options are left to pymongo rather than passed as None
+    assert "socketTimeoutMS" not in options
+    # Read-heavy routes follow the general preference unless told otherwise
+    assert settings.read_heavy_preference == "primaryPreferred"
+
+
+@pytest.mark.parametrize("name, value", [
+    ("MONGO_MAX_POOL_SIZE", "lots"),
+    ("MONGO_COMPRESSORS", "zstd,lz4"),
+    ("MONGO_READ_PREFERENCE", "closest"),
+    ("MONGO_READ_HEAVY_PREFERENCE", "secondaries"),
+])
+def test_invalid_settings_are_refused(env, name, value):
+    env.setenv(name, value)
+    with pytest.raises(MongoConfigError):
+        MongoSettings.from_env()
+
+
+def test_read_heavy_routes_can_use_secondaries(env):
+    env.setenv("MONGO_READ_HEAVY_PREFERENCE", "secondaryPreferred")
+    env.setenv("MONGO_MAX_STALENESS_SECONDS", "120")
+    settings = MongoSettings.from_env()
+    client = create_client(settings)
+    try:
+        assert isinstance(client[settings.db_name].read_preference, Primary)
+        replica = read_heavy_database(client, settings)
+        assert replica.name == "probe"
+        assert isinstance(replica.read_preference, SecondaryPreferred)
+        assert replica.read_preference.max_staleness == 120
+    finally:
+        client.close()
+
+
+def _event(**fields):
+    return SimpleNamespace(address=("db", 27017), **fields)
+
+
+def test_pool_state_tracks_connections_and_peaks(env, monkeypatch):
+    state = PoolState()
+    state.pool_created(_event())
+    state.pool_ready(_event())
+    for _ in range(3):
+        state.connection_created(_event())
+        state.connection_check_out_started(_event())
+    state.connection_checked_out(_event())
+    state.connection_checked_out(_event())
+    state.connection_check_out_failed(_event())
+    state.connection_checked_in(_event())
+    pool = state.stats()["db:27017"]
+    assert pool == {
+        "ready": True, "open": 3, "checked_out": 1, "peak_checked_out": 2, "waiting": 0, "peak_waiting": 3,
+        "checkouts": 2, "checkout_failures": 1,
+    }
+
+    monkeypatch.setattr(server, "mongo_pool_state", state)
+    monkeypatch.setattr(server, "mongo_settings", MongoSettings.from_env())
+    body = asyncio.run(server.get_db_pool_stats())
+    assert body["settings"]["max_pool_size"] == 100
+    assert body["pools"] == {"db:27017": pool}
+    state.pool_closed(_event())
+    assert state.stats() == {}
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from exporters import EXPORTERS
+from layout import parse_layout
+from rendering import ZipStreamWriter, get_template, render_docx
+
+
+@pytest.fixture
+def later(monkeypatch):
+    """Move the clock forward, as if the same request came again minutes later"""
+    def advance(seconds=600):
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + seconds)
+    return advance
+
+
+TEXT = "Quarterly report\n\nThe committee met twice.\n- first item\n- second item"
+
+
+def test_docx_render_is_byte_identical_over_time(later):
+    first = render_docx(TEXT)
+    streamed = b"".join(get_template().stream(TEXT))
+    later()
+    assert render_docx(TEXT) == first
+    assert b"".join(get_template().stream(TEXT)) == streamed
+
+
+@pytest.mark.parametrize("fmt", sorted(EXPORTERS))
+def test_every_export_format_is_byte_identical_over_time(fmt, later):
+    layout = parse_layout([TEXT, TEXT, TEXT])
+    rendered = EXPORTERS[fmt].render(layout)
+    later()
+    assert EXPORTERS[fmt].render(layout) == rendered
+
+
+def test_batch_zip_is_byte_identical_over_time(later):
+    def build():
+        writer = ZipStreamWriter()
+        return b"".join([writer.add("a.docx", b"one"), writer.add("a.docx", b"two"), writer.close()])
+
+    first = build()
+    later()
+    assert build() == first
@@ -0,0 +1,54 @@
+import asyncio
+import io
+import zipfile
+
+import pytest
+
+from artifacts import ArtifactStore
+from layout import parse_layout
+from rendering import RenderPool, stream_docx_progress
+
+
+def test_artifact_writer_publishes_only_on_commit(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    writer = store.open_writer("report.docx", "application/octet-stream", "abc123")
+    writer.write(b"part one, ")
+    assert store.get("abc123") is None
+    writer.write(b"part two")
+    artifact = writer.commit()
+    assert artifact.size == len(b"part one, part two")
+    assert store.get("abc123").path == artifact.path
+    with open(artifact.path, "rb") as f:
+        assert f.read() == b"part one, part two"
+
+
+def test_aborted_artifact_leaves_no_files(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    writer = store.open_writer("report.docx", "application/octet-stream", "abc123")
+    writer.write(b"half a document")
+    writer.abort()
+    assert store.get("abc123") is None
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_progress_stream_reports_paragraphs_from_the_pool(kind):
+    # Varied text so the deflated body spans several chunks
+    words = [format(n * 2654435761 % 4294967296, "x") for n in range(20000)]
+    layout = parse_layout(["\n\n".join(" ".join(words[n:n + 20]) for n in range(0, len(words), 20))])
+
+    async def scenario():
+        pool = RenderPool(kind, workers=1, queue_depth=0)
+        try:
+            chunks, counts = [], []
+            async for chunk, rendered in pool.stream(stream_docx_progress, layout, 4096):
+                chunks.append(chunk)
+                counts.append(rendered)
+            return b"".join(chunks), counts
+        finally:
+            pool.shutdown()
+
+    data, counts = asyncio.run(scenario())
+    assert counts == sorted(counts)
+    assert counts[0] < counts[-2] < counts[-1] == layout.paragraphs
+    assert zipfile.ZipFile(io.BytesIO(data)).testzip() is None
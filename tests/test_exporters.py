@@ -0,0 +1,50 @@
+import re
+import zlib
+
+import pytest
+
+from exporters import UnsupportedExportText, get_exporter, render_export
+from layout import parse_layout, table_cells
+
+TABLE = "Fruit     Qty  Price\nApples    3    1.20\nPears     12   0.80"
+
+
+def test_table_keeps_its_rows_and_splits_into_cells():
+    layout = parse_layout([TABLE], reflow=True)
+    [table] = [block for block in layout.blocks if block.kind == "table"]
+    assert table.text == TABLE
+    assert table_cells(table) == [["Fruit", "Qty", "Price"], ["Apples", "3", "1.20"], ["Pears", "12", "0.80"]]
+
+
+def test_txt_export_does_not_rewrite_table_spacing():
+    layout = parse_layout([TABLE], reflow=True)
+    assert render_export("txt", layout).decode() == TABLE + "\n"
+    assert "| Pears | 12 |" in render_export("md", layout).decode()
+
+
+def test_pdf_accepts_western_european_text():
+    assert render_export("pdf", parse_layout(["Café – naïve façade costs €5"])).startswith(b"%PDF")
+
+
+@pytest.mark.parametrize("text", ["Привет, мир", "東京", "emoji \U0001F600"])
+def test_pdf_rejects_text_it_cannot_write(text):
+    layout = parse_layout([text])
+    with pytest.raises(UnsupportedExportText):
+        get_exporter("pdf").check(layout)
+    with pytest.raises(UnsupportedExportText):
+        render_export("pdf", layout)
+
+
+def _pdf_text_ops(data: bytes):
+    streams = re.findall(rb"/FlateDecode >>\nstream\n(.*?)\nendstream", data, re.S)
+    ops = b"\n".join(zlib.decompress(stream) for stream in streams)
+    return re.findall(rb"BT /(F\d) (\d+) Tf \d+ \d+ Td \((.*?)\) Tj ET", ops)
+
+
+def test_pdf_draws_the_title_as_a_level_one_heading():
+    ops = _pdf_text_ops(render_export("pdf", parse_layout(["# Section\n\nBody text"])))
+    assert ops == [
+        (b"F2", b"18", b"Extracted Text"),
+        (b"F2", b"15", b"Section"),
+        (b"F1", b"11", b"Body text"),
+    ]
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+ALICE = "a" * 32
+BOB = "b" * 32
+
+
+@pytest.mark.parametrize("client_id", [None, "", "short", "x" * 129, "has spaces in it here"])
+def test_extractions_need_a_client_id(client_id):
+    with pytest.raises(HTTPException) as raised:
+        server.extraction_owner(client_id)
+    assert raised.value.status_code == 400
+
+
+def test_extractions_are_scoped_to_their_client(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    monkeypatch.setattr(server, "db", mongomock_motor.AsyncMongoMockClient()["test"])
+    monkeypatch.setattr(server, "replica_db", None)
+
+    async def scenario():
+        saved = await server.create_extraction(server.ExtractionCreate(text="Alice's notes"), owner=ALICE)
+        await server.create_extraction(server.ExtractionCreate(text="Bob's notes"), owner=BOB)
+
+        listed = await server.list_extractions(limit=20, cursor=None, owner=ALICE)
+        assert [item.title for item in listed.items] == ["Alice's notes"]
+        assert (await server.get_extraction(saved.id, owner=ALICE)).text == "Alice's notes"
+        for attempt in (server.get_extraction, server.delete_extraction):
+            with pytest.raises(HTTPException) as raised:
+                await attempt(saved.id, owner=BOB)
+            assert raised.value.status_code == 404
+        await server.delete_extraction(saved.id, owner=ALICE)
+        assert (await server.list_extractions(limit=20, cursor=None, owner=ALICE)).items == []
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("values", [[1], [1, 2], ["not a date", "x"], ["2024-01-01T00:00:00", "x", 3], {"a": 1}])
+def test_malformed_list_cursors_are_rejected(values):
+    cursor = server.encode_cursor(values)
+    for bad in (cursor, "%%%", cursor[:-3]):
+        with pytest.raises(HTTPException) as raised:
+            asyncio.run(server.list_extractions(limit=20, cursor=bad, owner=ALICE))
+        assert raised.value.status_code == 400
+
+
+def test_list_cursor_pages_through_every_extraction(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    monkeypatch.setattr(server, "db", mongomock_motor.AsyncMongoMockClient()["test"])
+    monkeypatch.setattr(server, "replica_db", None)
+
+    async def scenario():
+        for n in range(5):
+            await server.create_extraction(server.ExtractionCreate(text=f"Note {n}"), owner=ALICE)
+        titles, cursor = [], None
+        while True:
+            page = await server.list_extractions(limit=2, cursor=cursor, owner=ALICE)
+            titles += [item.title for item in page.items]
+            if page.next_cursor is None:
+                return titles
+            cursor = page.next_cursor
+
+    assert sorted(asyncio.run(scenario())) == [f"Note {n}" for n in range(5)]
+
+
+def test_search_pages_through_the_clients_hits_best_first(monkeypatch):
+    from benchmarks.fake_mongo import FakeClient
+
+    monkeypatch.setattr(server, "db", FakeClient()["test"])
+    monkeypatch.setattr(server, "replica_db", None)
+
+    async def scenario():
+        await server.create_indexes()
+        await server.create_extraction(server.ExtractionCreate(text="Invoice total\n\ninvoice invoice due"), owner=ALICE)
+        await server.create_extraction(server.ExtractionCreate(text="Another invoice"), owner=ALICE)
+        await server.create_extraction(server.ExtractionCreate(text="Bob's invoice"), owner=BOB)
+        hits, cursor = [], None
+        while True:
+            page = await server.search_extractions(q="invoice", language=None, limit=1, cursor=cursor, owner=ALICE)
+            hits += page.items
+            if page.next_cursor is None:
+                return hits
+            cursor = page.next_cursor
+
+    hits = asyncio.run(scenario())
+    assert [hit.score for hit in hits] == sorted((hit.score for hit in hits), reverse=True)
+    assert {hit.title for hit in hits} == {"Invoice total", "Another invoice"}
+    assert all("invoice" in hit.snippet.lower() for hit in hits)
@@ -0,0 +1,61 @@
+from layout import parse_blocks, table_cells
+
+WRAPPED = (
+    "Annual Summary\n"
+    "\n"
+    "The committee met four times during the year and reviewed the budget, the\n"
+    "staffing plan and the new procure-\n"
+    "ment rules before approving them.\n"
+    "\n"
+    "- First point\n"
+    "  - Nested point\n"
+    "- Second point that wraps onto\n"
+    "  a second line\n"
+)
+
+
+def _kinds(blocks):
+    return [(block.kind, block.text) for block in blocks]
+
+
+def test_wrapped_lines_headings_and_lists():
+    blocks = parse_blocks(WRAPPED, reflow=True)
+    assert _kinds(blocks) == [
+        ("heading", "Annual Summary"),
+        ("paragraph", "The committee met four times during the year and reviewed the budget, the "
+                      "staffing plan and the new procurement rules before approving them."),
+        ("list_item", "First point"),
+        ("list_item", "Nested point"),
+        ("list_item", "Second point that wraps onto a second line"),
+    ]
+    assert [block.level for block in blocks[2:]] == [1, 2, 1]
+
+
+def test_without_reflow_every_line_is_a_block():
+    blocks = parse_blocks("# Title\nfirst line\nsecond line\n", reflow=False)
+    assert _kinds(blocks) == [("heading", "Title"), ("paragraph", "first line"), ("paragraph", "second line")]
+
+
+def test_aligned_columns_make_a_table():
+    text = "Item        Qty    Price\nApples      3       1.20\nPears       12     10.80\n"
+    [table] = parse_blocks(text, reflow=True)
+    assert table.kind == "table" and table.level == 3
+    assert table_cells(table)[2] == ["Pears", "12", "10.80"]
+
+
+def test_tabbed_rows_make_a_table():
+    [table] = parse_blocks("Name\tRole\nAda Lovelace\tAnalyst\n", reflow=True)
+    assert table.kind == "table"
+    assert table_cells(table) == [["Name", "Role"], ["Ada Lovelace", "Analyst"]]
+
+
+def test_stray_double_spaces_are_not_a_table():
+    # OCR often doubles a space; the gaps do not line up, so this is prose
+    text = "We walked along the  river bank\nand then back up the hill  again\n"
+    assert [block.kind for block in parse_blocks(text, reflow=True)] == ["paragraph"]
+
+
+def test_right_aligned_numbers_make_a_table():
+    [table] = parse_blocks("Revenue     1,200\nTax           120\n", reflow=True)
+    assert table.kind == "table"
+    assert table_cells(table) == [["Revenue", "1,200"], ["Tax", "120"]]
@@ -0,0 +1,102 @@
+import asyncio
+from types import SimpleNamespace
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import metrics
+import server
+from metrics import MetricsMiddleware, MongoCommandTimer, observe_docx_phases, registry
+
+
+def _sample(line_prefix: str) -> float:
+    for line in registry.render().splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def _client():
+    app = FastAPI()
+    seen = {}
+
+    @app.get("/probe/{item_id}")
+    async def probe(item_id: str):
+        seen["in_flight"] = _sample('http_requests_in_flight{method="GET"}')
+        return {"item": item_id}
+
+    @app.post("/probe-body")
+    async def probe_body(request: Request):
+        return {"size": len(await request.body())}
+
+    @app.get("/probe-error")
+    async def probe_error():
+        raise RuntimeError("boom")
+
+    app.add_middleware(MetricsMiddleware)
+    return TestClient(app, raise_server_exceptions=False), seen
+
+
+def test_requests_are_labelled_by_route_template():
+    client, seen = _client()
+    route = 'http_requests_total{method="GET",route="/probe/{item_id}",status="200"}'
+    before = _sample(route)
+    for item in ("123", "abc", "123"):
+        assert client.get(f"/probe/{item}").status_code == 200
+    assert _sample(route) == before + 3
+    # Concrete ids never become label values
+    assert 'route="/probe/123"' not in registry.render()
+    assert seen["in_flight"] >= 1
+    assert _sample('http_requests_in_flight{method="GET"}') == 0
+
+    unmatched = 'http_requests_total{method="GET",route="unmatched",status="404"}'
+    before = _sample(unmatched)
+    assert client.get("/nowhere/42").status_code == 404
+    assert _sample(unmatched) == before + 1
+
+    failed = 'http_requests_total{method="GET",route="/probe-error",status="500"}'
+    before = _sample(failed)
+    assert client.get("/probe-error").status_code == 500
+    assert _sample(failed) == before + 1
+
+
+def test_body_sizes_and_latency_are_recorded():
+    client, _ = _client()
+    labels = '{method="POST",route="/probe-body"}'
+    sizes = (_sample("http_request_size_bytes_sum" + labels), _sample("http_response_size_bytes_sum" + labels))
+    count = _sample("http_request_duration_seconds_count" + labels)
+    response = client.post("/probe-body", content=b"x" * 300)
+    assert response.json() == {"size": 300}
+    assert _sample("http_request_size_bytes_sum" + labels) == sizes[0] + 300
+    assert _sample("http_response_size_bytes_sum" + labels) == sizes[1] + len(response.content)
+    assert _sample("http_request_duration_seconds_count" + labels) == count + 1
+    # 300 bytes falls in the 1 KiB bucket, not the 256 byte one
+    assert _sample('http_request_size_bytes_bucket{method="POST",route="/probe-body",le="256"}') < \
+        _sample('http_request_size_bytes_bucket{method="POST",route="/probe-body",le="1024"}')
+
+
+def test_mongo_commands_and_docx_phases_are_timed():
+    timer = MongoCommandTimer()
+    labels = '{command="find",collection="probe_things"}'
+    count = _sample("mongo_command_duration_seconds_count" + labels)
+    failures = _sample("mongo_command_failures_total" + labels)
+    for request_id, outcome in ((1, "succeeded"), (2, "failed")):
+        timer.started(SimpleNamespace(command={"find": "probe_things"}, command_name="find",
+                                      connection_id=("db", 27017), request_id=request_id))
+        getattr(timer, outcome)(SimpleNamespace(command_name="find", connection_id=("db", 27017),
+                                                request_id=request_id, duration_micros=1500))
+    assert _sample("mongo_command_duration_seconds_count" + labels) == count + 2
+    assert _sample("mongo_command_failures_total" + labels) == failures + 1
+
+    phases = '{renderer="probe",phase="save"}'
+    before = _sample("docx_render_phase_seconds_count" + phases)
+    observe_docx_phases("probe", {"build": 0.01, "save": 0.02})
+    assert _sample("docx_render_phase_seconds_count" + phases) == before + 1
+
+
+def test_metrics_endpoint_speaks_prometheus_text():
+    response = asyncio.run(server.get_metrics())
+    assert response.media_type == metrics.PROMETHEUS_CONTENT_TYPE
+    body = response.body.decode()
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert "render_pool_pending_jobs " in body
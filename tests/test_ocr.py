@@ -0,0 +1,54 @@
+import asyncio
+import io
+import shutil
+
+import pytest
+from fastapi import HTTPException
+
+import ocr
+import server
+from rendering import RenderPool
+
+
+def _page() -> bytes:
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (400, 200), "white")
+    ImageDraw.Draw(image).text((20, 80), "Hello OCR", fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = RenderPool("thread", workers=1, queue_depth=4)
+    monkeypatch.setattr(server, "render_pool", pool)
+    yield pool
+    pool.shutdown()
+
+
+def _run(engine):
+    return asyncio.run(server.run_ocr([_page()], engine, 150, True, "otsu"))
+
+
+def test_stub_engine_needs_the_debug_setting(pool, monkeypatch):
+    monkeypatch.setattr(server, "ocr_allow_stub", False)
+    for engine, default in (("stub", "tesseract"), (None, "stub")):
+        monkeypatch.setattr(server, "ocr_engine", default)
+        with pytest.raises(HTTPException) as raised:
+            _run(engine)
+        assert raised.value.status_code == 400
+
+    monkeypatch.setattr(server, "ocr_allow_stub", True)
+    result = _run("stub")
+    assert [page.engine for page in result.pages] == ["stub"]
+
+
+def test_missing_tesseract_is_reported_as_unavailable(pool, monkeypatch):
+    monkeypatch.setattr(ocr, "_recognizers", {})
+    monkeypatch.setattr(shutil, "which", lambda cmd: None)
+    with pytest.raises(HTTPException) as raised:
+        _run("tesseract")
+    assert raised.value.status_code == 503
+    assert "not installed" in raised.value.detail
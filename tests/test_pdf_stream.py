@@ -0,0 +1,41 @@
+import asyncio
+import json
+
+import server
+from exporters import render_export
+from layout import parse_layout
+from pdf_extract import count_pdf_pages, extract_pdf_pages
+from rendering import RenderPool
+
+
+def _fake_extract(path, start, stop):
+    if start == 2:
+        raise RuntimeError("worker died")
+    return [{"text": f"page {index + 1}"} for index in range(start, stop)]
+
+
+def _collect(page_count):
+    async def scenario():
+        return [json.loads(line) for chunk in [c async for c in server.stream_pdf_pages("doc.pdf", page_count)]
+                for line in chunk.splitlines()]
+    return asyncio.run(scenario())
+
+
+def test_failed_pages_get_error_lines_and_the_stream_finishes(monkeypatch):
+    monkeypatch.setattr(server, "render_pool", RenderPool("thread", workers=1, queue_depth=8))
+    monkeypatch.setattr(server, "pdf_pages_per_job", 2)
+    monkeypatch.setattr(server, "extract_pdf_pages", _fake_extract)
+    lines = _collect(6)
+    assert [line.get("page") for line in lines[:-1]] == [1, 2, 3, 4, 5, 6]
+    assert lines[2] == {"page": 3, "error": "worker died"}
+    assert lines[3] == {"page": 4, "error": "worker died"}
+    assert lines[4] == {"page": 5, "text": "page 5"}
+    assert lines[-1] == {"done": True, "pages": 6, "failed": 2}
+
+
+def test_extract_pdf_pages_returns_text_per_page(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(render_export("pdf", parse_layout(["Hello pages"])))
+    assert count_pdf_pages(str(path)) == 1
+    [page] = extract_pdf_pages(str(path), 0, 1)
+    assert "Hello pages" in page["text"]
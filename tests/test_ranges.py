@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+import server
+from document_cache import DocumentCache
+from rendering import RenderPool
+
+TEXT = "Quarterly report\n\n" + "\n\n".join(f"Paragraph {n} of the body text." for n in range(200))
+
+
+@pytest.fixture(params=[True, False], ids=["streamed", "buffered"])
+def app_state(request, monkeypatch):
+    monkeypatch.setattr(server, "docx_streaming", request.param)
+    monkeypatch.setattr(server, "document_cache", DocumentCache())
+    pool = RenderPool("thread", workers=2, queue_depth=4)
+    monkeypatch.setattr(server, "render_pool", pool)
+    yield
+    pool.shutdown()
+
+
+def _export(fmt, range_header=None, if_range=None):
+    async def scenario():
+        response = await server.export_document(TEXT, fmt, None, None, range_header, if_range)
+        if hasattr(response, "body_iterator"):
+            body = b"".join([chunk async for chunk in response.body_iterator])
+        else:
+            body = response.body
+        return response, body
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("fmt", ["docx", "pdf"])
+def test_range_on_a_cache_miss_gets_the_whole_file(app_state, fmt):
+    response, body = _export(fmt, "bytes=100-199")
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "MISS"
+    assert "Content-Range" not in response.headers
+    assert len(body) > 200
+
+
+@pytest.mark.parametrize("fmt", ["docx", "pdf"])
+def test_resume_is_sliced_from_the_cached_bytes(app_state, fmt):
+    first, full = _export(fmt)
+    etag = first.headers["ETag"]
+    resumed, part = _export(fmt, "bytes=100-", etag)
+    assert resumed.status_code == 206
+    assert resumed.headers["X-Cache"] == "HIT"
+    assert resumed.headers["Content-Range"] == f"bytes 100-{len(full) - 1}/{len(full)}"
+    assert part == full[100:]
+
+
+def test_stale_if_range_gets_the_whole_file(app_state):
+    _, full = _export("docx")
+    response, body = _export("docx", "bytes=100-", '"stale"')
+    assert response.status_code == 200
+    assert body == full
+
+
+@pytest.mark.parametrize("filename, header", [
+    ("文档.docx", "attachment; filename*=utf-8''%E6%96%87%E6%A1%A3.docx"),
+    ('a"b;c.docx', "attachment; filename*=utf-8''a%22b%3Bc.docx"),
+    ("report.docx", 'attachment; filename="report.docx"'),
+])
+def test_download_names_are_encoded(app_state, filename, header):
+    async def scenario():
+        export = await server.export_document(TEXT, "docx", filename, None)
+        merged = await server.generate_docx_batch(server.BatchDocxRequest(
+            items=[server.TextToDocxRequest(text=TEXT)], merge=True, filename=filename))
+        zipped = await server.generate_docx_batch(server.BatchDocxRequest(
+            items=[server.TextToDocxRequest(text=TEXT)], filename=filename))
+        return export, merged, zipped
+
+    for response in asyncio.run(scenario()):
+        assert response.headers["Content-Disposition"] == header
+    assert server.render_pool.stats()["pending"] == 0
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import server
+from benchmarks.fake_mongo import FakeClient
+from database import MongoConfigError
+from rendering import RenderPool
+
+BACKEND = Path(__file__).resolve().parent.parent / "backend"
+
+
+def test_importing_the_app_leaves_heavy_modules_unloaded():
+    heavy = ("docx", "lxml", "motor", "PyPDF2", "numpy", "PIL")
+    env = {key: value for key, value in os.environ.items() if key not in ("MONGO_URL", "DB_NAME")}
+    loaded = subprocess.run(
+        [sys.executable, "-c", f"import sys, server; print(*[m for m in {heavy!r} if m in sys.modules])"],
+        cwd=BACKEND, env=env, capture_output=True, text=True, check=True,
+    ).stdout.split()
+    assert loaded == []
+
+
+class HangingDatabase:
+    async def command(self, name):
+        await asyncio.sleep(10)
+
+
+@pytest.fixture
+def started_pool(monkeypatch):
+    pool = RenderPool("thread", workers=1)
+    pool.start()
+    monkeypatch.setattr(server, "render_pool", pool)
+    yield pool
+    pool.shutdown()
+
+
+def _readiness():
+    response = asyncio.run(server.get_readiness())
+    return response.status_code, json.loads(response.body)
+
+
+def test_ready_once_mongo_answers_and_the_pool_is_up(monkeypatch, started_pool):
+    monkeypatch.setattr(server, "client", None)
+    monkeypatch.setattr(server, "db", FakeClient()["test"])
+    status, body = _readiness()
+    assert status == 200
+    assert body["checks"] == {"render_pool": True, "mongo": True}
+    assert body["render_pool"]["workers"] == 1
+
+
+def test_not_ready_without_mongo_or_the_pool(monkeypatch, started_pool):
+    monkeypatch.setattr(server, "db", None)
+    status, body = _readiness()
+    assert status == 503
+    assert body["mongo"]["error"] == "not connected"
+
+    monkeypatch.setattr(server, "db", HangingDatabase())
+    monkeypatch.setattr(server, "ready_ping_timeout", 0.05)
+    status, body = _readiness()
+    assert status == 503 and body["checks"]["mongo"] is False
+    assert body["mongo"]["error"] == "TimeoutError"
+
+    monkeypatch.setattr(server, "db", FakeClient()["test"])
+    monkeypatch.setattr(server, "render_pool", RenderPool("thread", workers=1))
+    status, body = _readiness()
+    assert status == 503 and body["checks"] == {"render_pool": False, "mongo": True}
+
+
+def test_mongo_client_is_built_on_startup_from_settings(monkeypatch):
+    monkeypatch.setattr(server, "client", None)
+    monkeypatch.setattr(server, "db", None)
+    monkeypatch.setattr(server, "replica_db", None)
+    monkeypatch.setattr(server, "mongo_settings", None)
+    monkeypatch.delenv("MONGO_URL", raising=False)
+    with pytest.raises(MongoConfigError):
+        asyncio.run(server.connect_to_mongo())
+
+    monkeypatch.setenv("MONGO_URL", "mongodb://127.0.0.1:1")
+    monkeypatch.setenv("DB_NAME", "probe")
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "7")
+    monkeypatch.setenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "50")
+    monkeypatch.setenv("MONGO_COMPRESSORS", "")
+
+    async def startup():
+        # Connecting happens in the background, so an unreachable server does not block startup
+        await asyncio.wait_for(server.connect_to_mongo(), timeout=5)
+        return server.client
+
+    client = asyncio.run(startup())
+    try:
+        assert server.db.name == "probe"
+        assert client.options.pool_options.max_pool_size == 7
+    finally:
+        client.close()
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from rendering import RenderPool, RenderPoolSaturated, stream_docx_pages
+
+
+def _slow_chunks(gate: threading.Event, produced: list):
+    for index in range(5):
+        produced.append(index)
+        if index == 1:
+            # Hold the worker inside next() so the stream is closed mid-chunk
+            gate.wait(5)
+        yield b"x" * 10
+
+
+def test_closing_a_thread_stream_mid_chunk_waits_for_the_worker():
+    async def scenario():
+        pool = RenderPool("thread", workers=1, queue_depth=0)
+        gate = threading.Event()
+        produced = []
+        stream = pool.stream(_slow_chunks, gate, produced)
+        assert await stream.__anext__() == b"x" * 10
+        assert pool.stats()["pending"] == 1
+        pending_next = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.05)
+        pending_next.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await pending_next
+        # The worker is still inside the generator, so the slot stays taken
+        assert pool.stats()["pending"] == 1
+        with pytest.raises(RenderPoolSaturated):
+            pool.stream(_slow_chunks, gate, produced)
+        gate.set()
+        for _ in range(100):
+            if pool.stats()["pending"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert pool.stats()["pending"] == 0
+        # Closed after the in-flight chunk, not run to the end
+        assert produced == [0, 1]
+        pool.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_stream_takes_its_slot_once_iterated():
+    pool = RenderPool("thread", workers=1, queue_depth=0)
+    # Streams dropped before they are iterated hold nothing
+    for _ in range(3):
+        pool.stream(stream_docx_pages, ["a"])
+    assert pool.stats()["pending"] == 0
+
+    async def scenario():
+        stream = pool.stream(stream_docx_pages, ["a" * 200000], 1024)
+        await stream.__anext__()
+        assert pool.stats()["pending"] == 1
+        with pytest.raises(RenderPoolSaturated):
+            pool.stream(stream_docx_pages, ["b"])
+        await stream.aclose()
+        for _ in range(100):
+            if pool.stats()["pending"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        return b"".join([chunk async for chunk in pool.stream(stream_docx_pages, ["b"])])
+
+    assert asyncio.run(scenario())
+    assert pool.stats()["pending"] == 0
+    pool.shutdown()
+
+
+def test_process_pool_streams_from_worker_processes():
+    pages = ["first page\nwith two lines", "second page"]
+
+    async def scenario():
+        pool = RenderPool("process", workers=2, queue_depth=2)
+        try:
+            data = b"".join([chunk async for chunk in pool.stream(stream_docx_pages, pages)])
+            # Stopping early frees the slot once the producer has exited
+            stream = pool.stream(stream_docx_pages, pages * 50, 1024)
+            await stream.__anext__()
+            await stream.aclose()
+            for _ in range(200):
+                if pool.stats()["pending"] == 0:
+                    break
+                await asyncio.sleep(0.02)
+            return data, pool.stats()
+        finally:
+            pool.shutdown()
+
+    async def in_threads():
+        pool = RenderPool("thread", workers=1)
+        try:
+            return b"".join([chunk async for chunk in pool.stream(stream_docx_pages, pages)])
+        finally:
+            pool.shutdown()
+
+    started = time.perf_counter()
+    data, stats = asyncio.run(scenario())
+    assert data == asyncio.run(in_threads())
+    assert stats["pending"] == 0
+    assert stats["completed"] == 1
+    assert time.perf_counter() - started < 30
+
+
+def test_failed_streamed_exports_give_their_slots_back(monkeypatch):
+    import server
+    from document_cache import DocumentCache
+    from fastapi import HTTPException
+
+    pool = RenderPool("thread", workers=1, queue_depth=2)
+    cache = DocumentCache()
+    monkeypatch.setattr(server, "render_pool", pool)
+    monkeypatch.setattr(server, "docx_streaming", True)
+    monkeypatch.setattr(server, "document_cache", cache)
+
+    def broken_tee(key, chunks):
+        raise RuntimeError("response could not be built")
+
+    async def scenario():
+        with monkeypatch.context() as patch:
+            patch.setattr(cache, "tee", broken_tee)
+            for n in range(pool.capacity + 1):
+                with pytest.raises(HTTPException) as failed:
+                    await server.export_document(f"text {n}", "docx", None, None)
+                assert failed.value.status_code == 500
+        assert pool.stats()["pending"] == 0
+        # Responses whose client left before the body was read hold nothing either
+        for n in range(pool.capacity + 1):
+            await server.export_document(f"dropped {n}", "docx", None, None)
+        assert pool.stats()["pending"] == 0
+        response = await server.export_document("after", "docx", None, None)
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    try:
+        assert asyncio.run(scenario()).startswith(b"PK")
+        assert pool.stats()["pending"] == 0
+    finally:
+        pool.shutdown()
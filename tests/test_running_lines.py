@@ -0,0 +1,62 @@
+import io
+import zipfile
+
+import docx
+
+from layout import find_running_lines, parse_layout
+from rendering import get_template
+
+
+def _pages(footers, header="Acme Corp Annual Report"):
+    return [f"{header}\nBody text of page {n + 1} goes here.\n{footer}" for n, footer in enumerate(footers)]
+
+
+def test_page_numbers_become_a_field():
+    layout = parse_layout(_pages([f"Page {n} of 5" for n in range(1, 6)]), reflow=False)
+    running = find_running_lines(layout.blocks)
+    assert running.header == ("Acme Corp Annual Report",)
+    assert running.footer == ("Page ", None, " of 5")
+    assert running.first_page == 1
+    assert len(running.skip) == 10
+
+    data = get_template().render_layout(layout)
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None
+    assert b' PAGE ' in archive.read("word/footer1.xml")
+    assert b"pgNumType" not in archive.read("word/document.xml")
+    body = [paragraph.text for paragraph in docx.Document(io.BytesIO(data)).paragraphs]
+    assert not any(text.startswith("Page ") for text in body)
+    assert "Body text of page 3 goes here." in body
+
+
+def test_page_numbers_with_an_offset_restart_numbering():
+    layout = parse_layout(_pages([f"- {n} -" for n in range(12, 17)]), reflow=False)
+    running = find_running_lines(layout.blocks)
+    assert running.footer == ("- ", None, " -")
+    assert running.first_page == 12
+    document = zipfile.ZipFile(io.BytesIO(get_template().render_layout(layout))).read("word/document.xml")
+    assert b'<w:pgNumType w:start="12"/><w:cols' in document
+
+
+def test_varying_numbers_that_are_not_page_numbers_stay_in_the_body():
+    footers = [f"Invoice {number}" for number in (1042, 1043, 1050, 1077, 1078)]
+    layout = parse_layout(_pages(footers), reflow=False)
+    running = find_running_lines(layout.blocks)
+    assert running.footer == ()
+    assert running.header == ("Acme Corp Annual Report",)
+    assert not any(layout.blocks[index].text.startswith("Invoice") for index in running.skip)
+    body = [paragraph.text for paragraph in docx.Document(io.BytesIO(get_template().render_layout(layout))).paragraphs]
+    assert [text for text in body if text.startswith("Invoice")] == footers
+
+
+def test_a_line_with_two_varying_numbers_is_not_running():
+    footers = [f"Page {n} printed at {10 + n}:00" for n in range(1, 6)]
+    running = find_running_lines(parse_layout(_pages(footers), reflow=False).blocks)
+    assert running.footer == ()
+
+
+def test_constant_numbers_are_kept_as_text():
+    layout = parse_layout(_pages([f"Page {n}" for n in range(1, 6)], header="Report 2024 draft 2"), reflow=False)
+    running = find_running_lines(layout.blocks)
+    assert running.header == ("Report 2024 draft 2",)
+    assert running.footer == ("Page ", None)
@@ -0,0 +1,107 @@
+import io
+import zipfile
+
+import docx
+import pytest
+
+from rendering import get_template
+from sessions import SEGMENT_BLOCKS, EditOp, SessionError, SessionStore
+
+
+def _paragraphs(count, prefix="Paragraph"):
+    return [f"{prefix} {n} of the session document." for n in range(count)]
+
+
+def _open(data: bytes):
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None
+    return [paragraph.text for paragraph in docx.Document(io.BytesIO(data)).paragraphs]
+
+
+@pytest.fixture
+def session():
+    return SessionStore().create("\n\n".join(_paragraphs(5 * SEGMENT_BLOCKS)), title="Minutes")
+
+
+def test_edits_across_segment_boundaries_render_a_valid_document(session):
+    expected = _paragraphs(5 * SEGMENT_BLOCKS)
+    template = get_template()
+    assert _open(session.render(template)) == ["Minutes"] + expected
+
+    edits = [
+        # Replace a run that straddles the first boundary with fewer blocks
+        EditOp("replace", SEGMENT_BLOCKS - 3, 6, "Merged one.\n\nMerged two."),
+        # Delete across the next boundary, then insert right on it
+        EditOp("delete", 2 * SEGMENT_BLOCKS - 10, 20),
+        EditOp("insert", 2 * SEGMENT_BLOCKS, text="\n\n".join(_paragraphs(3 * SEGMENT_BLOCKS, "Inserted"))),
+        EditOp("insert", 0, text="Opening line."),
+    ]
+    for op in edits:
+        blocks = [] if op.op == "delete" else op.text.split("\n\n")
+        removed = 0 if op.op == "insert" else op.count
+        expected[op.index:op.index + removed] = blocks
+    version = session.apply(edits, base_version=1)
+    assert version == 2
+
+    data = session.render(template)
+    assert _open(data) == ["Minutes"] + expected
+    assert len(session) == len(expected)
+    # Unedited versions are served from the stored package
+    assert session.render(template) is data
+
+
+def test_small_edit_recompresses_only_its_segment(session):
+    template = get_template()
+    session.render(template)
+    session.apply([EditOp("replace", 3 * SEGMENT_BLOCKS + 1, 1, "Changed paragraph.")])
+    data = session.render(template)
+    assert session.last_recompressed == 1
+    assert _open(data)[3 * SEGMENT_BLOCKS + 2] == "Changed paragraph."
+
+
+def test_edit_batches_are_all_or_nothing(session):
+    with pytest.raises(SessionError) as raised:
+        session.apply([EditOp("delete", 0, 5), EditOp("delete", len(session), 1)])
+    assert raised.value.status_code == 422
+    assert len(session) == 5 * SEGMENT_BLOCKS and session.version == 1
+    with pytest.raises(SessionError) as raised:
+        session.apply([EditOp("delete", 0)], base_version=7)
+    assert raised.value.status_code == 409
+
+
+def test_edits_cannot_grow_a_session_past_the_text_limit():
+    session = SessionStore(max_chars=1000).create("\n\n".join(_paragraphs(10)))
+    chars = session.chars
+    paragraph = "x" * (1000 - chars)
+    with pytest.raises(SessionError) as raised:
+        session.apply([EditOp("insert", 0, text=paragraph + "y")])
+    assert raised.value.status_code == 413
+    assert session.chars == chars and session.version == 1
+    # Room made by an earlier edit in the same batch counts
+    removed = len(_paragraphs(1)[0])
+    session.apply([EditOp("delete", 0), EditOp("insert", 0, text=paragraph + "y" * removed)])
+    assert session.chars == 1000
+    # Repeated small inserts stop at the limit too
+    with pytest.raises(SessionError) as raised:
+        session.apply([EditOp("insert", 0, text="z")])
+    assert raised.value.status_code == 413
+
+
+def test_store_drops_least_recently_used_sessions_over_its_byte_budget():
+    text = "\n\n".join(_paragraphs(200))
+    store = SessionStore(max_bytes=10 ** 9)
+    first, second, third = (store.create(text) for _ in range(3))
+    store.max_bytes = 2 * first.nbytes + first.nbytes // 2
+    assert store.fit() == 1
+    with pytest.raises(SessionError):
+        store.get(first.id)
+    # Using a session makes it the most recent, and a render grows what it holds
+    store.get(second.id)
+    second.render(get_template())
+    assert second.nbytes > third.nbytes
+    assert store.fit() == 1
+    assert store.get(second.id) is second
+    with pytest.raises(SessionError):
+        store.get(third.id)
+    assert store.stats()["evicted"] == 2
+    assert store.stats()["bytes"] == second.nbytes
@@ -0,0 +1,83 @@
+import asyncio
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from benchmarks.fake_mongo import FakeClient
+
+START = datetime(2024, 3, 1, 12, 0)
+
+
+@pytest.fixture
+def status_db(monkeypatch):
+    db = FakeClient()["test"]
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "replica_db", None)
+    docs = [
+        {"id": f"id-{n:02d}", "client_name": "alpha" if n % 2 else "beta", "timestamp": START + timedelta(minutes=n)}
+        for n in range(10)
+    ]
+    # Two checks share a timestamp, so the id has to break the tie
+    docs.append({"id": "id-tie", "client_name": "alpha", "timestamp": START + timedelta(minutes=4)})
+    asyncio.run(db.status_checks.insert_many(docs))
+    return docs
+
+
+def _page(**params):
+    params = {"limit": 100, "cursor": None, "client_name": None, "since": None, "until": None, "fields": None,
+              **params}
+
+    async def scenario():
+        response = await server.get_status_checks(**params)
+        assert response.media_type == "application/json"
+        return json.loads("".join([chunk async for chunk in response.body_iterator]))
+
+    return asyncio.run(scenario())
+
+
+def _all_pages(limit, **params):
+    items, cursor = [], None
+    while True:
+        page = _page(limit=limit, cursor=cursor, **params)
+        items += page["items"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return items
+
+
+def test_pages_cover_every_check_once_in_order(status_db):
+    expected = sorted(status_db, key=lambda doc: (doc["timestamp"], doc["id"]))
+    for limit in (1, 3, 4, 11, 100):
+        assert [item["id"] for item in _all_pages(limit)] == [doc["id"] for doc in expected]
+    # A full last page still hands out a cursor, and the page after it is empty
+    page = _page(limit=11)
+    assert page["next_cursor"] is not None
+    assert _page(limit=11, cursor=page["next_cursor"]) == {"items": [], "next_cursor": None}
+
+
+def test_filters_and_projection(status_db):
+    items = _all_pages(2, client_name="beta", since=START + timedelta(minutes=2),
+                       until=START + timedelta(minutes=8), fields="client_name")
+    assert items == [{"client_name": "beta"} for _ in range(3)]
+    full = _page(limit=1)["items"][0]
+    assert full == {"id": "id-00", "client_name": "beta", "timestamp": START.isoformat()}
+    with pytest.raises(HTTPException) as raised:
+        _page(fields="id,secret")
+    assert raised.value.status_code == 400
+
+
+@pytest.mark.parametrize("cursor", [
+    "%%%",
+    base64.urlsafe_b64encode(b"not json").decode(),
+    base64.urlsafe_b64encode(b"[1]").decode(),
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),
+    base64.urlsafe_b64encode(b'["yesterday", "id-01"]').decode(),
+])
+def test_malformed_cursors_are_rejected(status_db, cursor):
+    with pytest.raises(HTTPException) as raised:
+        _page(cursor=cursor)
+    assert raised.value.status_code == 400
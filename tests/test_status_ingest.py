@@ -0,0 +1,31 @@
+import asyncio
+
+from status_ingest import StatusWriteBuffer
+
+
+class SlowCollection:
+    def __init__(self):
+        self.written = []
+        self.started = asyncio.Event()
+
+    async def insert_many(self, docs, ordered=True):
+        self.started.set()
+        await asyncio.sleep(0.05)
+        self.written.extend(docs)
+
+
+def test_stop_waits_for_the_batch_being_written():
+    async def scenario():
+        collection = SlowCollection()
+        buffer = StatusWriteBuffer(lambda: collection, max_batch=2, max_delay_ms=1)
+        buffer.start()
+        in_flight = buffer.submit([{"n": 0}, {"n": 1}])
+        await collection.started.wait()
+        # Queued behind the batch that is already being written
+        queued = buffer.submit([{"n": 2}])
+        await buffer.stop()
+        assert in_flight.done() and in_flight.exception() is None
+        assert queued.done() and queued.exception() is None
+        return collection.written
+
+    assert asyncio.run(scenario()) == [{"n": 0}, {"n": 1}, {"n": 2}]
@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+from benchmarks.fake_mongo import FakeClient
+
+START = datetime(2024, 3, 1, 22, 50)
+# (client, minutes after START) for each check; spans an hour and a day boundary
+CHECKS = [("alpha", 0), ("alpha", 0.5), ("beta", 1), ("alpha", 9), ("alpha", 10), ("beta", 75), ("alpha", 130)]
+
+
+@pytest.fixture
+def stats_db(monkeypatch):
+    db = FakeClient()["test"]
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "replica_db", None)
+
+    async def record():
+        for client_name, minutes in CHECKS:
+            check = server.StatusCheck(client_name=client_name, timestamp=START + timedelta(minutes=minutes))
+            await server.store_status_checks([check], "acknowledged")
+
+    asyncio.run(record())
+    return db
+
+
+def _stats(granularity, source, client_name=None):
+    stats = asyncio.run(server.get_status_stats(
+        granularity=granularity, since=START - timedelta(days=1), until=START + timedelta(days=1),
+        client_name=client_name, source=source,
+    ))
+    return [(bucket.bucket, bucket.client_name, bucket.count) for bucket in stats.buckets]
+
+
+def test_rollups_hold_one_counter_per_client_minute(stats_db):
+    rollups = asyncio.run(stats_db.status_rollups.find({}, {"_id": 0}).to_list())
+    counts = {(doc["client_name"], doc["minute"]): doc["count"] for doc in rollups}
+    assert counts[("alpha", START)] == 2
+    assert sum(counts.values()) == len(CHECKS)
+    assert len(counts) == len(CHECKS) - 1
+
+
+@pytest.mark.parametrize("granularity, expected", [
+    ("hour", [
+        (datetime(2024, 3, 1, 22), "alpha", 3),
+        (datetime(2024, 3, 1, 22), "beta", 1),
+        (datetime(2024, 3, 1, 23), "alpha", 1),
+        (datetime(2024, 3, 2, 0), "beta", 1),
+        (datetime(2024, 3, 2, 1), "alpha", 1),
+    ]),
+    ("day", [
+        (datetime(2024, 3, 1), "alpha", 4),
+        (datetime(2024, 3, 1), "beta", 1),
+        (datetime(2024, 3, 2), "alpha", 1),
+        (datetime(2024, 3, 2), "beta", 1),
+    ]),
+])
+def test_rollups_and_raw_scan_agree(stats_db, granularity, expected):
+    assert _stats(granularity, "rollup") == expected
+    assert _stats(granularity, "raw") == expected
+
+
+def test_stats_filter_by_client_and_window(stats_db):
+    assert _stats("day", "rollup", "beta") == [(datetime(2024, 3, 1), "beta", 1), (datetime(2024, 3, 2), "beta", 1)]
+    minutes = asyncio.run(server.get_status_stats(
+        granularity="minute", since=START, until=START + timedelta(minutes=10), client_name=None, source="rollup",
+    ))
+    assert [(bucket.client_name, bucket.count) for bucket in minutes.buckets] == [
+        ("alpha", 2), ("beta", 1), ("alpha", 1),
+    ]
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from uploads import UploadStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = UploadStore(str(tmp_path))
+    monkeypatch.setattr(server, "upload_store", store)
+    return store
+
+
+def _upload(store, data: bytes, filename: str = "notes.txt"):
+    upload = store.create(filename, len(data), "text/plain")
+    writer = store.open_chunk(upload, 0)
+    writer.write(data)
+    writer.commit(None)
+    return upload
+
+
+@pytest.mark.parametrize("text", ["x" * 11, "x" * 41])
+def test_text_over_the_limit_is_rejected_and_kept(store, monkeypatch, text):
+    monkeypatch.setattr(server, "docx_max_text_chars", 10)
+    upload = _upload(store, text.encode())
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(server.complete_upload(upload.id, server.UploadComplete(action="docx")))
+    assert raised.value.status_code == 413
+    assert store.get(upload.id) is not None
+
+
+def test_multibyte_text_within_the_limit_passes_the_size_check(store, monkeypatch):
+    monkeypatch.setattr(server, "docx_max_text_chars", 10)
+    rendered = []
+
+    async def fake_store(text, filename):
+        rendered.append((text, filename))
+        return "artifact"
+
+    monkeypatch.setattr(server, "store_docx_artifact", fake_store)
+    # Ten characters but thirty bytes
+    upload = _upload(store, ("€" * 10).encode())
+    result = asyncio.run(server.complete_upload(upload.id, server.UploadComplete(action="docx")))
+    assert result == "artifact"
+    assert rendered == [("€" * 10, "notes.docx")]
+    # Consumed on success
+    assert store.get(upload.id) is None
+
+
+def test_unreadable_pdf_upload_is_kept(store, monkeypatch):
+    monkeypatch.setattr(server, "render_pool", server.RenderPool("thread", workers=1, queue_depth=1))
+    upload = _upload(store, b"not a pdf", "scan.pdf")
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(server.complete_upload(upload.id, server.UploadComplete(action="extract-pdf")))
+    assert raised.value.status_code == 400
+    assert store.get(upload.id) is not None